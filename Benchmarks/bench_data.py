@@ -0,0 +1,286 @@
+"""
+Бенчмарк базы данных погоды: загрузка, запросы, текстовый отчет, сохранение,
+заполнение таблицы и построение диаграмм.
+
+Если база не указана, создается синтетическая (Library.synthetic.generate)
+заданного размера: станции x годы. Все сценарии выполняются без графического
+интерфейса (диаграммы - на холсте Agg), результаты выводятся и записываются
+в JSON вместе с ревизией git и версиями библиотек, чтобы результаты разных
+версий можно было сравнить (ключ --baseline).
+
+Запуск из корня репозитория: python -m Benchmarks.bench_data --stations 50 --years 20 --output results.json
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from Library.analytics import format_report
+from Library.charts import ChartRenderer, build_chart
+from Library.data import Data
+from Library.longtable import LongTable
+from Library.synthetic import generate
+from Library.tableformat import format_rows
+
+
+def measure(run, repeat, setup=None):
+    """
+    Измеряет время выполнения функции
+
+    :param run: функция без аргументов
+    :param repeat: количество повторов
+    :param setup: функция, вызываемая перед каждым повтором и не входящая в измерение
+    :return: словарь {'best': лучшее время, 'mean': среднее время} в секундах
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return {'best': min(times), 'mean': sum(times) / len(times)}
+
+
+def filter_shapes(data):
+    """
+    Строит фильтры каждого вида по данным базы
+
+    :param data: экземпляр Data
+    :return: список пар (название, фильтры)
+    """
+    cities = data.getcities()
+    mindate, maxdate = data.getdate()
+    city = cities[0]
+    year = str(mindate.year + (maxdate.year - mindate.year) // 2)
+    start = dt.date(int(year), 3, 1)
+    end = dt.date(int(year) + 1, 2, 28)
+    return [
+        ('all', ['Все', 'Все', 'Все', 'Все']),
+        ('city', [city, 'Все', 'Все', 'Все']),
+        ('city_year', [city, 'Все', 'Все', year]),
+        ('city_month', [city, 'Все', '6', year]),
+        ('city_day', [city, '15', '6', year]),
+        ('cities_day', ['Все', '15', '6', year]),
+        ('cities_month', ['Все', 'Все', '6', year]),
+        ('cities_month_every_year', ['Все', 'Все', '6', 'Все']),
+        ('cities_day_every_year', ['Все', '15', '6', 'Все']),
+        ('range', ['Все', 'Все', 'Все', 'Все', start, end]),
+        ('city_set_range', [cities[:max(1, len(cities) // 2)], 'Все', 'Все', 'Все', start, end]),
+    ]
+
+
+CHART_SHAPES = ['cities_day', 'city_month', 'city_year', 'city', 'cities_month']
+
+
+def fill_table(data, filters, height=15, buffer=100):
+    """
+    Повторяет работу VirtualTable.set_frame и сортировки без Tk: строит таблицу,
+    форматирует первое окно, сортирует по столбцу и форматирует окно снова
+
+    :return: количество рядов таблицы
+    """
+    table = data.get_table(filters)
+    cities = np.asarray(table.index.get_level_values(0).astype(str), dtype=object)
+    dates = table.index.get_level_values(1)
+    values = [table[column].to_numpy() for column in table.columns]
+    window = np.arange(min(len(table), height + buffer))
+    format_rows(cities, dates, values, window)
+    order = np.argsort(values[0], kind='stable')
+    format_rows(cities, dates, values, order[window])
+    return len(table)
+
+
+def draw_chart(data, filters, column='tempMax'):
+    """
+    Запрашивает данные, подготавливает и рисует диаграмму на холсте Agg
+    (если данных для диаграммы недостаточно, измеряется только подготовка)
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    try:
+        chart = build_chart(data, data.get_data(filters), filters, column)
+    except IndexError:
+        return
+    fig = Figure()
+    canvas = FigureCanvasAgg(fig)
+    ChartRenderer(fig).render(chart)
+    canvas.draw()
+
+
+def revision():
+    """
+    Возвращает ревизию git рабочего каталога или None, если git недоступен
+    """
+    try:
+        result = subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def run_scenarios(route, repeat, on_result=None):
+    """
+    Выполняет все сценарии на базе данных
+
+    :param route: путь основного файла базы данных (база не изменяется: сохранение проверяется на копии)
+    :param repeat: количество повторов каждого сценария
+    :param on_result: функция, получающая название сценария и его результат
+    :return: словарь {сценарий: результат}
+    """
+    results = {}
+
+    def record(name, result):
+        results[name] = result
+        if on_result is not None:
+            on_result(name, result)
+
+    record('load', measure(lambda: Data(route), repeat))
+    record('load_serial', measure(lambda: Data(route, workers=1), repeat))
+    record('load_lazy', measure(lambda: Data(route, lazy=True), repeat))
+    data = Data(route, cache_size=0)
+    record('load_data', measure(lambda: data.load_data(route), repeat))
+    shapes = filter_shapes(data)
+    consolidated = Data(route, consolidated=True, cache_size=0)
+    record('long_table', measure(lambda: LongTable(consolidated.dictdf), repeat))
+    for mode, pointer in (('', data), ('_consolidated', consolidated)):
+        for name, filters in shapes:
+            record('get_data_' + name + mode, measure(lambda: pointer.get_data(filters), repeat))
+    for name, filters in shapes:
+        record('analytics_' + name, measure(lambda: format_report(data.extremes(filters)), repeat))
+    for name in ('all', 'city_year', 'cities_month'):
+        filters = dict(shapes)[name]
+        record('table_fill_' + name, measure(lambda: fill_table(data, filters), repeat))
+
+    def cold():
+        data.rollups = {}
+
+    for name in CHART_SHAPES:
+        filters = dict(shapes)[name]
+        record('chart_' + name, measure(lambda: draw_chart(data, filters), repeat, setup=cold))
+
+    workdir = tempfile.mkdtemp(prefix='bench_data_')
+    try:
+        source = os.path.dirname(os.path.abspath(route))
+        copy = os.path.join(workdir, 'db')
+        shutil.copytree(source, copy)
+        pointer = Data(os.path.join(copy, os.path.basename(route)), cache_size=0)
+        city = pointer.getcities()[0]
+        date = pointer.dictdf[city].index[len(pointer.dictdf[city]) // 2]
+        iid = date.strftime('%Y-%m-%d') + ' ' + city
+
+        def edit():
+            pointer.update_row(iid, [city, date.strftime('%d.%m.%Y'), '1', '0', '1000', '1', '0'])
+
+        record('save_changes', measure(pointer.save_changes, repeat, setup=edit))
+        targets = []
+
+        def target():
+            targets.append(os.path.join(workdir, 'copy{0}'.format(len(targets))))
+            os.makedirs(targets[-1])
+
+        record('save_as', measure(lambda: pointer.save_as(targets[-1] + '/index.csv'), repeat, setup=target))
+    finally:
+        shutil.rmtree(workdir)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Сравнивает результаты с прежними
+
+    :param results: результаты сценариев
+    :param baseline: результаты сценариев прежнего запуска
+    :param tolerance: допустимое отношение лучших времен
+    :return: список строк вида (сценарий, прежнее время, новое время, отношение) для замедлившихся сценариев
+    """
+    slower = []
+    for name, result in results.items():
+        if name in baseline and baseline[name]['best'] > 0:
+            ratio = result['best'] / baseline[name]['best']
+            if ratio > tolerance:
+                slower.append((name, baseline[name]['best'], result['best'], ratio))
+    return slower
+
+
+def main(argv=None):
+    """
+    Точка входа бенчмарка
+
+    :param argv: аргументы командной строки (по умолчанию sys.argv)
+    :return: код завершения (1, если есть замедления относительно --baseline)
+    """
+    parser = argparse.ArgumentParser(description='Бенчмарк базы данных погоды')
+    parser.add_argument('route', nargs='?', help='основной файл существующей базы (по умолчанию - синтетическая)')
+    parser.add_argument('--stations', type=int, default=10, help='количество станций синтетической базы')
+    parser.add_argument('--years', type=int, default=10, help='количество лет синтетической базы')
+    parser.add_argument('--format', default='csv', help='формат хранения синтетической базы')
+    parser.add_argument('--keep', help='каталог, в котором оставить синтетическую базу')
+    parser.add_argument('--repeat', type=int, default=3, help='количество повторов каждого сценария')
+    parser.add_argument('--output', help='файл JSON для результатов')
+    parser.add_argument('--baseline', help='файл JSON прежнего запуска для сравнения')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='допустимое замедление относительно '
+                                                                      '--baseline (отношение времен)')
+    args = parser.parse_args(argv)
+
+    directory = None
+    route = args.route
+    if route is None:
+        directory = args.keep or tempfile.mkdtemp(prefix='bench_db_')
+        started = time.perf_counter()
+        route = generate(directory, args.stations, args.years, fmt=args.format)
+        print('Синтетическая база: {0} станций x {1} лет, {2:.2f} с'.format(
+            args.stations, args.years, time.perf_counter() - started), file=sys.stderr)
+    try:
+        data = Data(route, lazy=True)
+        rows = sum(len(data.dictdf[city]) for city in data.getcities())
+        database = {'route': route if args.route else None, 'cities': len(data.getcities()), 'rows': rows,
+                    'format': data.format}
+        del data
+
+        def report(name, result):
+            print('{0:48} {1:10.4f} {2:10.4f}'.format(name, result['best'], result['mean']), file=sys.stderr)
+
+        scenarios = run_scenarios(route, args.repeat, report)
+    finally:
+        if directory is not None and args.keep is None:
+            shutil.rmtree(directory)
+
+    import matplotlib
+    result = {'revision': revision(), 'date': dt.datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+              'matplotlib': matplotlib.__version__, 'database': database, 'repeat': args.repeat,
+              'scenarios': scenarios}
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('database', {}).get('rows') != rows:
+            print('Внимание: прежний запуск выполнялся на базе другого размера', file=sys.stderr)
+        slower = compare(scenarios, baseline.get('scenarios', {}), args.tolerance)
+        for name, before, after, ratio in slower:
+            print('Замедление {0}: {1:.4f} с -> {2:.4f} с (x{3:.2f})'.format(name, before, after, ratio),
+                  file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Сравнение разбора страниц архива погоды: прежний способ (исправление HTML
+регулярными выражениями + ElementTree) и потоковый ArchiveParser.
+
+Страницы берутся из каталога с записанными ответами сервера (см. параметр
+record у Library.ingest.Downloader и ключ --record у getweather.py); если
+каталог не указан, создается синтетическая страница заданного размера.
+
+Запуск из корня репозитория: python -m Benchmarks.bench_parser --days 5000
+"""
+import argparse
+import datetime as dt
+import glob
+import io
+import json
+import os
+import re
+import time
+import tracemalloc
+import xml.etree.ElementTree as ElementTree
+
+import pandas as pd
+
+from Library.archiveparser import parse_stream
+
+
+def fix_xml(xml_string):
+    """
+    Прежний способ: исправляет закрытие тегов, чтобы HTML можно было разобрать с помощью ElementTree
+    """
+    xml_string = re.sub("(<meta.{0,200}[^/])(>)", r"\1/\2", xml_string)
+    xml_string = re.sub("(<link.{0,200})(>)", r"\1/\2", xml_string)
+    xml_string = re.sub("(<br)(>)", r"\1/\2", xml_string)
+    xml_string = re.sub("(<tbody align =\"center\">)(.{0,20})(<tbody align =\"center\">)", "<tbody align=\"center\">",
+                        xml_string, flags=re.DOTALL)
+    return xml_string
+
+
+def create_db(table_body):
+    """
+    Прежний способ: строит датафрейм из элемента tbody
+    """
+    columns = ["date", "tempMax", "tempMin", "press", "wind", "falls"]
+    return pd.DataFrame(list(
+        map(lambda x: dict(zip(columns, list(map(lambda y: -200 if y.text is None else y.text,
+                                                 list(list(x[:3]) + list(x[4:-1])))))), table_body)), columns=columns)
+
+
+def parse_legacy(page):
+    return create_db(ElementTree.fromstring(fix_xml(page.decode('UTF-8')))[1][2][5][1])
+
+
+def parse_streaming(page):
+    return parse_stream(io.BytesIO(page))
+
+
+def synthetic_page(days):
+    """
+    Создает страницу архива той же структуры, что и страницы сервера
+
+    :param days: количество строк с данными
+    :return: страница в кодировке UTF-8
+    """
+    rows = []
+    date = dt.date(2000, 1, 1)
+    for i in range(days):
+        rows.append('<tr><td>{0:%d.%m.%Y}</td><td>{1}</td><td>{2}</td><td>0</td><td>{3}</td><td>{4}</td>'
+                    '<td>{5}</td><td></td></tr>'.format(date, i % 40 - 10 if i % 13 else '', -(i % 30), 1000 + i % 30,
+                                                        i % 9, i % 17))
+        date += dt.timedelta(days=1)
+    return ('<html><head>\n<meta charset="utf-8">\n<link rel="stylesheet" href="style.css">\n</head>\n'
+            '<body><div></div><div></div><div><p></p><p></p><p></p><p></p><p></p><table><thead><tr><th>Дата</th>'
+            '</tr></thead><tbody align ="center">' + ''.join(rows) + '</tbody></table></div></body></html>'
+            ).encode('UTF-8')
+
+
+def measure(parse, pages, repeat):
+    """
+    Измеряет время и пиковую память разбора страниц
+
+    :return: (лучшее время в секундах, пиковая память в байтах, количество строк)
+    """
+    best = None
+    rows = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = sum(len(parse(page)) for page in pages)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    for page in pages:
+        parse(page)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Бенчмарк разбора страниц архива погоды')
+    parser.add_argument('pages', nargs='?', help='каталог с записанными страницами *.html')
+    parser.add_argument('--days', type=int, default=5000, help='размер синтетической страницы в строках')
+    parser.add_argument('--repeat', type=int, default=5, help='количество повторов')
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = []
+        for name in sorted(glob.glob(os.path.join(args.pages, '*.html'))):
+            with open(name, 'rb') as f:
+                pages.append(f.read())
+    else:
+        pages = [synthetic_page(args.days)]
+
+    result = {'pages': len(pages), 'bytes': sum(len(page) for page in pages)}
+    for name, parse in (('legacy', parse_legacy), ('streaming', parse_streaming)):
+        seconds, peak, rows = measure(parse, pages, args.repeat)
+        result[name] = {'seconds': seconds, 'peak_memory': peak, 'rows': rows}
+    print(json.dumps(result, indent=2))
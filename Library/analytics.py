@@ -0,0 +1,111 @@
+from collections import namedtuple
+
+import numpy as np
+
+Extreme = namedtuple('Extreme', ['city', 'date', 'value'])
+
+# (ключ результата, столбец, 'min' или 'max')
+EXTREMES = [('coldest', 'tempMin', 'min'),
+            ('hottest', 'tempMax', 'max'),
+            ('press', 'press', 'max'),
+            ('falls', 'falls', 'max'),
+            ('wind', 'wind', 'max')]
+
+REPORT = """                    В данном срезе данных
+        Самый холодный город: {0}, дата: {1}, температура опустилась до {2}
+        Самый теплый город: {3}, дата: {4}, температура поднялась до {5}
+        Город с наибольшим атмосферным давлением: {6}, дата: {7}, Давление: {8}
+        Город с наибольшим количеством осадков: {9}, дата: {10}, Осадки: {11}
+        Город с сильнейшим ветром: {12}, дата: {13}, Скорость ветра: {14}
+                            Данные были сохранены в {15}
+        """
+
+NO_DATA = 'Недостаточно данных'
+
+
+def find_extremes(table):
+    """
+    Находит экстремальные значения погоды среди всех выбранных городов за один проход.
+
+    Пропущенные значения (NaN) не участвуют в поиске.
+
+    :param table: датафрейм в длинном формате с индексом (город, дата)
+    :return: словарь вида {ключ: Extreme или None, если данных нет}
+    """
+    result = {}
+    for key, column, how in EXTREMES:
+        position = extreme_position(table, column, how)
+        if position is None:
+            result[key] = None
+        else:
+            city, date = table.index[position]
+            result[key] = Extreme(city, date, table[column].to_numpy()[position])
+    return result
+
+
+def frame_extremes(city, frame):
+    """
+    Находит экстремальные значения погоды в датафрейме одного города (или в части его данных)
+
+    :param city: город
+    :param frame: датафрейм с индексом по дате
+    :return: словарь вида {ключ: Extreme или None, если данных нет}
+    """
+    result = {}
+    for key, column, how in EXTREMES:
+        position = extreme_position(frame, column, how)
+        result[key] = None if position is None else Extreme(city, frame.index[position],
+                                                            frame[column].to_numpy()[position])
+    return result
+
+
+def merge_extremes(first, second):
+    """
+    Объединяет экстремумы двух частей данных; при равенстве значений остается первый
+
+    :param first: словарь экстремумов
+    :param second: словарь экстремумов следующей части данных
+    :return: словарь экстремумов обеих частей
+    """
+    result = {}
+    for key, column, how in EXTREMES:
+        a, b = first.get(key), second.get(key)
+        if a is None or b is None:
+            result[key] = b if a is None else a
+        elif how == 'min':
+            result[key] = b if b.value < a.value else a
+        else:
+            result[key] = b if b.value > a.value else a
+    return result
+
+
+def extreme_position(frame, column, how):
+    """
+    Возвращает позицию наименьшего или наибольшего значения столбца без учета NaN
+
+    :return: позиция или None, если столбца нет или все значения пропущены
+    """
+    if column not in frame.columns:
+        return None
+    values = frame[column].to_numpy()
+    if np.isnan(values).all():
+        return None
+    return np.nanargmin(values) if how == 'min' else np.nanargmax(values)
+
+
+def format_report(extremes, saved_to='log.txt'):
+    """
+    Строит текстовый отчет по результату find_extremes
+
+    :param extremes: словарь экстремумов
+    :param saved_to: куда записывается отчет (журнал анализа log.txt в графическом интерфейсе)
+    :return: текст отчета
+    """
+    fields = []
+    for key, column, how in EXTREMES:
+        extreme = extremes.get(key)
+        if extreme is None:
+            fields += [NO_DATA, NO_DATA, NO_DATA]
+        else:
+            fields += [extreme.city, extreme.date.strftime('%d.%m.%Y'), '%g' % extreme.value]
+    return REPORT.format(*(fields + [saved_to]))
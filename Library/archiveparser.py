@@ -0,0 +1,185 @@
+import codecs
+import re
+from array import array
+from html import unescape
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["date", "tempMax", "tempMin", "press", "wind", "falls"]
+
+DATE = re.compile(r'^\d\d\.\d\d\.\d{4}$')
+
+# атрибуты тега: символ ">" внутри значения в кавычках тег не завершает
+ATTRIBUTES = r'''(?:"[^"]*"|'[^']*'|[^'">])*'''
+
+# ячейка без вложенных тегов (группа - ее текст)
+CELL = re.compile(r'<t[dh]\b' + ATTRIBUTES + r'>([^<]*)</t[dh]\s*>', re.IGNORECASE)
+
+# теги и комментарии; номер последней сработавшей группы отмечает то, что важно для разбора:
+# 1 - целая строка из простых ячеек (группа - ее содержимое), 2 - начало ячейки, 3 - конец ячейки,
+# 4 - начало строки, 5 - конец строки или таблицы, 6 - незавершенный тег или комментарий в конце куска
+ROW, OPEN_CELL, CLOSE_CELL, OPEN_ROW, CLOSE_ROW, PARTIAL = 1, 2, 3, 4, 5, 6
+TAGS = (r'<tr\b' + ATTRIBUTES + r'>((?:\s*<t[dh]\b' + ATTRIBUTES + r'>[^<]*</t[dh]\s*>)*)\s*</tr\s*>|'
+        r'<t[dh]\b' + ATTRIBUTES + r'>()|</t[dh]\s*>()|<tr\b' + ATTRIBUTES + r'>()|'
+        r'</(?:tr|tbody|table)\s*>()|<!--.*?-->|<[!/]?[a-z]' + ATTRIBUTES + '>')
+TOKEN = re.compile(TAGS, re.IGNORECASE | re.DOTALL)
+# в середине потока хвост куска с незавершенным тегом откладывается целиком, чтобы теги
+# в значениях его атрибутов (title="<td>") не были приняты за настоящие
+STREAM_TOKEN = re.compile(TAGS + r'''|(?:<!--(?!.*?-->).*|<[!/]?[a-z]''' + ATTRIBUTES + r'''(?:"[^"]*|'[^']*)?)\Z()''',
+                          re.IGNORECASE | re.DOTALL)
+
+
+class ArchiveParser:
+    """
+    Потоковый разборщик страницы архива погоды.
+
+    Страница подается кусками по мере получения из сокета (метод feed), дерево
+    документа не строится: текст разбивается на теги и содержимое ячеек, а
+    незавершенный хвост куска дожидается следующего. Из каждой строки таблицы,
+    первая ячейка которой содержит дату ДД.ММ.ГГГГ, берутся дата, максимальная
+    и минимальная температуры, давление, ветер и осадки; числа сразу
+    записываются в массивы столбцов float32, пропуски - как NaN.
+    Строки из простых ячеек разбираются одним регулярным выражением, а строки
+    с вложенными тегами - по тегам. Символ ">" в значении атрибута в кавычках
+    тег не завершает. Незакрытые теги <td> и <tr> допускаются, поэтому
+    исправлять HTML перед разбором не нужно.
+    """
+    def __init__(self, missing=float('nan')):
+        """
+        Конструктор разборщика
+
+        :param missing: значение, которым заменяются пустые и нечисловые ячейки
+        """
+        self.missing = missing
+        self.dates = []
+        self.columns = [array('f') for _ in COLUMNS[1:]]
+        self.row = None
+        self.cell = None
+        self.buffer = ''
+
+    def feed(self, text, final=False):
+        """
+        Разбирает очередной кусок страницы
+
+        :param text: кусок текста страницы
+        :param final: кусок последний (незавершенный тег в его конце уже не будет дописан)
+        """
+        text = self.buffer + text
+        position = 0
+        for match in (TOKEN if final else STREAM_TOKEN).finditer(text):
+            start = match.start()
+            if self.cell is not None and start > position:
+                self.cell.append(text[position:start])
+            position = start
+            kind = match.lastindex
+            if kind == PARTIAL:
+                break
+            position = match.end()
+            if kind == ROW:
+                # строка целиком: ячейки разбираются одним вызовом findall
+                self.end_row()
+                self.row = [(unescape(cell) if '&' in cell else cell).strip()
+                            for cell in CELL.findall(match.group(ROW))]
+                self.end_row()
+            elif kind == OPEN_CELL:
+                if self.row is not None:
+                    self.end_cell()
+                    self.cell = []
+            elif kind == CLOSE_CELL:
+                self.end_cell()
+            elif kind == OPEN_ROW:
+                self.end_row()
+                self.row = []
+            elif kind == CLOSE_ROW:
+                self.end_row()
+        rest = text[position:]
+        tail = rest.find('<')
+        if tail < 0:
+            tail = len(rest)
+        if self.cell is not None and tail > 0:
+            self.cell.append(rest[:tail])
+        self.buffer = rest[tail:]
+
+    def end_cell(self):
+        """
+        Завершает текущую ячейку таблицы
+        """
+        if self.cell is not None:
+            text = ''.join(self.cell)
+            self.row.append((unescape(text) if '&' in text else text).strip())
+            self.cell = None
+
+    def end_row(self):
+        """
+        Завершает текущую строку таблицы и, если это строка с данными, записывает ее значения
+        """
+        self.end_cell()
+        row = self.row
+        self.row = None
+        if row is None or len(row) < 7 or not DATE.match(row[0]):
+            return
+        # дата сразу переводится в вид ГГГГ-ММ-ДД, который numpy разбирает без формата
+        date = row[0]
+        self.dates.append(date[6:] + '-' + date[3:5] + '-' + date[:2])
+        for column, text in zip(self.columns, row[1:3] + row[4:7]):
+            try:
+                column.append(float(text))
+            except ValueError:
+                # пустые ячейки и числа с десятичной запятой
+                column.append(self.number(text))
+
+    def number(self, text):
+        """
+        Переводит текст ячейки в число
+
+        :param text: текст ячейки
+        :return: число или значение пропуска
+        """
+        try:
+            return float(text.replace(',', '.'))
+        except ValueError:
+            return self.missing
+
+    def close(self):
+        """
+        Завершает разбор страницы
+        """
+        self.feed('', final=True)
+        self.buffer = ''
+        self.end_row()
+
+    def frame(self):
+        """
+        Возвращает разобранные данные
+
+        :return: датафрейм со столбцами date, tempMax, tempMin, press, wind, falls
+        """
+        data = {'date': np.array(self.dates, dtype='datetime64[D]').astype('datetime64[ns]')}
+        for name, column in zip(COLUMNS[1:], self.columns):
+            data[name] = np.frombuffer(column, dtype=np.float32) if len(column) else np.array([], dtype=np.float32)
+        return pd.DataFrame(data, columns=COLUMNS)
+
+
+def parse_stream(stream, chunk_size=65536, missing=float('nan'), record=None):
+    """
+    Разбирает страницу архива, читая ее из потока кусками
+
+    :param stream: объект с методом read(размер), например http.client.HTTPResponse
+    :param chunk_size: размер куска в байтах
+    :param missing: значение пропуска
+    :param record: открытый двоичный файл, в который дополнительно записывается исходная страница
+    :return: датафрейм с данными страницы
+    """
+    parser = ArchiveParser(missing)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        if record is not None:
+            record.write(chunk)
+        parser.feed(decoder.decode(chunk))
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    return parser.frame()
@@ -0,0 +1,98 @@
+import numpy as np
+
+
+class CalendarIndex:
+    """
+    Календарный индекс данных одного города.
+
+    Хранит отсортированные целочисленные ключи вида ГГГГММДД, а также
+    (по требованию) ключи ММДД и ДДММ, отсортированные вместе с позициями
+    строк. Фильтр по дню, месяцу, году и диапазону дат сводится к бинарному
+    поиску по этим ключам вместо полного просмотра DatetimeIndex.
+    """
+    def __init__(self, index):
+        """
+        Конструктор индекса
+
+        :param index: DatetimeIndex датафрейма города
+        """
+        keys = np.asarray(index.year * 10000 + index.month * 100 + index.day, dtype=np.int32)
+        self.size = len(keys)
+        if index.is_monotonic_increasing:
+            self.order = None
+            self.keys = keys
+        else:
+            self.order = np.argsort(keys, kind='stable')
+            self.keys = keys[self.order]
+        self.secondary = {}
+
+    def take(self, day=None, month=None, year=None, start=None, end=None):
+        """
+        Возвращает позиции строк, соответствующих фильтру
+
+        :param day: день месяца или None (все дни)
+        :param month: месяц или None (все месяцы)
+        :param year: год или None (все годы)
+        :param start: первая дата диапазона в виде ключа ГГГГММДД или None (без ограничения)
+        :param end: последняя дата диапазона (включительно) в виде ключа ГГГГММДД или None
+        :return: срез или массив позиций для DataFrame.iloc в хронологическом порядке
+        """
+        first, last = 0, self.size
+        if start is not None or end is not None:
+            first, last = np.searchsorted(self.keys, [start if start is not None else 0,
+                                                      end + 1 if end is not None else 100000000])
+        if year is not None:
+            low = year * 10000
+            high = low + 10000
+            if month is not None:
+                low += month * 100
+                high = low + 100
+                if day is not None:
+                    low += day
+                    high = low + 1
+            begin, stop = np.searchsorted(self.keys, [low, high])
+            begin, stop = max(begin, first), min(stop, last)
+            if day is not None and month is None:
+                return self.positions(begin + np.flatnonzero(self.keys[begin:stop] % 100 == day))
+            return self.positions(slice(begin, max(begin, stop)))
+        if month is not None:
+            low = month * 100 + (day if day is not None else 0)
+            selection = self.lookup('md', low, low + (1 if day is not None else 100))
+        elif day is not None:
+            selection = self.lookup('dm', day * 100, day * 100 + 100)
+        elif first == 0 and last == self.size:
+            return self.positions(slice(None))
+        else:
+            return self.positions(slice(first, last))
+        return self.positions(selection[np.searchsorted(selection, first):np.searchsorted(selection, last)])
+
+    def lookup(self, name, low, high):
+        """
+        Ищет позиции строк по вторичному ключу (ММДД или ДДММ)
+
+        :param name: 'md' или 'dm'
+        :param low: нижняя граница ключа (включительно)
+        :param high: верхняя граница ключа (не включительно)
+        :return: отсортированный массив позиций в отсортированных по дате ключах
+        """
+        if name not in self.secondary:
+            if name == 'md':
+                keys = self.keys % 10000
+            else:
+                keys = (self.keys % 100) * 100 + (self.keys // 100) % 100
+            order = np.argsort(keys, kind='stable')
+            self.secondary[name] = (keys[order], order)
+        keys, order = self.secondary[name]
+        start, stop = np.searchsorted(keys, [low, high])
+        return np.sort(order[start:stop])
+
+    def positions(self, selection):
+        """
+        Переводит позиции в отсортированных ключах в позиции строк датафрейма
+
+        :param selection: срез или массив позиций
+        :return: срез или массив позиций для DataFrame.iloc
+        """
+        if self.order is None:
+            return selection
+        return self.order[selection]
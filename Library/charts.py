@@ -0,0 +1,292 @@
+import time
+from contextlib import nullcontext
+
+import numpy as np
+
+from Library.data import date_key
+
+
+def build_chart(pointer, df, filt, column):
+    """
+    Подготавливает данные диаграммы для выбранных фильтров.
+
+    Функция не обращается к matplotlib и Tk, поэтому ее можно выполнять в фоновом потоке.
+    Помесячные диаграммы строятся по готовым агрегатам города (Data.rollup), а не по сырым данным.
+
+    :param pointer: база данных - экземпляр класса Data
+    :param df: словарь датафреймов, полученный из Data.get_data
+    :param filt: список фильтров (см. Data.get_data); список городов рассматривается как "Все",
+                 а помесячные диаграммы ограничиваются месяцами, пересекающимися с диапазоном дат
+    :param column: столбец, по которому строится диаграмма
+    :return: описание диаграммы (словарь) или None, если для фильтров диаграмма не предусмотрена
+    :raises IndexError: если данных по фильтрам недостаточно
+    """
+    start, end = [date_key(x) for x in (list(filt[4:6]) + ['Все', 'Все'])[:2]]
+    filt = [filt[0] if isinstance(filt[0], str) else 'Все'] + list(filt[1:4])
+
+    # <editor-fold desc="BAR: All cities in one day">
+    if filt[0] == 'Все' and filt[1] != 'Все' and filt[2] != 'Все' and filt[3] != 'Все':
+        values = [x[column].iloc[0] for x in df.values()]
+        chart = {'kind': 'bar', 'labels': list(df.keys()), 'values': values,
+                 'title': r'Погода в городах России на {0:02}.{1:02}.{2:04}'.format(int(filt[1]), int(filt[2]),
+                                                                                     int(filt[3]))}
+    # </editor-fold>
+
+    # <editor-fold desc="PLOT: One month of year in one city">
+    elif filt[0] != 'Все' and filt[1] == 'Все' and filt[2] != 'Все' and filt[3] != 'Все':
+        chart = {'kind': 'plot', 'labels': list(df[filt[0]].index.strftime("%d.%m.%Y")),
+                 'values': df[filt[0]][column].tolist(),
+                 'title': 'Данные по одному месяцу в г.' + filt[0]}
+    # </editor-fold>
+
+    # <editor-fold desc="PLOT: annual in one city">
+    elif filt[0] != 'Все' and filt[1] == 'Все' and filt[2] == 'Все' and filt[3] != 'Все':
+        series = pointer.rollup(filt[0]).months(column, 'median', int(filt[3]), start, end)
+        chart = {'kind': 'plot', 'labels': month_labels(series), 'values': series.tolist(),
+                 'title': 'Годовое изменение погоды в г. ' + filt[0]}
+    # </editor-fold>
+
+    # <editor-fold desc="PLOT: temp during several years in one city">
+    elif filt[0] != 'Все' and filt[1] == 'Все' and filt[2] == 'Все' and filt[3] == 'Все':
+        city = list(df.keys())[0]
+        series = pointer.rollup(city).months(column, 'median', None, start, end)
+        chart = {'kind': 'plot', 'labels': month_labels(series), 'values': series.tolist(), 'title': city,
+                 'tick_step': 12 if len(series) > 3 * 12 else 1}
+    # </editor-fold>
+
+    # <editor-fold desc="BAR: Average monthly temp among cities">
+    elif filt[0] == 'Все' and filt[1] == 'Все' and filt[2] != 'Все' and filt[3] != 'Все':
+        key = int(filt[3]) * 100 + int(filt[2])
+        # месяц, не пересекающийся с диапазоном дат, отбрасывается так же, как в помесячных графиках
+        values = [pointer.rollup(city).months(column, 'mean', int(filt[3]), start, end).get(key, np.nan)
+                  for city in df.keys()]
+        chart = {'kind': 'bar', 'labels': list(df.keys()), 'values': values if not np.isnan(values).all() else [],
+                 'title': None}
+    # </editor-fold>
+
+    else:
+        return None
+    if not chart['values']:
+        raise IndexError('Нет данных для диаграммы')
+    return chart
+
+
+def month_labels(series):
+    """
+    Строит подписи ММ.ГГГГ для помесячных агрегатов
+
+    :param series: серия с ключами ГГГГММ в индексе
+    :return: список подписей
+    """
+    return ['{0:02}.{1}'.format(key % 100, key // 100) for key in series.index]
+
+
+def decimate(x, y, buckets):
+    """
+    Прореживает длинный ряд: значения делятся на группы, и от каждой группы
+    остаются минимум и максимум. Форма графика (включая выбросы) при этом
+    сохраняется, а количество точек не превышает 2 * buckets.
+
+    :param x: позиции точек
+    :param y: значения (пропуски - NaN)
+    :param buckets: количество групп
+    :return: (позиции, значения) после прореживания
+    """
+    if len(y) <= 2 * buckets:
+        return x, y
+    starts = np.linspace(0, len(y), buckets, endpoint=False).astype(int)
+    low = np.fmin.reduceat(y, starts)
+    high = np.fmax.reduceat(y, starts)
+    return np.repeat(x[starts], 2), np.column_stack([low, high]).ravel()
+
+
+class ChartRenderer:
+    """
+    Отрисовщик диаграмм, который не пересоздает фигуру при каждом запросе.
+
+    Оси, линия и столбцы создаются один раз, а затем у них только меняются данные
+    (set_data, set_height). Если подписи, заголовок и пределы осей не изменились,
+    перерисовываются одни лишь данные поверх сохраненного фона (blitting), иначе
+    холст перерисовывается целиком через draw_idle. Длинные ряды прореживаются
+    до двух точек (минимум и максимум) на пиксель, поэтому время отрисовки
+    не зависит от длины ряда.
+    """
+    # наибольшее количество подписей на оси X
+    max_ticks = 40
+    # количество точек с маркерами, начиная с которого маркеры не рисуются
+    max_markers = 200
+
+    def __init__(self, fig, buckets=None, timings=None):
+        """
+        Конструктор отрисовщика
+
+        :param fig: фигура matplotlib, уже привязанная к холсту
+        :param buckets: количество групп при прореживании длинных рядов (по умолчанию - ширина осей в пикселях)
+        :param timings: экземпляр Library.timing.Timings; если задан, замеряются компоновка (layout),
+                        полная перерисовка от запроса до окончания (draw) и перерисовка данных (blit)
+        """
+        self.fig = fig
+        self.buckets = buckets
+        self.timings = timings
+        self.requested = None
+        self.canvas = fig.canvas
+        self.blit = getattr(self.canvas, 'supports_blit', False)
+        self.axes = None
+        self.line = None
+        self.bars = None
+        self.layout = None
+        self.background = None
+        if self.blit:
+            self.canvas.mpl_connect('draw_event', self.on_draw)
+        if timings is not None:
+            self.canvas.mpl_connect('draw_event', self.on_drawn)
+
+    def render(self, chart):
+        """
+        Рисует подготовленную диаграмму
+
+        :param chart: описание диаграммы из build_chart
+        """
+        if self.axes is None:
+            self.axes = self.fig.add_subplot(111)
+        labels = chart['labels']
+        x = np.arange(len(labels))
+        y = np.asarray(chart['values'], dtype=float)
+        if chart['kind'] == 'bar':
+            artists = self.draw_bars(x, y)
+        else:
+            artists = self.draw_line(*decimate(x, y, self.buckets or max(int(self.axes.bbox.width), 1)))
+        step = max(chart.get('tick_step', 1), -(-len(labels) // self.max_ticks))
+        layout = (chart['kind'], len(labels), step, tuple(labels[::step]), chart['title'])
+        if layout == self.layout and self.fits(y, chart['kind']):
+            self.update(artists)
+            return
+        self.axes.set_xticks(x[::step], minor=False)
+        self.axes.set_xticklabels(labels[::step], rotation='vertical')
+        self.axes.set_title(chart['title'] or '')
+        if chart['kind'] == 'bar':
+            self.axes.set_xlim(-0.5, len(labels) - 0.5)
+        else:
+            self.axes.set_xlim(-0.5, max(len(labels) - 0.5, 0.5))
+        self.axes.set_ylim(*self.limits(y, chart['kind']))
+        if layout != self.layout:
+            with self.span('layout'):
+                self.fig.tight_layout()
+        self.layout = layout
+        self.requested = time.perf_counter()
+        self.canvas.draw_idle()
+
+    def span(self, name):
+        """
+        Возвращает контекст замера этапа отрисовки (пустой, если замеры не ведутся)
+        """
+        return nullcontext() if self.timings is None else self.timings.span(name)
+
+    def on_drawn(self, event):
+        """
+        Обработчик окончания перерисовки холста: замеряет время от запроса перерисовки
+        """
+        if self.requested is not None:
+            self.timings.record('draw', time.perf_counter() - self.requested)
+            self.requested = None
+
+    def draw_line(self, x, y):
+        """
+        Показывает ряд линией, создавая ее при первом обращении
+
+        :return: список изменившихся художников matplotlib
+        """
+        if self.bars is not None:
+            self.bars.remove()
+            self.bars = None
+        if self.line is None:
+            self.line, = self.axes.plot(x, y, 'o-', animated=self.blit)
+        else:
+            self.line.set_data(x, y)
+        self.line.set_marker('o' if len(y) <= self.max_markers else '')
+        return [self.line]
+
+    def draw_bars(self, x, y):
+        """
+        Показывает значения столбцами; если количество столбцов не изменилось, меняются только их высоты
+
+        :return: список изменившихся художников matplotlib
+        """
+        if self.line is not None:
+            self.line.remove()
+            self.line = None
+        if self.bars is not None and len(self.bars.patches) != len(y):
+            self.bars.remove()
+            self.bars = None
+        if self.bars is None:
+            self.bars = self.axes.bar(x, np.nan_to_num(y))
+            for patch in self.bars.patches:
+                patch.set_animated(self.blit)
+        else:
+            for patch, height in zip(self.bars.patches, np.nan_to_num(y)):
+                patch.set_height(height)
+        return list(self.bars.patches)
+
+    @staticmethod
+    def limits(y, kind):
+        """
+        Вычисляет пределы оси Y с небольшим запасом
+
+        :param y: значения
+        :param kind: вид диаграммы
+        :return: (нижний предел, верхний предел)
+        """
+        finite = y[np.isfinite(y)]
+        low, high = (finite.min(), finite.max()) if len(finite) else (0.0, 1.0)
+        if kind == 'bar':
+            low, high = min(low, 0.0), max(high, 0.0)
+        margin = (high - low) * 0.05 or 1.0
+        return low - margin, high + margin
+
+    def fits(self, y, kind):
+        """
+        Проверяет, можно ли оставить текущие пределы оси Y: новые значения должны
+        помещаться в них и занимать не меньше половины высоты
+
+        :return: True, если пределы менять не нужно
+        """
+        low, high = self.limits(y, kind)
+        current_low, current_high = self.axes.get_ylim()
+        return current_low <= low and high <= current_high and (high - low) * 2 >= current_high - current_low
+
+    def update(self, artists):
+        """
+        Перерисовывает только данные диаграммы
+        """
+        if not self.blit or self.background is None:
+            self.requested = time.perf_counter()
+            self.canvas.draw_idle()
+            return
+        with self.span('blit'):
+            self.canvas.restore_region(self.background)
+            for artist in artists:
+                self.axes.draw_artist(artist)
+            self.canvas.blit(self.axes.bbox)
+
+    def on_draw(self, event):
+        """
+        Обработчик полной перерисовки холста: запоминает фон и рисует поверх него данные
+        """
+        if self.axes is None:
+            return
+        self.background = self.canvas.copy_from_bbox(self.axes.bbox)
+        for artist in ([self.line] if self.line is not None else []) + \
+                (list(self.bars.patches) if self.bars is not None else []):
+            self.axes.draw_artist(artist)
+        self.canvas.blit(self.axes.bbox)
+
+    def clear(self):
+        """
+        Очищает фигуру (например, когда данных для диаграммы нет)
+        """
+        self.fig.clf()
+        self.axes = None
+        self.line = None
+        self.bars = None
+        self.layout = None
+        self.background = None
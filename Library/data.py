@@ -1,52 +1,357 @@
 import datetime as dt
 import os
-import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 
+from Library.analytics import EXTREMES, find_extremes, frame_extremes, merge_extremes
+from Library.calendarindex import CalendarIndex
+from Library.framecache import FrameCache, Selection
+from Library.journal import Journal
+from Library.longtable import LongTable, aggregate
+from Library.querycache import QueryCache
+from Library.rollup import Rollup
+from Library.snapshot import load_snapshot, save_snapshot, sources
+from Library.storage import INDEX_COLUMNS, VALUE_COLUMNS, VALUE_DTYPE, city_format, get_storage, next_id, remove, \
+    write_atomic, write_index
+from Library.timing import Timings
+
 
 class Data:
     """
     Класс базы данных. Выполняет функции и действия по отношению к данным.
     """
-    def __init__(self):
+    # наибольшее количество рядов, которое get_table возвращает в режиме out_of_core; у обрезанной
+    # таблицы полное количество рядов записывается в table.attrs['total_rows']
+    table_limit = 200000
+    # доля memory_limit, которая в ленивом режиме отводится кэшу запросов; остальное - датафреймам городов
+    cache_share = 0.25
+
+    def __init__(self, route="../Data/index.csv", lazy=False, memory_limit=None, consolidated=False, cache_size=32,
+                 timings=None, snapshot=False, out_of_core=False, workers=None):
+        """
+        Конструктор базы данных
+
+        :param route: путь основного файла базы данных
+        :param lazy: если True, данные городов загружаются только при первом обращении
+        :param memory_limit: лимит памяти в байтах для ленивого режима (None - без ограничений); в него
+                             входят и результаты запросов в кэше, которым отводится доля cache_share
+        :param consolidated: если True, запросы выполняются по единой таблице всех городов (LongTable)
+        :param cache_size: сколько последних результатов запросов хранить в кэше (0 - не кэшировать)
+        :param timings: экземпляр Timings для замеров времени загрузки, запросов и сохранения
+                        (по умолчанию - собственный)
+        :param snapshot: если True, данные городов читаются из снимка (см. Library.snapshot), когда файлы
+                         базы не менялись с его записи, а иначе читаются из файлов и снимок записывается заново
+        :param out_of_core: если True, база не загружается в память целиком: запросы, агрегаты и экстремумы
+                            вычисляются по частям (по годам для городов в формате chunks), а в памяти держатся
+                            только измененные города и ограниченный memory_limit кэш (режим включает ленивый)
+        :param workers: количество потоков, в которых читаются файлы городов при полной загрузке
+                        (None - по числу процессоров, 1 - без пула)
+        """
+        if (lazy or out_of_core) and consolidated:
+            raise ValueError('Сводная таблица требует загрузки всех городов и несовместима с ленивым режимом')
+        self.lazy = lazy or out_of_core
+        self.out_of_core = out_of_core
+        self.memory_limit = memory_limit
+        self.consolidated = consolidated
+        self.snapshot = snapshot
+        self.workers = workers
         self.dictdf = {}
+        self.calendars = {}
+        self.rollups = {}
+        self.versions = {}
+        self.generation = 0
+        self.cache = QueryCache(cache_size, None if not self.lazy or memory_limit is None or cache_size <= 0
+                                else int(memory_limit * self.cache_share))
+        self.timings = Timings() if timings is None else timings
+        self.table = None
         self.cityindex = pd.DataFrame()
-        self.load_data("../Data/index.csv")
+        self.route = ''
+        self.directory = ''
+        self.format = 'csv'
+        self.dirty = set()
+        self.added = set()
+        self.removed = {}
+        self.lock = threading.RLock()
+        self.journal = None
+        self.replaying = False
         self.mindate = dt.date(3000, 1, 1)
         self.maxdate = dt.date(1000, 1, 1)
-        self.cityindex['minDate'] = pd.to_datetime(self.cityindex['minDate'], format='%Y-%m-%d')
-        self.cityindex['maxDate'] = pd.to_datetime(self.cityindex['maxDate'], format='%Y-%m-%d')
-        self.mindate = min(set(self.cityindex['minDate']))
-        self.maxdate = max(set(self.cityindex['maxDate']))
+        self.load_data(route)
 
         # print(self.dictdf)
 
+    def cached(self, kind, filters, compute):
+        """
+        Возвращает результат запроса из кэша или вычисляет его.
+
+        Ключ кэша состоит из вида запроса, фильтров, номера загрузки базы и версий
+        затронутых городов, которые увеличиваются при каждой правке, поэтому после
+        изменения данных запрос вычисляется заново. Результаты из кэша общие, изменять их нельзя.
+
+        :param kind: вид запроса (любое хешируемое значение, например ('chart', столбец))
+        :param filters: список из фильтров
+        :param compute: функция без аргументов, вычисляющая результат
+        :return: результат запроса
+        """
+        with self.lock:
+            key = (kind, freeze(filters), self.generation,
+                   tuple((city, self.versions.get(city, 0)) for city in self.filter_cities(filters)))
+        return self.cache.get(key, compute)
+
+    def filter_cities(self, filters):
+        """
+        Возвращает список городов, выбранных фильтром
+
+        :param filters: список из фильтров
+        :return: список городов
+        """
+        if isinstance(filters[0], str):
+            return list(self.dictdf.keys()) if filters[0] == 'Все' else [filters[0]]
+        return list(filters[0])
+
+    def parse_filters(self, filters):
+        """
+        Разбирает фильтры
+
+        :param filters: список из фильтров
+        :return: (список городов, день, месяц, год, начало диапазона, конец диапазона); отсутствующие
+                 фильтры - None, границы диапазона - ключи вида ГГГГММДД
+        :raises ValueError: если день, месяц, год или граница диапазона заданы неверно
+        """
+        day, month, year = [None if x == 'Все' else int(x) for x in filters[1:4]]
+        start, end = [date_key(x) for x in (list(filters[4:6]) + ['Все', 'Все'])[:2]]
+        return self.filter_cities(filters), day, month, year, start, end
+
     def get_data(self, filters):
         """
-        Возвращает словарь из датафреймов, которые соответствуют фильтрам
+        Возвращает словарь из датафреймов, которые соответствуют фильтрам.
+
+        Фильтры - список [город, день, месяц, год] или [город, день, месяц, год, начало, конец].
+        Город - название, 'Все' или список названий; день, месяц и год - числа (строкой) или 'Все';
+        начало и конец диапазона (включительно) - даты (ДД.ММ.ГГГГ, ГГГГ-ММ-ДД или datetime)
+        либо 'Все'. Диапазон сочетается с остальными фильтрами: например, месяц 12 и
+        диапазон 2000-2009 годов дают все декабри десятилетия.
 
         :param filters: список из фильтров
         :return: словарь датафреймов вида {город: датафрейм}
         """
-        dictdf = {}
-        if filters[0] == 'Все':
-            for city in self.dictdf.keys():
-                # print(self.dictdf[city].index.year>0)
-                dictdf[city] = self.dictdf[city][
-                    (self.dictdf[city].index.day == int(filters[1]) if filters[1] != 'Все' else True) &
-                    (self.dictdf[city].index.month == int(filters[2]) if filters[2] != 'Все' else True) &
-                    (self.dictdf[city].index.year == int(filters[3]) if filters[3] != 'Все' else
-                     self.dictdf[city].index.year > 0)]
+        with self.timings.span('get_data'):
+            return self.cached('data', filters, lambda: self.select(filters))
 
-        else:
-            dictdf[filters[0]] = self.dictdf[filters[0]][
-                (self.dictdf[filters[0]].index.day == int(filters[1]) if filters[1] != 'Все' else True) &
-                (self.dictdf[filters[0]].index.month == int(filters[2]) if filters[2] != 'Все' else True) &
-                (self.dictdf[filters[0]].index.year == int(filters[3]) if filters[3] != 'Все' else self.dictdf[filters[
-                    0]].index.year > 0)]
+    def select(self, filters):
+        """
+        Выбирает данные, соответствующие фильтрам, без обращения к кэшу
+
+        :param filters: список из фильтров
+        :return: словарь датафреймов вида {город: датафрейм}
+        """
+        cities, day, month, year, start, end = self.parse_filters(filters)
+        if self.out_of_core:
+            for city in cities:
+                if city not in self.dictdf:
+                    raise KeyError(city)
+            return Selection(lambda city: concat_frames(list(self.filtered_chunks(city, day, month, year, start, end))),
+                             cities)
+        if self.consolidated:
+            table = self.long_table()
+            for city in cities:
+                if city not in table.cities:
+                    raise KeyError(city)
+            return table.split(table.query(cities, day, month, year, start, end), cities)
+        dictdf = {}
+        for city in cities:
+            frame, calendar = self.calendar(city)
+            dictdf[city] = frame.iloc[calendar.take(day, month, year, start, end)]
         return dictdf
 
+    def get_table(self, filters):
+        """
+        Возвращает данные, соответствующие фильтрам, одной таблицей в длинном формате.
+
+        В режиме out_of_core таблица содержит не больше table_limit рядов; если рядов
+        больше, их полное количество записывается в table.attrs['total_rows'].
+
+        :param filters: список из фильтров
+        :return: датафрейм с индексом (город, дата)
+        """
+        with self.timings.span('get_table'):
+            return self.cached('table', filters, lambda: self.select_table(filters))
+
+    def select_table(self, filters):
+        """
+        Строит таблицу в длинном формате по фильтрам без обращения к кэшу
+
+        :param filters: список из фильтров
+        :return: датафрейм с индексом (город, дата)
+        """
+        if self.consolidated:
+            cities, day, month, year, start, end = self.parse_filters(filters)
+            return self.long_table().query(None if filters[0] == 'Все' else cities, day, month, year, start, end)
+        if self.out_of_core:
+            selection = self.get_data(filters)
+            frames = {}
+            total = 0
+            for city in selection:
+                frame = selection[city]
+                if total < self.table_limit:
+                    frames[city] = frame.iloc[:self.table_limit - total]
+                total += len(frame)
+            table = LongTable(frames).table
+            if total > len(table):
+                table.attrs['total_rows'] = total
+            return table
+        return LongTable(self.get_data(filters)).table
+
+    def aggregate(self, filters, column, how='mean'):
+        """
+        Вычисляет агрегат столбца по каждому городу среди данных, соответствующих фильтрам
+
+        :param filters: список из фильтров
+        :param column: имя столбца
+        :param how: агрегирующая функция ('mean', 'median', 'min', 'max', 'count')
+        :return: серия вида {город: значение}
+        """
+        if self.out_of_core:
+            return self.cached(('aggregate', column, how), filters, lambda: self.stream_aggregate(filters, column, how))
+        return self.cached(('aggregate', column, how), filters,
+                           lambda: aggregate(self.get_table(filters), column, how))
+
+    def stream_aggregate(self, filters, column, how):
+        """
+        Вычисляет агрегат по городам в режиме out_of_core: в памяти одновременно находится один город
+
+        :return: серия вида {город: значение}
+        """
+        selection = self.get_data(filters)
+        values = {}
+        for city in selection:
+            series = selection[city][column]
+            if len(series):
+                # агрегат pandas по столбцу из одних пропусков выдает предупреждение, а результат и так NaN
+                values[city] = series.agg(how) if how == 'count' or series.count() else float('nan')
+        return pd.Series(values, name=column, dtype=float).rename_axis('city')
+
+    def extremes(self, filters):
+        """
+        Находит экстремальные значения погоды среди данных, соответствующих фильтрам
+
+        :param filters: список из фильтров
+        :return: словарь экстремумов (см. Library.analytics.find_extremes)
+        """
+        with self.timings.span('analytics'):
+            if self.out_of_core:
+                return self.cached('extremes', filters, lambda: self.stream_extremes(filters))
+            return self.cached('extremes', filters, lambda: find_extremes(self.get_table(filters)))
+
+    def stream_extremes(self, filters):
+        """
+        Находит экстремумы в режиме out_of_core, просматривая данные по частям
+
+        :param filters: список из фильтров
+        :return: словарь экстремумов
+        """
+        cities, day, month, year, start, end = self.parse_filters(filters)
+        result = {key: None for key, column, how in EXTREMES}
+        for city in cities:
+            if city not in self.dictdf:
+                raise KeyError(city)
+            for part in self.filtered_chunks(city, day, month, year, start, end):
+                result = merge_extremes(result, frame_extremes(city, part))
+        return result
+
+    def chunks(self, city, first=None, last=None):
+        """
+        Перебирает данные города по частям в порядке дат.
+
+        Города в формате chunks читаются по одному году с диска; измененные города
+        и города в других форматах отдаются одной частью из памяти (через ленивый кэш).
+
+        :param city: город
+        :param first: первый нужный год или None
+        :param last: последний нужный год или None
+        :return: итератор датафреймов с индексом по дате
+        """
+        if city in self.dirty or city_format(self.cityindex, city) != 'chunks':
+            yield self.dictdf[city]
+            return
+        storage = get_storage('chunks')
+        path = self.directory + str(self.cityindex.at[city, 'ID']).zfill(3)
+        for year in storage.years(path):
+            if (first is None or year >= first) and (last is None or year <= last):
+                yield storage.read_year(path, year)
+
+    def filtered_chunks(self, city, day=None, month=None, year=None, start=None, end=None):
+        """
+        Перебирает части данных города, отобранные фильтрами; читаются только годы, которые могут подойти
+
+        :return: итератор датафреймов с индексом по дате
+        """
+        first, last = year_range(year, start, end)
+        for chunk in self.chunks(city, first, last):
+            yield chunk.iloc[CalendarIndex(chunk.index).take(day, month, year, start, end)]
+
+    def long_table(self):
+        """
+        Возвращает сводную таблицу всех городов, перестраивая ее после изменений данных
+
+        :return: экземпляр LongTable
+        """
+        if self.table is None:
+            self.table = LongTable(self.dictdf)
+        return self.table
+
+    def calendar(self, city):
+        """
+        Возвращает датафрейм города вместе с его календарным индексом, строя индекс при первом обращении.
+
+        Индекс хранится вместе с датафреймом, по которому он построен, и используется только
+        для этого же датафрейма. Если город изменили, пока индекс строился, индекс
+        возвращается вызвавшему, но не сохраняется.
+
+        :param city: город
+        :return: (датафрейм, экземпляр CalendarIndex)
+        """
+        with self.lock:
+            version = (self.generation, self.versions.get(city, 0))
+        frame = self.dictdf[city]
+        entry = self.calendars.get(city)
+        if entry is not None and entry[0] is frame:
+            return entry
+        entry = (frame, CalendarIndex(frame.index))
+        with self.lock:
+            # индекс вытесненного датафрейма не сохраняется, иначе он удерживал бы датафрейм в памяти
+            if (self.generation, self.versions.get(city, 0)) == version and (
+                    not self.lazy or self.dictdf.resident(city, frame)):
+                self.calendars[city] = entry
+        return entry
+
+    def forget(self, city):
+        """
+        Удаляет календарный индекс и агрегаты города, датафрейм которого вытеснен из памяти
+
+        :param city: город
+        """
+        with self.lock:
+            self.calendars.pop(city, None)
+            self.rollups.pop(city, None)
+
+    def rollup(self, city):
+        """
+        Возвращает помесячные и погодовые агрегаты города, строя их при первом обращении
+
+        :param city: город
+        :return: экземпляр Rollup
+        """
+        if self.out_of_core:
+            # агрегаты всех городов могут не поместиться в память, поэтому хранятся только в кэше запросов
+            return self.cached('rollup', [city, 'Все', 'Все', 'Все'], lambda: Rollup.from_chunks(self.chunks(city)))
+        with self.lock:
+            if city not in self.rollups:
+                self.rollups[city] = Rollup(self.dictdf[city])
+            return self.rollups[city]
+
     def getcities(self):
         """
         Возвращает список имеющихся в базе данных городов
@@ -66,83 +371,253 @@ class Data:
         """
         return [self.mindate, self.maxdate]
 
-    def save(self, route):
+    def save(self, route, fmt=None):
         """
-        сохраняет базу данных по указанному маршруту
+        сохраняет базу данных по указанному маршруту.
+
+        Если база сохраняется туда же, откуда была загружена, и в том же формате,
+        перезаписываются только файлы измененных городов и индекс. Иначе все города
+        записываются под новыми номерами, и сохраненная база становится текущей.
 
         :param route: Путь, где лежит основной файл базы данных
+        :param fmt: формат хранения файлов городов (по умолчанию - формат загруженной базы)
         """
-        direct = '/'.join(route.split('/')[:-1]) + '/'
-        files = [f for f in os.listdir(direct) if
-                 os.path.isfile(direct + f) and not re.match(r'\d\d\d\.csv', f) and re.match(r'.*\.csv', f)]
-        indx = pd.DataFrame(columns=['ID', 'city', 'minDate', 'maxDate'])
+        with self.lock:
+            if os.path.abspath(route) == os.path.abspath(self.route) and (fmt is None or fmt == self.format):
+                self.save_changes()
+            else:
+                self.save_as(route, fmt)
 
-        if files:
-            for file in files:
-                indx = indx.append(pd.read_csv(direct + file, encoding="utf-8", sep=";"), sort=False)
-            # print(indx)
-            idx = max(indx['ID'].to_list())
-        else:
-            idx = 0
-        indx = pd.DataFrame(columns=['ID', 'city', 'minDate', 'maxDate'])
-        for item in self.cityindex.iterrows():
-            # print(item[0])
-            idx += 1
-            self.dictdf[item[0]] \
-                .to_csv(direct + '{0:03}'.format(idx) + '.csv',
-                        sep=";",
-                        index=True,
-                        encoding='utf-8')
-            indx = indx.append(pd.DataFrame([[idx, item[0],
-                                              min(set(self.dictdf[item[0]].index)),
-                                              max(set(self.dictdf[item[0]].index))]],
-                                            columns=['ID', 'city', 'minDate', 'maxDate']))
-        indx.to_csv(route, sep=";", encoding='utf-8', index=False)
+    def save_as(self, route, fmt=None):
+        """
+        Записывает все города под новыми номерами и делает сохраненную базу текущей
+
+        :param route: Путь основного файла новой базы данных
+        :param fmt: формат хранения файлов городов
+        """
+        with self.lock, self.timings.span('save'):
+            storage = get_storage(fmt or self.format)
+            direct = '/'.join(route.split('/')[:-1]) + '/'
+            idx = next_id(direct) - 1
+            rows = []
+            for city in self.cityindex.index:
+                idx += 1
+                frame = self.dictdf[city]
+                write_atomic(storage, direct + '{0:03}'.format(idx), frame)
+                rows.append([idx, city, frame.index.min(), frame.index.max(), storage.name,
+                             self.cityindex['station'].get(city) if 'station' in self.cityindex.columns else None])
+            cityindex = pd.DataFrame(rows, columns=INDEX_COLUMNS).set_index('city')
+            write_index(route, cityindex)
+            self.cityindex = cityindex
+            self.route = route
+            self.directory = direct
+            self.format = storage.name
+            # правки из журнала прежней базы теперь записаны в новую, поэтому он больше не нужен
+            self.journal.clear()
+            self.journal = Journal(route + '.journal')
+            self.saved()
+
+    def save_changes(self):
+        """
+        Записывает на место только измененные города и обновляет индекс загруженной базы.
+        Правки из журнала при этом переносятся в основные файлы, и журнал очищается.
+        """
+        with self.lock, self.timings.span('save'):
+            self.write_changes()
+
+    def write_changes(self):
+        """
+        Записывает измененные города и индекс (вызывается под блокировкой).
+
+        Файлы удаленных городов удаляются последними, когда индекс уже на них не ссылается,
+        поэтому прерванное сохранение не оставляет в индексе городов без файлов.
+        """
+        for city in self.dirty:
+            if city in self.added:
+                self.cityindex.at[city, 'ID'] = next_id(self.directory)
+            frame = self.dictdf[city]
+            write_atomic(get_storage(city_format(self.cityindex, city)),
+                         self.directory + '{0:03}'.format(self.cityindex.at[city, 'ID']), frame)
+            self.cityindex.at[city, 'minDate'] = frame.index.min()
+            self.cityindex.at[city, 'maxDate'] = frame.index.max()
+        if self.dirty or self.removed:
+            write_index(self.route, self.cityindex)
+        for city in self.removed:
+            remove(get_storage(self.removed[city][1]), self.directory + '{0:03}'.format(self.removed[city][0]))
+        self.saved()
+
+    def saved(self):
+        """
+        Сбрасывает отметки об изменениях после сохранения
+        """
+        self.dirty = set()
+        self.added = set()
+        self.removed = {}
+        self.journal.clear()
+        if self.lazy:
+            self.dictdf.unpin_all()
 
     def load_data(self, route):
         """
         Загружает основной файл и сопутствующие ему файлы
 
+        :param route: Путь основного файла
+        """
+        with self.lock, self.timings.span('load'):
+            self.read_database(route)
+
+    def read_database(self, route):
+        """
+        Читает индекс и данные городов, затем проигрывает журнал несохраненных правок
+
         :param route: Путь основного файла
         """
         del self.dictdf
-        self.dictdf = {}
-        self.cityindex = pd.read_csv(route, encoding="utf-8", sep=";", index_col=u'city')
-        direct = '/'.join(route.split('/')[:-1]) + '/'
-        for row in self.cityindex.iterrows():
-            id_str = str(row[1]['ID']).zfill(3)
-            self.dictdf.update(
-                {row[0]: pd.read_csv(direct + id_str + ".csv", encoding="utf-8", sep=";").set_index('date')})
-            self.dictdf[row[0]].index = pd.to_datetime(self.dictdf[row[0]].index)
+        self.calendars = {}
+        self.rollups = {}
+        self.versions = {}
+        self.generation += 1
+        self.cache.clear()
+        self.table = None
+        self.cityindex = pd.read_csv(route, encoding="utf-8", sep=";", index_col=u'city', dtype={'station': str})
+        self.cityindex['minDate'] = pd.to_datetime(self.cityindex['minDate'], format='%Y-%m-%d')
+        self.cityindex['maxDate'] = pd.to_datetime(self.cityindex['maxDate'], format='%Y-%m-%d')
+        self.mindate = min(set(self.cityindex['minDate']))
+        self.maxdate = max(set(self.cityindex['maxDate']))
+        self.cityindex['ID'] = self.cityindex['ID'].astype(int)
+        self.route = route
+        self.directory = '/'.join(route.split('/')[:-1]) + '/'
+        self.dirty = set()
+        self.added = set()
+        self.removed = {}
+        self.format = city_format(self.cityindex, self.cityindex.index[0]) if len(self.cityindex) else 'csv'
+        if self.lazy:
+            limit = None if self.memory_limit is None else self.memory_limit - (self.cache.maxbytes or 0)
+            self.dictdf = FrameCache(self.read_city, self.cityindex.index, limit, on_evict=self.forget)
+        elif self.snapshot:
+            self.dictdf = self.read_snapshot(route)
+        else:
+            self.dictdf = self.read_cities()
+        self.journal = Journal(route + '.journal')
+        self.replaying = True
+        try:
+            self.journal.replay(self)
+        finally:
+            self.replaying = False
+
+    def read_snapshot(self, route):
+        """
+        Читает данные всех городов из снимка, а если снимок устарел - из файлов, после чего записывает новый снимок
+
+        :param route: Путь основного файла
+        :return: словарь датафреймов вида {город: датафрейм}
+        """
+        frames = load_snapshot(route, self.cityindex)
+        if frames is not None:
+            return frames
+        try:
+            stamp = sources(route, self.cityindex)
+        except OSError:
+            stamp = None
+        frames = self.read_cities()
+        if stamp is not None:
+            try:
+                save_snapshot(route, self.cityindex, frames, stamp)
+            except OSError:
+                # снимок только ускоряет запуск; если его нельзя записать, база загружается из файлов
+                pass
+        return frames
+
+    def read_cities(self):
+        """
+        Читает файлы всех городов индекса в пуле потоков.
+
+        Разбор CSV и чтение двоичных форматов в pandas и pyarrow большей частью
+        выполняются без GIL, поэтому потоки загружают файлы параллельно, а готовые
+        датафреймы не нужно передавать между процессами.
+
+        :return: словарь датафреймов вида {город: датафрейм} в порядке индекса
+        """
+        cities = list(self.cityindex.index)
+        workers = min(self.workers or os.cpu_count() or 1, len(cities))
+        if workers <= 1:
+            return {city: self.read_city(city) for city in cities}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(cities, executor.map(self.read_city, cities)))
+
+    def read_city(self, city):
+        """
+        Читает с диска файл с данными одного города
 
+        :param city: город из индекса базы данных
+        :return: датафрейм с данными города
+        """
+        id_str = str(self.cityindex.at[city, 'ID']).zfill(3)
+        return get_storage(city_format(self.cityindex, city)).read(self.directory + id_str)
+
+    def mark_dirty(self, city, date=None):
+        """
+        Отмечает город как измененный: его файл будет перезаписан при следующем сохранении,
+        а ленивый кэш не вытеснит его датафрейм до сохранения
+
+        :param city: город
+        :param date: дата измененного ряда; по ней пересчитываются агрегаты только одного месяца и года
+        """
+        self.dirty.add(city)
+        self.versions[city] = self.versions.get(city, 0) + 1
+        self.calendars.pop(city, None)
+        if date is not None and city in self.rollups:
+            self.rollups[city].update(self.dictdf[city], date)
+        else:
+            self.rollups.pop(city, None)
+        self.table = None
+        if self.lazy:
+            self.dictdf.pin(city)
+
+    def log(self, op, *args):
+        """
+        Записывает правку в журнал (кроме случаев, когда журнал сам проигрывается)
+
+        :param op: название метода правки
+        :param args: аргументы метода
+        """
+        if not self.replaying:
+            self.journal.append(op, *args)
 
     def insert_row(self, iid, values):
         """
         Вставляет новый ряд данных и, если необходимо, дополняет список городов
 
-        :param iid: координаты новой ячейки данных
-        :param values: значения ячейки
-        """
-        print(dt.datetime.strptime(str(iid.split()[0]), '%Y-%m-%d'))
-
-        ddf = pd.DataFrame.from_dict({0: [iid.split()[0]] + values[2:]}, orient='index',
-                                     columns=["date", "tempMax", "tempMin", "press", "wind", "falls"]).set_index('date')
-        ddf.index = pd.to_datetime(ddf.index)
-        if values[0] not in self.cityindex.keys():
-            self.cityindex = \
-                self.cityindex.append(pd.DataFrame([[max(self.cityindex['ID']) + 1, values[0],
-                                                     dt.datetime.strptime(iid.split()[0], '%Y-%m-%d'),
-                                                     dt.datetime.strptime(iid.split()[0], '%Y-%m-%d')]],
-                                                   columns=['ID', 'city', 'minDate', 'maxDate']).set_index('city'),
-                                      sort=False)
-            self.dictdf.update({values[0]: ddf})
-        else:
-            self.cityindex.at[iid.split()[1], 'minDate'] = min(self.cityindex.loc[iid.split()[1]]['minDate'],
-                                                               dt.datetime.strptime(iid.split()[0], '%Y-%m-%d'))
-            self.cityindex.at[iid.split()[1], 'maxDate'] = max(self.cityindex.loc[iid.split()[1]]['maxDate'],
-                                                               dt.datetime.strptime(iid.split()[0], '%Y-%m-%d'))
+        :param iid: координаты ячейки, после которой вставляется ряд
+        :param values: значения ячейки [город, дата ДД.ММ.ГГГГ, tempMax, tempMin, press, wind, falls]
+        :raises ValueError: если дата или значения записаны неверно (в журнал такая правка не попадает)
+        """
+        date = dt.datetime.strptime(values[1].replace('-', '.'), '%d.%m.%Y')
+        ddf = row_frame(date, values[2:])
+        with self.lock:
+            self.log('insert_row', iid, values)
+            self.insert(values[0], date, ddf)
+
+    def insert(self, city, date, ddf):
+        """
+        Вставляет ряд данных (вызывается под блокировкой)
 
-            self.dictdf[iid.split()[1]].update(ddf)
+        :param city: город
+        :param date: дата ряда
+        :param ddf: датафрейм ряда (см. row_frame)
+        """
+        if city not in self.cityindex.index:
+            self.cityindex = pd.concat([self.cityindex, pd.DataFrame(
+                [[max(self.cityindex['ID'], default=0) + 1, city, date, date, self.format, None]],
+                columns=INDEX_COLUMNS).set_index('city')], sort=False)
+            self.dictdf[city] = ddf
+            self.added.add(city)
+        else:
+            self.cityindex.at[city, 'minDate'] = min(self.cityindex.loc[city]['minDate'], date)
+            self.cityindex.at[city, 'maxDate'] = max(self.cityindex.loc[city]['maxDate'], date)
+            frame = self.dictdf[city]
+            self.dictdf[city] = pd.concat([frame.drop(date, errors='ignore'), ddf]).sort_index()
+        self.mark_dirty(city, date)
 
     def update_row(self, iid, values):
         """
@@ -150,23 +625,126 @@ class Data:
 
         :param iid: координаты ячейки данных
         :param values: новые значения ячейки
+        :raises ValueError: если значения записаны неверно (в журнал такая правка не попадает)
+        :raises KeyError: если такого ряда нет
         """
-
-        ddf = pd.DataFrame.from_dict({0: [iid.split()[0]] + values[2:]}, orient='index',
-                                     columns=["date", "tempMax", "tempMin", "press", "wind", "falls"]).set_index('date')
-        self.dictdf[iid.split()[1]].update(ddf)
+        city = iid.split()[1]
+        date = dt.datetime.strptime(iid.split()[0], '%Y-%m-%d')
+        row = row_frame(date, values[2:]).iloc[0].to_numpy()
+        with self.lock:
+            frame = self.dictdf[city]
+            if date not in frame.index:
+                raise KeyError(iid)
+            self.log('update_row', iid, values)
+            # копия нужна, потому что столбцы могут быть отображены в память только для чтения
+            frame = frame.copy()
+            frame.loc[date, VALUE_COLUMNS] = row
+            self.dictdf[city] = frame
+            self.mark_dirty(city, date)
 
     def delete_row(self, item):
         """
         Удаляет ряд из базы данных
 
         :param item: координаты ряда
+        :raises KeyError: если такого ряда нет
         """
-        print(item)
-        self.dictdf[item.split()[1]] = self.dictdf[item.split()[1]].drop(
-            dt.datetime.strptime(item.split()[0], '%Y-%m-%d'), axis='index')
-        if self.dictdf[item.split()[1]].size == 0:
-            self.cityindex = self.cityindex.drop(item.split()[1])
-            self.dictdf.pop(item.split()[1])
-            # print(self.dictdf)
-        pass
+        city = item.split()[1]
+        date = dt.datetime.strptime(item.split()[0], '%Y-%m-%d')
+        with self.lock:
+            frame = self.dictdf[city].drop(date, axis='index')
+            self.log('delete_row', item)
+            self.dictdf[city] = frame
+            self.mark_dirty(city, date)
+            if self.dictdf[city].size == 0:
+                if city not in self.added:
+                    self.removed[city] = (self.cityindex.at[city, 'ID'], city_format(self.cityindex, city))
+                self.cityindex = self.cityindex.drop(city)
+                self.dictdf.pop(city)
+                self.rollups.pop(city, None)
+                self.dirty.discard(city)
+                self.added.discard(city)
+
+
+def freeze(filters):
+    """
+    Переводит фильтры в хешируемый вид для ключа кэша
+
+    :param filters: список из фильтров
+    :return: кортеж
+    """
+    result = []
+    for value in filters:
+        if isinstance(value, (set, frozenset)):
+            value = tuple(sorted(value))
+        elif isinstance(value, list):
+            value = tuple(value)
+        result.append(value)
+    return tuple(result)
+
+
+def date_key(value):
+    """
+    Переводит границу диапазона дат в ключ вида ГГГГММДД
+
+    :param value: дата (ДД.ММ.ГГГГ, ДД-ММ-ГГГГ, ГГГГ-ММ-ДД, date, datetime или Timestamp), 'Все', '' или None
+    :return: ключ или None, если граница не задана
+    :raises ValueError: если дата записана неверно
+    """
+    if value is None or (isinstance(value, str) and value.strip() in ('', 'Все')):
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        for fmt in ('%d.%m.%Y', '%d-%m-%Y', '%Y-%m-%d'):
+            try:
+                value = dt.datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                pass
+        else:
+            raise ValueError('Неверная дата: ' + value)
+    return value.year * 10000 + value.month * 100 + value.day
+
+
+def year_range(year, start, end):
+    """
+    Определяет годы, в которые могут попасть данные по фильтрам
+
+    :param year: год или None
+    :param start: ключ ГГГГММДД начала диапазона или None
+    :param end: ключ ГГГГММДД конца диапазона или None
+    :return: (первый год или None, последний год или None)
+    """
+    first, last = (year, year) if year is not None else (None, None)
+    if start is not None:
+        first = max(first or 0, start // 10000)
+    if end is not None:
+        last = min(last if last is not None else end // 10000, end // 10000)
+    return first, last
+
+
+def concat_frames(frames):
+    """
+    Объединяет части данных города в один датафрейм
+
+    :param frames: список датафреймов с индексом по дате
+    :return: датафрейм (пустой с обычными столбцами, если частей нет)
+    """
+    if not frames:
+        return pd.DataFrame(columns=VALUE_COLUMNS, index=pd.DatetimeIndex([], name='date'), dtype=VALUE_DTYPE)
+    return frames[0] if len(frames) == 1 else pd.concat(frames)
+
+
+def row_frame(date, values):
+    """
+    Строит датафрейм из одного ряда данных
+
+    :param date: дата ряда
+    :param values: значения [tempMax, tempMin, press, wind, falls]; пустое значение означает пропуск
+    :return: датафрейм с индексом по дате и столбцами float32
+    :raises ValueError: если значение не является числом
+    """
+    values = [float('nan') if value is None or str(value).strip() == '' else float(str(value).replace(',', '.'))
+              for value in values]
+    return pd.DataFrame([values], index=pd.DatetimeIndex([date], name='date'), columns=VALUE_COLUMNS,
+                        dtype=VALUE_DTYPE)
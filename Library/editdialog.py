@@ -126,4 +126,4 @@ class EditDialog(tk.Toplevel):
         :return: список данных полей
         """
         return [self.text_city.get(), self.text_date.get(), self.text_max_temp.get(), self.text_min_temp.get(),
-                self.text_press.get(), int(self.text_wind.get()), int(self.text_falls.get())]
+                self.text_press.get(), self.text_wind.get(), self.text_falls.get()]
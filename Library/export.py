@@ -0,0 +1,149 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Library.analytics import format_report
+from Library.charts import ChartRenderer, build_chart
+from Library.data import Data
+from Library.storage import next_id
+
+# данные, загруженные в процессе-исполнителе (см. init_worker)
+worker_data = None
+
+
+def read_specs(path):
+    """
+    Читает список фильтров из текстового файла.
+
+    Каждая строка имеет вид "город;день;месяц;год", где вместо любого значения
+    можно указать "Все" или "*"; пустые строки и строки, начинающиеся с #, пропускаются.
+
+    :param path: путь файла
+    :return: список фильтров вида [город, день, месяц, год]
+    """
+    specs = []
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            parts = [part.strip() for part in line.split(';')]
+            if len(parts) != 4:
+                raise ValueError('{0}:{1}: ожидается строка вида "город;день;месяц;год"'.format(path, number))
+            specs.append(['Все' if part in ('', '*') else part for part in parts])
+    return specs
+
+
+def city_specs(cities, year=None):
+    """
+    Строит фильтры "весь период (или один год) в каждом городе"
+
+    :param cities: список городов
+    :param year: год или None (все годы)
+    :return: список фильтров
+    """
+    return [[city, 'Все', 'Все', 'Все' if year is None else str(year)] for city in cities]
+
+
+def init_worker(route):
+    """
+    Загружает базу данных в процессе-исполнителе (один раз на процесс)
+
+    :param route: путь основного файла базы данных
+    """
+    global worker_data
+    worker_data = Data(route, lazy=True)
+
+
+def render(task):
+    """
+    Строит диаграмму и текстовый отчет для одного фильтра (выполняется в процессе-исполнителе)
+
+    :param task: (номер, фильтры, столбец, каталог, dpi)
+    :return: словарь со сведениями о записанных файлах
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    number, filters, column, output, dpi = task
+    started = time.perf_counter()
+    result = {'number': number, 'filters': filters, 'column': column, 'chart': None, 'report': None}
+    try:
+        df = worker_data.get_data(filters)
+    except KeyError:
+        result['error'] = 'Нет города ' + filters[0]
+        return result
+    except (ValueError, IndexError) as error:
+        result['error'] = 'Неверный фильтр: {0}'.format(error)
+        return result
+    try:
+        chart = build_chart(worker_data, df, filters, column)
+    except IndexError:
+        chart = None
+    if chart is not None:
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        ChartRenderer(fig).render(chart)
+        result['chart'] = os.path.join(output, '{0:03}.png'.format(number))
+        fig.savefig(result['chart'], dpi=dpi)
+    result['report'] = os.path.join(output, '{0:03}.txt'.format(number))
+    with open(result['report'], 'w', encoding='utf-8') as f:
+        saved_to = '{0}, список отчетов - manifest.csv'.format(os.path.basename(result['report']))
+        f.write(' '.join(filters) + '\n' + format_report(worker_data.extremes(filters), saved_to))
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def export(route, specs, output, column='tempMax', workers=None, dpi=100, on_result=None):
+    """
+    Строит диаграммы и отчеты для списка фильтров без графического интерфейса.
+
+    Работа распределяется по пулу процессов; каждый процесс один раз загружает
+    базу данных в ленивом режиме. Номера файлов NNN.png и NNN.txt назначаются
+    заранее, начиная с первого свободного номера в каталоге, поэтому все файлы
+    записываются за один проход и не перезаписывают прежние результаты.
+    Соответствие номеров фильтрам дописывается в manifest.csv; если для фильтра
+    ничего не построено (неизвестный город, неверный день, месяц или год), причина
+    записывается в столбец error, а остальные фильтры обрабатываются как обычно.
+
+    :param route: путь основного файла базы данных
+    :param specs: список фильтров вида [город, день, месяц, год]
+    :param output: каталог для результатов
+    :param column: столбец, по которому строятся диаграммы
+    :param workers: количество процессов (None - по числу процессоров, 1 - без пула)
+    :param dpi: разрешение изображений
+    :param on_result: функция, получающая словарь со сведениями о каждом результате
+    :return: список словарей со сведениями о результатах
+    """
+    os.makedirs(output, exist_ok=True)
+    first = next_id(output)
+    tasks = [(first + i, list(spec), column, output, dpi) for i, spec in enumerate(specs)]
+    results = []
+    if workers == 1:
+        init_worker(route)
+        outputs = map(render, tasks)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(route,))
+        outputs = executor.map(render, tasks, chunksize=max(1, len(tasks) // (4 * (workers or os.cpu_count() or 1))))
+    try:
+        with open(os.path.join(output, 'manifest.csv'), 'a+', encoding='utf-8') as manifest:
+            manifest.seek(0)
+            header = manifest.readline().rstrip('\n')
+            if not header:
+                header = 'number;city;day;month;year;column;chart;report;error'
+                manifest.write(header + '\n')
+            # в манифестах прежних версий нет столбца error
+            errors = header.endswith(';error')
+            for result in outputs:
+                row = ['{0:03}'.format(result['number'])] + result['filters'] + \
+                    [column, result['chart'] or '', result['report'] or '']
+                if errors:
+                    row.append(result.get('error', '').replace(';', ','))
+                manifest.write(';'.join(row) + '\n')
+                results.append(result)
+                if on_result is not None:
+                    on_result(result)
+    finally:
+        if workers != 1:
+            executor.shutdown()
+    return results
@@ -0,0 +1,203 @@
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping, MutableMapping
+
+
+class FrameCache(MutableMapping):
+    """
+    Словарь датафреймов городов с ленивой загрузкой.
+
+    Датафрейм города читается с диска только при первом обращении к нему.
+    Когда суммарный объем загруженных датафреймов превышает лимит памяти,
+    вытесняются те, к которым дольше всего не обращались. Измененные
+    датафреймы закрепляются и не вытесняются, пока не будут сохранены.
+
+    Кэш можно читать из нескольких потоков: поиск, вставка и вытеснение
+    выполняются под блокировкой, а сам файл города читается вне ее, чтобы
+    потоки, запрашивающие разные города, не ждали друг друга.
+    """
+    def __init__(self, loader, cities, memory_limit=None, on_evict=None):
+        """
+        Конструктор кэша
+
+        :param loader: функция, загружающая датафрейм города по его имени
+        :param cities: список городов, имеющихся в базе данных
+        :param memory_limit: лимит памяти в байтах (None - без ограничений)
+        :param on_evict: функция, которая вызывается с именем вытесненного города, чтобы освободить
+                         построенные по его датафрейму структуры; вызывается вне блокировки кэша
+        """
+        self.loader = loader
+        self.memory_limit = memory_limit
+        self.on_evict = on_evict
+        self.cities = dict.fromkeys(cities)
+        self.frames = OrderedDict()
+        self.sizes = {}
+        self.pinned = set()
+        self.lock = threading.RLock()
+
+    def __getitem__(self, city):
+        with self.lock:
+            frame = self.frames.get(city)
+            if frame is not None:
+                self.frames.move_to_end(city)
+                return frame
+            if city not in self.cities:
+                raise KeyError(city)
+        frame = self.loader(city)
+        evicted = []
+        with self.lock:
+            if city in self.frames:
+                # пока файл читался, город загрузил другой поток
+                self.frames.move_to_end(city)
+                return self.frames[city]
+            if city in self.cities:
+                evicted = self.store(city, frame)
+        self.notify(evicted)
+        return frame
+
+    def __setitem__(self, city, frame):
+        with self.lock:
+            self.cities[city] = None
+            evicted = self.store(city, frame)
+            self.pinned.add(city)
+        self.notify(evicted)
+
+    def __delitem__(self, city):
+        with self.lock:
+            del self.cities[city]
+            self.frames.pop(city, None)
+            self.sizes.pop(city, None)
+            self.pinned.discard(city)
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.cities))
+
+    def __len__(self):
+        return len(self.cities)
+
+    def __contains__(self, city):
+        return city in self.cities
+
+    def store(self, city, frame):
+        """
+        Помещает датафрейм в кэш и при необходимости вытесняет старые
+
+        :param city: город
+        :param frame: датафрейм города
+        :return: список вытесненных городов
+        """
+        size = int(frame.memory_usage(index=True, deep=True).sum())
+        with self.lock:
+            self.frames[city] = frame
+            self.frames.move_to_end(city)
+            self.sizes[city] = size
+            return self.evict(keep=city)
+
+    def evict(self, keep=None):
+        """
+        Вытесняет давно не использованные датафреймы, пока не будет соблюден лимит памяти
+
+        :param keep: город, который нельзя вытеснять (только что загруженный)
+        :return: список вытесненных городов
+        """
+        evicted = []
+        if self.memory_limit is None:
+            return evicted
+        with self.lock:
+            for city in list(self.frames):
+                if self.memory_usage() <= self.memory_limit:
+                    break
+                if city != keep and city not in self.pinned:
+                    self.frames.pop(city)
+                    self.sizes.pop(city)
+                    evicted.append(city)
+        return evicted
+
+    def notify(self, evicted):
+        """
+        Сообщает о вытесненных городах функции on_evict (вызывается вне блокировки)
+
+        :param evicted: список вытесненных городов
+        """
+        if self.on_evict is not None:
+            for city in evicted:
+                self.on_evict(city)
+
+    def resident(self, city, frame):
+        """
+        Проверяет, что датафрейм города находится в кэше
+
+        :param city: город
+        :param frame: датафрейм
+        :return: True, если в кэше хранится именно этот датафрейм
+        """
+        with self.lock:
+            return self.frames.get(city) is frame
+
+    def pin(self, city):
+        """
+        Закрепляет датафрейм города в памяти (например, после его изменения)
+
+        :param city: город
+        """
+        with self.lock:
+            if city in self.frames:
+                self.pinned.add(city)
+
+    def unpin_all(self):
+        """
+        Снимает закрепление со всех датафреймов (например, после сохранения)
+        """
+        with self.lock:
+            self.pinned.clear()
+            evicted = self.evict()
+        self.notify(evicted)
+
+    def loaded(self):
+        """
+        Возвращает список городов, датафреймы которых сейчас находятся в памяти
+
+        :return: список городов
+        """
+        with self.lock:
+            return list(self.frames)
+
+    def memory_usage(self):
+        """
+        Возвращает объем памяти, занимаемый загруженными датафреймами
+
+        :return: объем в байтах
+        """
+        with self.lock:
+            return sum(self.sizes.values())
+
+
+class Selection(Mapping):
+    """
+    Результат запроса в режиме out_of_core: словарь датафреймов городов,
+    которые вычисляются при каждом обращении и нигде не хранятся.
+
+    Поэтому результат запроса по всей базе не занимает памяти, пока его
+    не перебирают, а при переборе в памяти находится один город.
+    """
+    def __init__(self, loader, cities):
+        """
+        Конструктор результата
+
+        :param loader: функция, возвращающая датафрейм города, отобранный фильтрами
+        :param cities: список городов результата
+        """
+        self.loader = loader
+        self.cities = list(cities)
+
+    def __getitem__(self, city):
+        if city not in self.cities:
+            raise KeyError(city)
+        return self.loader(city)
+
+    def __iter__(self):
+        return iter(self.cities)
+
+    def __len__(self):
+        return len(self.cities)
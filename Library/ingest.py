@@ -0,0 +1,456 @@
+import datetime as dt
+import http.client as hclient
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+from pandas import DataFrame
+
+from Library.archiveparser import COLUMNS, parse_stream
+from Library.storage import INDEX_COLUMNS, city_format, get_storage, next_id, write_atomic, write_index
+
+# станции, которые скачивались в исходную базу данных: [код станции, город]
+STATIONS = [['325830', 'Петропавловск-Камчатский'], ['319600', 'Владивосток'], ['249590', 'Якутск'],
+            ['307100', 'Иркутск'], ['286980', 'Омск'], ['287220', 'Уфа'], ['295700', 'Красноярск'],
+            ['349290', 'Краснодар'], ['276120', 'Москва'], ['260630', 'Санкт-Петербург'], ['225500', 'Архангельск'],
+            ['221130', 'Мурманск'], ['267020', 'Калининград']]
+
+
+class Downloader:
+    """
+    Загрузчик архива погоды.
+
+    Станции и интервалы дат скачиваются параллельно в пуле потоков. Каждый поток
+    держит собственное постоянное (keep-alive) соединение с сервером, неудачные
+    запросы повторяются с экспоненциальной задержкой, а части данных станции
+    объединяются одним pd.concat в конце.
+    """
+    def __init__(self, host="pogoda-service.ru", port=80, workers=4, retries=3, backoff=1.0, window=365,
+                 timeout=60, record=None):
+        """
+        Конструктор загрузчика
+
+        :param host: адрес сервера архива
+        :param port: порт сервера
+        :param workers: количество одновременных запросов
+        :param retries: количество повторов неудачного запроса
+        :param backoff: начальная задержка перед повтором в секундах (удваивается с каждым повтором)
+        :param window: длина интервала дат одного запроса в днях
+        :param timeout: таймаут соединения в секундах
+        :param record: каталог, в который сохраняются полученные страницы (например, для бенчмарков)
+        """
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.window = dt.timedelta(days=window)
+        self.timeout = timeout
+        self.record = record
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.retried = 0
+
+    def connection(self):
+        """
+        Возвращает постоянное соединение текущего потока, открывая его при необходимости
+        """
+        if getattr(self.local, 'connection', None) is None:
+            self.local.connection = hclient.HTTPConnection(self.host, port=self.port, timeout=self.timeout)
+        return self.local.connection
+
+    def reset(self):
+        """
+        Закрывает соединение текущего потока (после ошибки оно будет открыто заново)
+        """
+        if getattr(self.local, 'connection', None) is not None:
+            self.local.connection.close()
+            self.local.connection = None
+
+    def fetch_page(self, station, data_begin, data_end):
+        """
+        Запрашивает страницу архива станции за интервал дат и разбирает ее по мере получения
+
+        :param station: код станции
+        :param data_begin: начальная дата
+        :param data_end: конечная дата
+        :return: датафрейм с данными страницы
+        """
+        headers = {'Content-Type': 'application/x-www-form-urlencoded', 'Connection': 'keep-alive'}
+        body = "country=RU&station=" + station + "&datepicker_beg=" + data_begin.strftime('%d.%m.%Y') + \
+               "&datepicker_end=" + data_end.strftime('%d.%m.%Y')
+        for attempt in range(self.retries + 1):
+            try:
+                with self.lock:
+                    self.requests += 1
+                con = self.connection()
+                con.request("POST", "/archive_gsod_res.php", body, headers)
+                response = con.getresponse()
+                if response.status != 200:
+                    response.read()
+                    raise hclient.HTTPException('HTTP ' + str(response.status))
+                if self.record is None:
+                    df = parse_stream(response)
+                else:
+                    name = '{0}_{1:%Y%m%d}_{2:%Y%m%d}.html'.format(station, data_begin, data_end)
+                    with open(os.path.join(self.record, name), 'wb') as record:
+                        df = parse_stream(response, record=record)
+                if response.getheader('Connection', '').lower() == 'close':
+                    self.reset()
+                return df
+            except (OSError, hclient.HTTPException):
+                self.reset()
+                if attempt == self.retries:
+                    raise
+                with self.lock:
+                    self.retried += 1
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def fetch_window(self, station, begin, end):
+        """
+        Скачивает данные станции за интервал дат. Если сервер вернул не весь интервал,
+        запрашивает оставшуюся часть.
+
+        :param station: код станции
+        :param begin: начальная дата
+        :param end: конечная дата
+        :return: список датафреймов с частями данных
+        """
+        parts = []
+        date = begin
+        while date <= end:
+            part = self.fetch_page(station, date, end)
+            if part.empty:
+                break
+            parts.append(part)
+            last = part['date'].iloc[-1].date()
+            if last < date:
+                break
+            date = last + dt.timedelta(days=1)
+        return parts
+
+    def download(self, stations, begin, end, on_station=None):
+        """
+        Параллельно скачивает данные нескольких станций за общий интервал дат
+
+        :param stations: список кодов станций
+        :param begin: начальная дата
+        :param end: конечная дата
+        :param on_station: функция (код станции, датафрейм), вызываемая, как только станция скачана полностью
+        :return: словарь вида {код станции: датафрейм}
+        """
+        return self.download_ranges({station: (begin, end) for station in stations}, on_station)
+
+    def download_ranges(self, ranges, on_station=None):
+        """
+        Параллельно скачивает данные станций, у каждой из которых свой интервал дат
+
+        :param ranges: словарь вида {код станции: (начальная дата, конечная дата)}
+        :param on_station: функция (код станции, датафрейм), вызываемая, как только станция скачана полностью
+        :return: словарь вида {код станции: датафрейм}
+        """
+        jobs = {}
+        parts = {station: [] for station in ranges}
+        remaining = {station: 0 for station in ranges}
+        result = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for station, (begin, end) in ranges.items():
+                date = begin
+                while date <= end:
+                    window_end = min(date + self.window - dt.timedelta(days=1), end)
+                    jobs[executor.submit(self.fetch_window, station, date, window_end)] = (station, date)
+                    remaining[station] += 1
+                    date = window_end + dt.timedelta(days=1)
+            for station in ranges:
+                if remaining[station] == 0:
+                    result[station] = self.assemble(station, parts[station], on_station)
+            for future in as_completed(jobs):
+                station, date = jobs[future]
+                parts[station].append((date, future.result()))
+                remaining[station] -= 1
+                if remaining[station] == 0:
+                    result[station] = self.assemble(station, parts[station], on_station)
+        return result
+
+    @staticmethod
+    def assemble(station, parts, on_station):
+        """
+        Объединяет скачанные части данных станции одним pd.concat
+
+        :param station: код станции
+        :param parts: список пар (начальная дата интервала, список датафреймов)
+        :param on_station: функция (код станции, датафрейм) или None
+        :return: датафрейм станции, отсортированный по дате
+        """
+        frames = [frame for _, chunk in sorted(parts, key=lambda x: x[0]) for frame in chunk]
+        df = pd.concat(frames, ignore_index=True, sort=False) if frames else DataFrame(columns=COLUMNS)
+        df['date'] = pd.to_datetime(df['date'])
+        df.drop_duplicates('date', keep='first', inplace=True)
+        df = df.sort_values('date').reset_index(drop=True)
+        if on_station is not None:
+            on_station(station, df)
+        return df
+
+
+def read_stations(path):
+    """
+    Читает список станций из текстового файла.
+
+    Каждая строка файла имеет вид "код;город"; пустые строки и строки,
+    начинающиеся с #, пропускаются.
+
+    :param path: путь файла
+    :return: список станций вида [[код, город]]
+    """
+    stations = []
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            parts = [part.strip() for part in line.split(';')]
+            if len(parts) != 2 or not all(parts):
+                raise ValueError('{0}:{1}: ожидается строка вида "код;город"'.format(path, number))
+            stations.append(parts)
+    return stations
+
+
+def open_index(route):
+    """
+    Читает индекс базы данных; если базы еще нет, создает пустой индекс
+
+    :param route: путь основного файла базы данных
+    :return: индекс с городами в качестве индекса датафрейма
+    """
+    if not os.path.exists(route):
+        return DataFrame(columns=INDEX_COLUMNS).set_index('city')
+    cityindex = pd.read_csv(route, encoding="utf-8", sep=";", index_col=u'city', dtype={'station': str})
+    cityindex['minDate'] = pd.to_datetime(cityindex['minDate'], format='%Y-%m-%d')
+    cityindex['maxDate'] = pd.to_datetime(cityindex['maxDate'], format='%Y-%m-%d')
+    if 'station' not in cityindex.columns:
+        cityindex['station'] = None
+    return cityindex
+
+
+def last_date(storage, path):
+    """
+    Возвращает последнюю дату, записанную в файл города.
+
+    CSV-файл не читается целиком: разбираются только строки в его конце. Последняя строка
+без перевода строки (обрезанная при прерванной записи) не учитывается.
+
+    :param storage: хранилище
+    :param path: путь файла без расширения
+    :return: pd.Timestamp или None, если файла нет или в нем нет данных
+    """
+    if storage.name != 'csv':
+        try:
+            frame = storage.read(path)
+        except OSError:
+            return None
+        return frame.index.max() if len(frame) else None
+    try:
+        end = complete_size(path + storage.extension)
+        with open(path + storage.extension, 'rb') as f:
+            f.seek(max(0, end - 4096))
+            lines = f.read(end - f.tell()).decode('utf-8', errors='ignore').splitlines()
+    except OSError:
+        return None
+    for line in reversed(lines):
+        try:
+            return pd.Timestamp(dt.datetime.strptime(line.split(';')[0].strip(), '%Y-%m-%d'))
+        except ValueError:
+            # заголовок
+            continue
+    return None
+
+
+def complete_size(path):
+    """
+    Возвращает размер начала файла, состоящего из целых строк (по последний перевод строки включительно)
+
+    :param path: путь файла
+    :return: размер в байтах
+    """
+    with open(path, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - 4096)
+            f.seek(start)
+            position = f.read(end - start).rfind(b'\n')
+            if position >= 0:
+                return start + position + 1
+            end = start
+    return 0
+
+
+def drop_partial_line(path):
+    """
+    Обрезает файл по последнюю целую строку, удаляя строку, оборванную при прерванной записи,
+    чтобы дописываемые строки не склеились с ней
+
+    :param path: путь файла
+    """
+    size = complete_size(path)
+    if size < os.path.getsize(path):
+        os.truncate(path, size)
+
+
+def download(route, stations, downloader, startdate, enddate, on_progress=None):
+    """
+    Скачивает данные станций за интервал дат целиком и записывает их в базу данных.
+
+    Если база данных (или ее каталог) еще не существует, она создается. Данные
+    города, который уже есть в индексе, перезаписываются в его же файл, новые
+    города получают свободные номера файлов. Индекс обновляется после каждой
+    скачанной станции.
+
+    :param route: путь основного файла базы данных
+    :param stations: список станций вида [[код, город]]
+    :param downloader: экземпляр Downloader
+    :param startdate: начальная дата
+    :param enddate: конечная дата
+    :param on_progress: функция, получающая словарь со сведениями о каждой записанной станции
+    :return: словарь со статистикой загрузки
+    """
+    direct = os.path.dirname(route) or '.'
+    os.makedirs(direct, exist_ok=True)
+    cityindex = open_index(route)
+    cities = {code: city for code, city in stations}
+    progress = Progress(len(stations), downloader, on_progress)
+
+    def store(code, df):
+        city = cities[code]
+        if city in cityindex.index:
+            storage = get_storage(city_format(cityindex, city))
+            idx = cityindex.at[city, 'ID']
+        else:
+            storage = get_storage('csv')
+            idx = next_id(direct)
+        if not df.empty:
+            write_atomic(storage, os.path.join(direct, '{0:03}'.format(idx)), df.set_index('date'))
+            cityindex.loc[city] = pd.Series({'ID': idx, 'minDate': df['date'].min(), 'maxDate': df['date'].max(),
+                                             'format': storage.name, 'station': code})
+            write_index(route, cityindex)
+        progress.station(code, city, len(df))
+
+    downloader.download([code for code, _ in stations], startdate, enddate, store)
+    write_index(route, cityindex)
+    return progress.finish()
+
+
+def sync(route, stations, downloader, enddate, startdate=dt.date(2000, 1, 1), on_progress=None):
+    """
+    Докачивает только недостающие данные станций и дописывает их в существующие файлы.
+
+    Для каждой станции запрашиваются даты после последней даты в ее файле. Новые строки
+    дописываются в конец файла станции, не перезаписывая историю, после чего
+    индекс сразу же обновляется. Если синхронизация прервется (в том числе между
+    записью файла и индекса), повторный запуск продолжит с последней записанной
+    даты и не допишет повторяющиеся строки.
+
+    :param route: путь основного файла базы данных
+    :param stations: список станций вида [[код, город]]
+    :param downloader: экземпляр Downloader
+    :param enddate: дата, до которой нужно докачать данные
+    :param startdate: начальная дата для станций, которых еще нет в индексе
+    :param on_progress: функция, получающая словарь со сведениями о каждой записанной станции
+    :return: словарь со статистикой загрузки
+    """
+    direct = os.path.dirname(route) or '.'
+    os.makedirs(direct, exist_ok=True)
+    cityindex = open_index(route)
+    cities = {}
+    ranges = {}
+    for code, city in stations:
+        cities[code] = city
+        if city in cityindex.index:
+            cityindex.at[city, 'station'] = code
+            last = last_date(get_storage(city_format(cityindex, city)),
+                             os.path.join(direct, '{0:03}'.format(cityindex.at[city, 'ID'])))
+            if last is not None and last > cityindex.at[city, 'maxDate']:
+                # файл дописан, а индекс обновить не успели
+                cityindex.at[city, 'maxDate'] = last
+            begin = cityindex.at[city, 'maxDate'].date() + dt.timedelta(days=1)
+        else:
+            begin = startdate
+        if begin <= enddate:
+            ranges[code] = (begin, enddate)
+    progress = Progress(len(ranges), downloader, on_progress)
+
+    def merge(code, df):
+        city = cities[code]
+        if city in cityindex.index:
+            df = df[df['date'] > cityindex.at[city, 'maxDate']]
+        if df.empty:
+            progress.station(code, city, 0)
+            return
+        if city in cityindex.index:
+            storage = get_storage(city_format(cityindex, city))
+            path = os.path.join(direct, '{0:03}'.format(cityindex.at[city, 'ID']))
+            if storage.name == 'csv':
+                drop_partial_line(path + storage.extension)
+                df.to_csv(path + storage.extension, sep=";", index=False, header=False, mode='a',
+                          encoding='utf-8', date_format='%Y-%m-%d')
+            else:
+                write_atomic(storage, path, pd.concat([storage.read(path), df.set_index('date')]))
+            cityindex.at[city, 'maxDate'] = df['date'].max()
+        else:
+            idx = next_id(direct)
+            df.to_csv(os.path.join(direct, '{0:03}'.format(idx) + '.csv'), sep=";", index=False, encoding='utf-8')
+            cityindex.loc[city] = pd.Series({'ID': idx, 'minDate': df['date'].min(), 'maxDate': df['date'].max(),
+                                             'format': 'csv', 'station': code})
+        write_index(route, cityindex)
+        progress.station(code, city, len(df))
+
+    downloader.download_ranges(ranges, merge)
+    write_index(route, cityindex)
+    return progress.finish()
+
+
+class Progress:
+    """
+    Учет хода загрузки: сколько станций и строк записано, сколько сделано запросов
+    """
+    def __init__(self, total, downloader, on_progress=None):
+        """
+        Конструктор
+
+        :param total: количество станций, которые нужно скачать
+        :param downloader: экземпляр Downloader, из которого берется число запросов
+        :param on_progress: функция, получающая словарь со сведениями о каждой записанной станции
+        """
+        self.total = total
+        self.downloader = downloader
+        self.on_progress = on_progress
+        self.done = 0
+        self.rows = 0
+        self.started = time.perf_counter()
+
+    def station(self, code, city, rows):
+        """
+        Отмечает, что станция скачана и записана
+
+        :param code: код станции
+        :param city: город
+        :param rows: количество записанных строк
+        """
+        self.done += 1
+        self.rows += rows
+        if self.on_progress is not None:
+            self.on_progress({'event': 'station', 'station': code, 'city': city, 'rows': rows,
+                              'done': self.done, 'total': self.total,
+                              'seconds': round(time.perf_counter() - self.started, 3)})
+
+    def finish(self):
+        """
+        Возвращает итоговую статистику загрузки
+
+        :return: словарь со статистикой
+        """
+        return {'event': 'done', 'stations': self.done, 'rows': self.rows,
+                'requests': self.downloader.requests, 'retries': self.downloader.retried,
+                'seconds': round(time.perf_counter() - self.started, 3)}
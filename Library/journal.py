@@ -0,0 +1,80 @@
+import json
+import os
+
+
+class Journal:
+    """
+    Журнал изменений базы данных (write-ahead log).
+
+    Каждая правка (вставка, изменение или удаление ряда) дописывается в конец
+    файла одной строкой JSON. При загрузке базы журнал проигрывается заново,
+    поэтому несохраненные правки переживают аварийное завершение программы.
+    После того как правки записаны в основные файлы, журнал очищается.
+    """
+    def __init__(self, path, sync=True):
+        """
+        Конструктор журнала
+
+        :param path: путь файла журнала
+        :param sync: вызывать fsync после каждой записи
+        """
+        self.path = path
+        self.sync = sync
+        self.size = 0
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.size = sum(1 for line in f if line.strip())
+
+    def append(self, op, *args):
+        """
+        Дописывает правку в журнал
+
+        :param op: название метода Data ('insert_row', 'update_row' или 'delete_row')
+        :param args: аргументы метода
+        """
+        line = json.dumps({'op': op, 'args': args}, ensure_ascii=False, default=str)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+            f.flush()
+            if self.sync:
+                os.fsync(f.fileno())
+        self.size += 1
+
+    def entries(self):
+        """
+        Возвращает записанные правки. Недописанная последняя строка (после сбоя) пропускается.
+
+        :return: список пар (название метода, список аргументов)
+        """
+        if not os.path.exists(self.path):
+            return []
+        result = []
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                result.append((entry['op'], entry['args']))
+        return result
+
+    def replay(self, data):
+        """
+        Применяет записанные правки к базе данных
+
+        :param data: экземпляр Data
+        """
+        for op, args in self.entries():
+            try:
+                getattr(data, op)(*args)
+            except (KeyError, ValueError):
+                # правка уже была перенесена в основные файлы до сбоя
+                pass
+
+    def clear(self):
+        """
+        Очищает журнал после переноса правок в основные файлы
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.size = 0
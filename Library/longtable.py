@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+
+class LongTable:
+    """
+    Сводная таблица данных всех городов в длинном формате.
+
+    Все станции хранятся в одном датафрейме с мультииндексом (город, дата),
+    где город - категориальный уровень, а строки отсортированы по городу и дате.
+    Благодаря этому запросы по нескольким городам и агрегаты выполняются
+    одной векторной операцией, а не циклом по городам.
+    """
+    def __init__(self, frames):
+        """
+        Конструктор таблицы
+
+        :param frames: словарь датафреймов вида {город: датафрейм}
+        """
+        self.cities = list(frames)
+        if self.cities:
+            table = pd.concat([frames[city] for city in self.cities], keys=self.cities, names=['city', 'date'])
+        else:
+            table = pd.DataFrame(index=pd.MultiIndex.from_arrays([[], pd.DatetimeIndex([])], names=['city', 'date']))
+        table = table.reset_index()
+        table['city'] = pd.Categorical(table['city'], categories=self.cities)
+        self.table = table.set_index(['city', 'date']).sort_index()
+        dates = self.table.index.get_level_values('date')
+        self.codes = np.asarray(self.table.index.codes[0])
+        self.keys = np.asarray(dates.year * 10000 + dates.month * 100 + dates.day, dtype=np.int32)
+
+    def query(self, cities=None, day=None, month=None, year=None, start=None, end=None):
+        """
+        Возвращает строки таблицы, соответствующие фильтрам.
+
+        Строки каждого города занимают непрерывный участок таблицы и отсортированы
+        по дате, поэтому участок города и диапазон дат (а также год и месяц года)
+        находятся бинарным поиском; масками проверяются только день и месяц без года.
+
+        :param cities: список городов или None (все города)
+        :param day: день месяца или None (все дни)
+        :param month: месяц или None (все месяцы)
+        :param year: год или None (все годы)
+        :param start: первая дата диапазона в виде ключа ГГГГММДД или None
+        :param end: последняя дата диапазона (включительно) в виде ключа ГГГГММДД или None
+        :return: датафрейм в длинном формате с индексом (город, дата)
+        """
+        low = start if start is not None else 0
+        high = end + 1 if end is not None else 100000000
+        if year is not None:
+            if month is not None:
+                low, high = max(low, year * 10000 + month * 100), min(high, year * 10000 + month * 100 + 100)
+            else:
+                low, high = max(low, year * 10000), min(high, year * 10000 + 10000)
+        if cities is None:
+            codes = range(len(self.cities))
+        else:
+            codes = sorted({self.cities.index(city) for city in cities if city in self.cities})
+        bounds = np.searchsorted(self.codes, np.arange(len(self.cities) + 1))
+        parts = []
+        for code in codes:
+            first, last = bounds[code], bounds[code + 1]
+            begin, stop = first + np.searchsorted(self.keys[first:last], [low, high])
+            parts.append(np.arange(begin, max(begin, stop)))
+        positions = np.concatenate(parts) if parts else np.array([], dtype=np.int64)
+        if day is not None:
+            positions = positions[self.keys[positions] % 100 == day]
+        if month is not None and year is None:
+            positions = positions[self.keys[positions] // 100 % 100 == month]
+        return self.table.iloc[positions]
+
+    def split(self, table, cities=None):
+        """
+        Разбивает результат запроса на словарь датафреймов по городам
+
+        :param table: датафрейм, полученный из query
+        :param cities: список городов, которые должны попасть в словарь (по умолчанию все)
+        :return: словарь датафреймов вида {город: датафрейм}
+        """
+        bounds = np.searchsorted(np.asarray(table.index.codes[0]), np.arange(len(self.cities) + 1))
+        return {city: table.iloc[bounds[self.cities.index(city)]:bounds[self.cities.index(city) + 1]]
+                .droplevel('city') for city in (cities if cities is not None else self.cities)}
+
+
+def aggregate(table, column, how='mean'):
+    """
+    Вычисляет агрегат столбца по каждому городу таблицы в длинном формате
+
+    :param table: датафрейм с индексом (город, дата)
+    :param column: имя столбца
+    :param how: название агрегирующей функции ('mean', 'median', 'min', 'max', 'count')
+    :return: серия вида {город: значение}
+    """
+    return table[column].groupby(level='city', observed=True, sort=False).agg(how)
@@ -0,0 +1,124 @@
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+class QueryCache:
+    """
+    Кэш результатов запросов к базе данных с вытеснением давно не использованных (LRU).
+
+    Ключ запроса составляется вызывающей стороной и должен включать все, от чего
+    зависит результат (фильтры и версии данных городов), поэтому устаревшие
+    результаты никогда не возвращаются, а просто вытесняются со временем.
+    Кроме количества результатов можно ограничить и их суммарный объем (см. result_size).
+    """
+    def __init__(self, maxsize=32, maxbytes=None):
+        """
+        Конструктор кэша
+
+        :param maxsize: наибольшее количество хранимых результатов (0 - кэш отключен)
+        :param maxbytes: наибольший суммарный объем результатов в байтах (None - без ограничений)
+        """
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        """
+        Возвращает результат запроса из кэша или вычисляет и запоминает его
+
+        :param key: ключ запроса (хешируемый)
+        :param compute: функция без аргументов, вычисляющая результат
+        :return: результат запроса
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        result = compute()
+        if self.maxsize <= 0:
+            return result
+        size = 0 if self.maxbytes is None else result_size(result)
+        if self.maxbytes is not None and size > self.maxbytes:
+            # результат больше всего кэша: его хранение вытеснило бы все остальные
+            return result
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            self.sizes[key] = size
+            while len(self.entries) > self.maxsize or (self.maxbytes is not None and self.nbytes() > self.maxbytes):
+                old, _ = self.entries.popitem(last=False)
+                self.sizes.pop(old)
+        return result
+
+    def nbytes(self):
+        """
+        Возвращает суммарный объем хранимых результатов (считается, только если задан maxbytes)
+
+        :return: объем в байтах
+        """
+        return sum(self.sizes.values())
+
+    def clear(self):
+        """
+        Очищает кэш
+        """
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def result_size(result):
+    """
+    Оценивает объем памяти, который удерживает результат запроса.
+
+    Датафрейм, отобранный срезом, ссылается на массивы исходного датафрейма города, поэтому
+    считается объем этих массивов целиком: пока результат в кэше, они не освобождаются,
+    даже если сам город уже вытеснен из памяти.
+
+    :param result: результат запроса (датафрейм, словарь датафреймов, объект с ними и т. п.)
+    :return: объем в байтах
+    """
+    roots = {}
+    size = measure(result, roots)
+    return size + sum(array.nbytes for array in roots.values())
+
+
+def measure(value, roots):
+    """
+    Рекурсивно обходит результат запроса (вызывается из result_size)
+
+    :param value: часть результата
+    :param roots: словарь {id: массив} уже учтенных массивов, которые удерживает результат
+    :return: объем в байтах без учета массивов из roots
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        frame = value.to_frame() if isinstance(value, pd.Series) else value
+        for position in range(frame.shape[1]):
+            array = frame.iloc[:, position].to_numpy()
+            while isinstance(array.base, np.ndarray):
+                array = array.base
+            roots[id(array)] = array
+        return int(value.index.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(measure(item, roots) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(measure(item, roots) for item in value)
+    if hasattr(value, '__dict__') and not callable(value):
+        # например, агрегаты Rollup; результат Selection хранит только список городов
+        return sum(measure(item, roots) for item in vars(value).values())
+    return sys.getsizeof(value)
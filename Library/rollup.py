@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+
+# агрегаты, которые хранятся для каждого столбца
+STATS = ['median', 'mean', 'min', 'max', 'count']
+
+
+class Rollup:
+    """
+    Помесячные и погодовые агрегаты данных одного города.
+
+    Для каждого месяца (ключ ГГГГММ) и года (ключ ГГГГ) хранятся медиана,
+    среднее, минимум, максимум и количество значений каждого столбца.
+    Агрегаты строятся один раз группировкой, а после правки ряда
+    пересчитываются только месяц и год, в которые попадает измененная дата.
+    """
+    def __init__(self, frame):
+        """
+        Конструктор агрегатов
+
+        :param frame: датафрейм города с индексом по дате
+        """
+        self.monthly = self.group(frame, frame.index.year * 100 + frame.index.month)
+        self.yearly = self.group(frame, frame.index.year)
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        """
+        Строит агрегаты по частям данных города, не загружая их все сразу.
+
+        Части должны следовать по возрастанию дат, и ни один год не должен
+        делиться между частями (например, по одной части на год), поэтому
+        агрегаты каждой части окончательны и просто объединяются.
+
+        :param chunks: итератор датафреймов с индексом по дате
+        :return: экземпляр Rollup
+        """
+        monthly = []
+        yearly = []
+        for frame in chunks:
+            monthly.append(cls.group(frame, frame.index.year * 100 + frame.index.month))
+            yearly.append(cls.group(frame, frame.index.year))
+        if not monthly:
+            return cls(pd.DataFrame(index=pd.DatetimeIndex([], name='date')))
+        rollup = cls.__new__(cls)
+        rollup.monthly = pd.concat(monthly)
+        rollup.yearly = pd.concat(yearly)
+        return rollup
+
+    @staticmethod
+    def group(frame, keys):
+        """
+        Вычисляет агрегаты по группам строк
+
+        :param frame: датафрейм города
+        :param keys: ключи групп для каждой строки
+        :return: датафрейм с ключами групп в индексе и столбцами (столбец, агрегат)
+        """
+        result = frame.groupby(np.asarray(keys)).agg(STATS)
+        result.index.name = 'key'
+        return result
+
+    def update(self, frame, date):
+        """
+        Пересчитывает агрегаты месяца и года, в которые попадает дата
+
+        :param frame: датафрейм города после правки (отсортированный по дате)
+        :param date: дата измененного, добавленного или удаленного ряда
+        """
+        date = pd.Timestamp(date)
+        month = pd.Timestamp(date.year, date.month, 1)
+        year = pd.Timestamp(date.year, 1, 1)
+        self.monthly = self.replace(self.monthly, date.year * 100 + date.month,
+                                    self.slice(frame, month, month + pd.DateOffset(months=1)))
+        self.yearly = self.replace(self.yearly, date.year, self.slice(frame, year, year + pd.DateOffset(years=1)))
+
+    @staticmethod
+    def slice(frame, start, stop):
+        """
+        Возвращает строки датафрейма с датами из полуинтервала [start, stop)
+        """
+        if not frame.index.is_monotonic_increasing:
+            return frame[(frame.index >= start) & (frame.index < stop)]
+        low, high = frame.index.searchsorted([start, stop])
+        return frame.iloc[low:high]
+
+    def replace(self, table, key, rows):
+        """
+        Заменяет агрегаты одной группы
+
+        :param table: помесячные или погодовые агрегаты
+        :param key: ключ группы
+        :param rows: строки группы
+        :return: обновленные агрегаты
+        """
+        table = table.drop(key, errors='ignore')
+        if rows.empty:
+            return table
+        return pd.concat([table, self.group(rows, np.full(len(rows), key))]).sort_index()
+
+    def months(self, column, stat, year=None, start=None, end=None):
+        """
+        Возвращает помесячные значения агрегата
+
+        :param column: столбец
+        :param stat: агрегат ('median', 'mean', 'min', 'max' или 'count')
+        :param year: год или None (все годы)
+        :param start: ключ ГГГГММДД начала диапазона дат или None; берутся месяцы, пересекающиеся с диапазоном
+        :param end: ключ ГГГГММДД конца диапазона дат (включительно) или None
+        :return: серия с ключами ГГГГММ в индексе
+        """
+        series = self.monthly[(column, stat)]
+        low, high = (year * 100, (year + 1) * 100) if year is not None else (0, 1000000)
+        if start is not None:
+            low = max(low, start // 100)
+        if end is not None:
+            high = min(high, end // 100 + 1)
+        if year is not None or start is not None or end is not None:
+            first, last = series.index.searchsorted([low, high])
+            series = series.iloc[first:max(first, last)]
+        return series
+
+    def month(self, column, stat, month, year):
+        """
+        Возвращает значение агрегата за один месяц
+
+        :param column: столбец
+        :param stat: агрегат
+        :param month: месяц
+        :param year: год
+        :return: значение или NaN, если данных за месяц нет
+        """
+        return self.monthly[(column, stat)].get(year * 100 + month, np.nan)
+
+    def years(self, column, stat):
+        """
+        Возвращает погодовые значения агрегата
+
+        :param column: столбец
+        :param stat: агрегат
+        :return: серия с годами в индексе
+        """
+        return self.yearly[(column, stat)]
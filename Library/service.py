@@ -0,0 +1,299 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from Library.analytics import EXTREMES
+from Library.data import date_key
+from Library.rollup import STATS
+from Library.storage import VALUE_COLUMNS
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+def decimal(values):
+    """
+    Переводит значения float32 в float64 с кратчайшей десятичной записью,
+    чтобы в JSON было 12.3, а не 12.300000190734863
+
+    :param values: массив значений
+    :return: массив float64 (пропуски остаются NaN)
+    """
+    return np.asarray(values, dtype=np.float32).astype(str).astype(np.float64)
+
+
+class HttpError(Exception):
+    """
+    Ошибка запроса, которая возвращается клиенту с кодом состояния HTTP
+    """
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class QueryService:
+    """
+    Сервис запросов к базе данных по HTTP (JSON) без графического интерфейса.
+
+    Сервер написан на asyncio: соединения обслуживаются конкурентно, а сами
+    запросы к Data выполняются в пуле потоков, поэтому медленный запрос не
+    задерживает остальных клиентов. Строки данных отдаются потоком NDJSON
+    (по одной строке JSON на ряд) частями с передачей chunked, так что большой
+    результат не собирается в памяти целиком.
+
+    Запросы (все - GET, параметры фильтров необязательны):
+        /cities                          - список городов с датами начала и конца данных
+        /rows?city=&day=&month=&year=&start=&end= - ряды данных (NDJSON)
+        /extremes?city=&day=&month=&year=&start=&end= - экстремумы погоды
+        /rollup?city=&column=&stat=&period=month|year[&year=&start=&end=] - помесячные или погодовые агрегаты
+
+    В city можно перечислить несколько городов через запятую, start и end - границы
+    диапазона дат ГГГГ-ММ-ДД (включительно).
+    """
+    def __init__(self, data, workers=4, chunk_rows=5000):
+        """
+        Конструктор сервиса
+
+        :param data: экземпляр Data
+        :param workers: количество потоков, в которых выполняются запросы
+        :param chunk_rows: количество рядов в одной части потокового ответа
+        """
+        self.data = data
+        self.chunk_rows = chunk_rows
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.routes = {'/cities': self.cities, '/rows': self.rows, '/extremes': self.extremes,
+                       '/rollup': self.rollup}
+
+    async def start(self, host='127.0.0.1', port=8080):
+        """
+        Запускает сервер
+
+        :param host: адрес
+        :param port: порт (0 - выбрать свободный)
+        :return: asyncio.Server
+        """
+        return await asyncio.start_server(self.handle, host, port)
+
+    def serve(self, host='127.0.0.1', port=8080):
+        """
+        Запускает сервер и обслуживает запросы до прерывания (Ctrl+C)
+
+        :param host: адрес
+        :param port: порт
+        """
+        async def main():
+            server = await self.start(host, port)
+            async with server:
+                await server.serve_forever()
+
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.executor.shutdown(wait=False)
+
+    async def run(self, function, *args):
+        """
+        Выполняет функцию в пуле потоков сервиса
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def handle(self, reader, writer):
+        """
+        Обслуживает одно соединение; поддерживает несколько запросов подряд (keep-alive)
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = header.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                parts = line.decode('latin-1').split()
+                keep_alive = len(parts) == 3 and parts[2] == 'HTTP/1.1' and \
+                    headers.get('connection', '').lower() != 'close'
+                await self.respond(parts, writer)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, parts, writer):
+        """
+        Выполняет запрос и записывает ответ
+
+        :param parts: части строки запроса (метод, путь, версия)
+        :param writer: asyncio.StreamWriter соединения
+        """
+        try:
+            if len(parts) != 3:
+                raise HttpError(400, 'Неверная строка запроса')
+            if parts[0] != 'GET':
+                raise HttpError(405, 'Поддерживается только GET')
+            url = urlsplit(parts[1])
+            if url.path not in self.routes:
+                raise HttpError(404, 'Неизвестный запрос ' + url.path)
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            result = await self.routes[url.path](params)
+        except HttpError as error:
+            await self.send_json(writer, error.status, {'error': str(error)})
+            return
+        except Exception as error:
+            await self.send_json(writer, 500, {'error': repr(error)})
+            return
+        if isinstance(result, dict) and 'stream' in result:
+            await self.send_stream(writer, result['stream'])
+        else:
+            await self.send_json(writer, 200, result)
+
+    async def send_json(self, writer, status, body):
+        """
+        Отправляет ответ JSON целиком
+        """
+        payload = json.dumps(body, ensure_ascii=False, default=str).encode('utf-8')
+        writer.write('HTTP/1.1 {0} {1}\r\nContent-Type: application/json; charset=utf-8\r\n'
+                     'Content-Length: {2}\r\n\r\n'.format(status, REASONS[status], len(payload)).encode('latin-1'))
+        writer.write(payload)
+        await writer.drain()
+
+    async def send_stream(self, writer, chunks):
+        """
+        Отправляет ответ NDJSON по частям (Transfer-Encoding: chunked)
+
+        :param chunks: список функций без аргументов, каждая из которых возвращает очередную часть в байтах
+        """
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson; charset=utf-8\r\n'
+                     b'Transfer-Encoding: chunked\r\n\r\n')
+        for chunk in chunks:
+            payload = await self.run(chunk)
+            if payload:
+                writer.write(b'%x\r\n' % len(payload) + payload + b'\r\n')
+                await writer.drain()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    def filters(self, params):
+        """
+        Строит список фильтров Data из параметров запроса
+
+        :param params: параметры запроса (city - город или несколько через запятую, day, month, year,
+                       start и end - границы диапазона дат ГГГГ-ММ-ДД включительно)
+        :return: [город или список городов, день, месяц, год, начало, конец]
+        :raises HttpError: если город неизвестен или значения фильтров заданы неверно
+        """
+        filters = [params.get(name, 'Все') or 'Все' for name in ('city', 'day', 'month', 'year', 'start', 'end')]
+        cities = filters[0].split(',') if ',' in filters[0] else [filters[0]]
+        for city in cities:
+            if city != 'Все' and city not in self.data.getcities():
+                raise HttpError(404, 'Нет города ' + city)
+        if len(cities) > 1:
+            filters[0] = cities
+        for value in filters[1:4]:
+            if value != 'Все' and not value.isdigit():
+                raise HttpError(400, 'День, месяц и год должны быть числами')
+        try:
+            for value in filters[4:]:
+                date_key(value)
+        except ValueError as error:
+            raise HttpError(400, str(error))
+        return filters
+
+    async def cities(self, params):
+        """
+        Список городов с датами начала и конца данных
+        """
+        index = self.data.cityindex
+        return [{'city': city, 'minDate': pd.Timestamp(index.at[city, 'minDate']).strftime('%Y-%m-%d'),
+                 'maxDate': pd.Timestamp(index.at[city, 'maxDate']).strftime('%Y-%m-%d')}
+                for city in self.data.getcities()]
+
+    async def rows(self, params):
+        """
+        Ряды данных, соответствующие фильтрам, потоком NDJSON.
+
+        В режиме out_of_core таблица всей базы может не поместиться в память (get_table там
+        обрезается до Data.table_limit рядов), поэтому ряды отдаются по одному городу за раз.
+        """
+        filters = self.filters(params)
+        if self.data.out_of_core:
+            selection = await self.run(self.data.get_data, filters)
+
+            def encode_city(city):
+                frame = selection[city].reset_index()
+                frame.insert(0, 'city', city)
+                return b''.join(self.encode_rows(frame.iloc[start:start + self.chunk_rows])
+                                for start in range(0, len(frame), self.chunk_rows))
+
+            return {'stream': [lambda city=city: encode_city(city) for city in selection]}
+        table = await self.run(self.data.get_table, filters)
+        return {'stream': [lambda start=start: self.encode_rows(table.iloc[start:start + self.chunk_rows].reset_index())
+                           for start in range(0, len(table), self.chunk_rows)]}
+
+    @staticmethod
+    def encode_rows(part):
+        """
+        Кодирует ряды в NDJSON
+
+        :param part: датафрейм со столбцами city, date и столбцами данных
+        :return: строки JSON в байтах
+        """
+        part = part.copy()
+        part['date'] = part['date'].dt.strftime('%Y-%m-%d')
+        part['city'] = part['city'].astype(str)
+        for column in part.columns[2:]:
+            part[column] = decimal(part[column])
+        return part.to_json(orient='records', lines=True, force_ascii=False).rstrip('\n').encode('utf-8') + b'\n'
+
+    async def extremes(self, params):
+        """
+        Экстремумы погоды по фильтрам
+        """
+        extremes = await self.run(self.data.extremes, self.filters(params))
+        result = {}
+        for key, column, how in EXTREMES:
+            extreme = extremes.get(key)
+            result[key] = None if extreme is None else {
+                'city': extreme.city, 'date': extreme.date.strftime('%Y-%m-%d'), 'column': column,
+                'value': float(decimal([extreme.value])[0])}
+        return result
+
+    async def rollup(self, params):
+        """
+        Помесячные (period=month) или погодовые (period=year) агрегаты столбца одного города
+        """
+        city = params.get('city', '')
+        if city not in self.data.getcities():
+            # 'Все', список через запятую и неизвестные названия - не один город базы
+            raise HttpError(400, 'Укажите один город (city) из /cities')
+        filters = self.filters(params)
+        column = params.get('column', 'tempMax')
+        stat = params.get('stat', 'mean')
+        period = params.get('period', 'month')
+        if column not in VALUE_COLUMNS or stat not in STATS or period not in ('month', 'year'):
+            raise HttpError(400, 'column: {0}; stat: {1}; period: month, year'.format(
+                ', '.join(VALUE_COLUMNS), ', '.join(STATS)))
+        year = params.get('year')
+        if year is not None and not year.isdigit():
+            raise HttpError(400, 'Год должен быть числом')
+        rollup = await self.run(self.data.rollup, city)
+        if period == 'year':
+            series = rollup.years(column, stat)
+            keys = [str(key) for key in series.index]
+        else:
+            series = rollup.months(column, stat, None if year is None else int(year),
+                                   date_key(filters[4]), date_key(filters[5]))
+            keys = ['{0}-{1:02}'.format(key // 100, key % 100) for key in series.index]
+        values = [None if np.isnan(value) else float(value) for value in decimal(series)]
+        return {'city': city, 'column': column, 'stat': stat, 'period': period,
+                'values': [{'key': key, 'value': value} for key, value in zip(keys, values)]}
@@ -0,0 +1,121 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from Library.storage import VALUE_COLUMNS, VALUE_DTYPE, city_format, get_storage
+
+# версия формата снимка; снимок другой версии считается устаревшим
+SNAPSHOT_VERSION = 1
+
+
+def snapshot_path(route):
+    """
+    Возвращает каталог снимка базы данных: .<имя индекса>.snapshot рядом с основным файлом
+
+    :param route: путь основного файла базы данных
+    :return: путь каталога
+    """
+    directory, name = os.path.split(route)
+    return os.path.join(directory, '.' + name + '.snapshot')
+
+
+def sources(route, cityindex):
+    """
+    Описывает файлы, из которых построен снимок: основной файл и файлы всех городов
+
+    :param route: путь основного файла базы данных
+    :param cityindex: индекс базы данных
+    :return: список [имя файла, время изменения в наносекундах, размер]
+    :raises OSError: если какого-то файла нет
+    """
+    directory = os.path.dirname(route)
+    names = [os.path.basename(route)]
+    for city in cityindex.index:
+        storage = get_storage(city_format(cityindex, city))
+        names.append(str(cityindex.at[city, 'ID']).zfill(3) + storage.extension)
+    result = []
+    for name in names:
+        stat = os.stat(os.path.join(directory, name))
+        result.append([name, stat.st_mtime_ns, stat.st_size])
+    return result
+
+
+def load_snapshot(route, cityindex):
+    """
+    Читает данные городов из снимка, если он соответствует файлам базы данных.
+
+    Снимок считается действительным, если основной файл и файлы всех городов
+    индекса не менялись (совпадают время изменения и размер) с момента его записи.
+
+    :param route: путь основного файла базы данных
+    :param cityindex: индекс базы данных
+    :return: словарь датафреймов вида {город: датафрейм} или None, если снимка нет или он устарел
+    """
+    path = snapshot_path(route)
+    try:
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != SNAPSHOT_VERSION or meta.get('columns') != VALUE_COLUMNS or \
+                meta.get('sources') != sources(route, cityindex) or \
+                sorted(meta['offsets']) != sorted(cityindex.index):
+            return None
+        dates = np.load(os.path.join(path, 'date.npy'))
+        values = {column: np.load(os.path.join(path, column + '.npy')) for column in VALUE_COLUMNS}
+    except (OSError, ValueError, KeyError):
+        return None
+    frames = {}
+    for city in cityindex.index:
+        start, stop = meta['offsets'][city]
+        frames[city] = pd.DataFrame({column: values[column][start:stop] for column in VALUE_COLUMNS},
+                                    index=pd.DatetimeIndex(dates[start:stop], name='date'), columns=VALUE_COLUMNS)
+    return frames
+
+
+def save_snapshot(route, cityindex, frames, stamp=None):
+    """
+    Записывает снимок данных городов: по одному файлу .npy на столбец для всех городов подряд
+    и meta.json с границами городов и описанием исходных файлов.
+
+    Снимок записывается во временный каталог, который затем заменяет прежний.
+    Если у какого-то города нестандартный набор столбцов, снимок не записывается.
+
+    :param route: путь основного файла базы данных
+    :param cityindex: индекс базы данных
+    :param frames: словарь датафреймов вида {город: датафрейм}, прочитанных из файлов базы
+    :param stamp: описание исходных файлов (см. sources), снятое до их чтения; по умолчанию снимается сейчас
+    :return: True, если снимок записан
+    """
+    cities = list(cityindex.index)
+    if stamp is None:
+        stamp = sources(route, cityindex)
+    if any(list(frames[city].columns) != VALUE_COLUMNS for city in cities):
+        return False
+    path = snapshot_path(route)
+    temp = path + '.tmp'
+    shutil.rmtree(temp, ignore_errors=True)
+    os.makedirs(temp)
+    offsets = {}
+    position = 0
+    for city in cities:
+        offsets[city] = [position, position + len(frames[city])]
+        position += len(frames[city])
+    np.save(os.path.join(temp, 'date.npy'), np.concatenate(
+        [frames[city].index.values.astype('datetime64[D]') for city in cities] or [np.array([], 'datetime64[D]')]))
+    for column in VALUE_COLUMNS:
+        np.save(os.path.join(temp, column + '.npy'), np.concatenate(
+            [frames[city][column].to_numpy(dtype=VALUE_DTYPE) for city in cities] or [np.array([], VALUE_DTYPE)]))
+    with open(os.path.join(temp, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'version': SNAPSHOT_VERSION, 'columns': VALUE_COLUMNS, 'sources': stamp,
+                   'offsets': offsets}, f, ensure_ascii=False)
+    if os.path.isdir(path):
+        old = path + '.old'
+        shutil.rmtree(old, ignore_errors=True)
+        os.replace(path, old)
+        os.replace(temp, path)
+        shutil.rmtree(old)
+    else:
+        os.replace(temp, path)
+    return True
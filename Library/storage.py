@@ -0,0 +1,317 @@
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# столбцы с данными погоды; хранятся как float32, пропуски - NaN
+VALUE_COLUMNS = ['tempMax', 'tempMin', 'press', 'wind', 'falls']
+VALUE_DTYPE = np.float32
+
+# отметка пропуска в файлах, записанных до перехода на NaN
+LEGACY_MISSING = -200
+
+# столбцы основного файла базы данных (index.csv)
+INDEX_COLUMNS = ['ID', 'city', 'minDate', 'maxDate', 'format', 'station']
+
+
+def typed(frame):
+    """
+    Приводит столбцы данных города к float32, заменяя пустые, нечисловые значения
+    и прежнюю отметку пропуска -200 на NaN.
+
+    Столбцы, которые уже имеют нужный тип и не содержат отметки -200, не копируются,
+    поэтому данные, отображенные в память, так и остаются отображенными.
+
+    :param frame: датафрейм с индексом по дате
+    :return: датафрейм с типизированными столбцами
+    """
+    columns = {}
+    for column in frame.columns:
+        values = frame[column]
+        if values.dtype != VALUE_DTYPE:
+            values = pd.to_numeric(values, errors='coerce').astype(VALUE_DTYPE)
+        array = values.to_numpy()
+        if (array == LEGACY_MISSING).any():
+            array = np.where(array == LEGACY_MISSING, np.nan, array).astype(VALUE_DTYPE)
+        columns[column] = array
+    return pd.DataFrame(columns, index=frame.index, columns=frame.columns, copy=False)
+
+
+class CsvStorage:
+    """
+    Хранилище данных города в текстовом CSV-файле с разделителем ";"
+    """
+    name = 'csv'
+    extension = '.csv'
+    # типы столбцов задаются явно, чтобы pandas не определял их по содержимому
+    dtypes = dict({'date': str}, **{column: VALUE_DTYPE for column in VALUE_COLUMNS})
+
+    def read(self, path):
+        """
+        Читает данные города
+
+        :param path: путь файла без расширения
+        :return: датафрейм с индексом по дате
+        """
+        try:
+            frame = pd.read_csv(path + self.extension, encoding="utf-8", sep=";", dtype=self.dtypes, index_col='date')
+        except ValueError:
+            # в старых файлах встречаются нечисловые значения: такой файл читается без типов,
+            # а typed заменяет их на NaN
+            frame = pd.read_csv(path + self.extension, encoding="utf-8", sep=";", dtype={'date': str}, index_col='date')
+        frame.index = pd.to_datetime(frame.index, format='%Y-%m-%d')
+        return typed(frame)
+
+    def write(self, path, frame):
+        """
+        Записывает данные города
+
+        :param path: путь файла без расширения
+        :param frame: датафрейм с индексом по дате
+        """
+        frame.to_csv(path + self.extension, sep=";", index=True, encoding='utf-8')
+
+
+class ParquetStorage:
+    """
+    Хранилище данных города в сжатом колоночном файле Parquet (требуется pyarrow)
+    """
+    name = 'parquet'
+    extension = '.parquet'
+
+    def __init__(self, compression='snappy'):
+        self.compression = compression
+
+    def read(self, path):
+        frame = pd.read_parquet(path + self.extension, engine='pyarrow', memory_map=True)
+        frame.index.name = 'date'
+        return typed(frame)
+
+    def write(self, path, frame):
+        frame.to_parquet(path + self.extension, engine='pyarrow', compression=self.compression, index=True)
+
+
+class FeatherStorage:
+    """
+    Хранилище данных города в файле Feather (Arrow IPC), который можно отображать в память (требуется pyarrow)
+    """
+    name = 'feather'
+    extension = '.feather'
+
+    def __init__(self, compression='lz4'):
+        self.compression = compression
+
+    def read(self, path):
+        from pyarrow import feather
+        return typed(feather.read_table(path + self.extension, memory_map=True).to_pandas().set_index('date'))
+
+    def write(self, path, frame):
+        frame.rename_axis('date').reset_index().to_feather(path + self.extension, compression=self.compression)
+
+
+class NpyStorage:
+    """
+    Хранилище данных города в каталоге из файлов .npy, по одному на столбец.
+
+    Не требует дополнительных библиотек, столбцы читаются отображением в память.
+    """
+    name = 'npy'
+    extension = ''
+
+    def read(self, path):
+        with open(os.path.join(path, 'columns.json'), encoding='utf-8') as f:
+            columns = json.load(f)
+        index = pd.DatetimeIndex(np.load(os.path.join(path, 'date.npy'), mmap_mode='r'), name='date')
+        return typed(pd.DataFrame({column: np.load(os.path.join(path, column + '.npy'), mmap_mode='r')
+                                   for column in columns}, index=index, columns=columns, copy=False))
+
+    def write(self, path, frame):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'date.npy'), frame.index.values.astype('datetime64[D]'))
+        for column in frame.columns:
+            np.save(os.path.join(path, column + '.npy'), frame[column].to_numpy(dtype=VALUE_DTYPE))
+        with open(os.path.join(path, 'columns.json'), 'w', encoding='utf-8') as f:
+            json.dump(list(frame.columns), f)
+
+
+class ChunkedStorage:
+    """
+    Хранилище данных города по годам: каталог NNN.chunks с файлом ГГГГ.npy на каждый год.
+
+    Каждый файл - структурированный массив (дата и столбцы float32), который читается
+    отображением в память. Данные можно читать целиком или по одному году, не загружая
+    остальные годы (см. режим out_of_core у Library.data.Data).
+    """
+    name = 'chunks'
+    extension = '.chunks'
+
+    def read(self, path):
+        years = self.years(path)
+        if not years:
+            return pd.DataFrame(columns=VALUE_COLUMNS, index=pd.DatetimeIndex([], name='date'), dtype=VALUE_DTYPE)
+        return pd.concat([self.read_year(path, year) for year in years])
+
+    def write(self, path, frame):
+        shutil.rmtree(path + self.extension, ignore_errors=True)
+        os.makedirs(path + self.extension)
+        dtype = [('date', 'datetime64[D]')] + [(column, VALUE_DTYPE) for column in frame.columns]
+        years = frame.index.year
+        for year in np.unique(years):
+            part = frame[years == year]
+            records = np.empty(len(part), dtype=dtype)
+            records['date'] = part.index.values.astype('datetime64[D]')
+            for column in frame.columns:
+                records[column] = part[column].to_numpy(dtype=VALUE_DTYPE)
+            np.save(os.path.join(path + self.extension, '{0:04}.npy'.format(year)), records)
+
+    def years(self, path):
+        """
+        Возвращает список лет, за которые есть данные
+
+        :param path: путь файла без расширения
+        :return: отсортированный список лет
+        """
+        return sorted(int(name[:4]) for name in os.listdir(path + self.extension) if re.match(r'\d{4}\.npy$', name))
+
+    def read_year(self, path, year):
+        """
+        Читает данные города за один год
+
+        :param path: путь файла без расширения
+        :param year: год
+        :return: датафрейм с индексом по дате
+        """
+        records = np.load(os.path.join(path + self.extension, '{0:04}.npy'.format(year)), mmap_mode='r')
+        columns = [name for name in records.dtype.names if name != 'date']
+        return typed(pd.DataFrame({column: records[column] for column in columns},
+                                  index=pd.DatetimeIndex(records['date'], name='date'), columns=columns, copy=False))
+
+
+STORAGES = {storage.name: storage for storage in (CsvStorage, ParquetStorage, FeatherStorage, NpyStorage,
+                                                  ChunkedStorage)}
+
+
+def get_storage(fmt):
+    """
+    Возвращает хранилище по названию формата
+
+    :param fmt: формат ('csv', 'parquet', 'feather', 'npy' или 'chunks'); пустое значение означает csv
+    :return: экземпляр хранилища
+    """
+    if not isinstance(fmt, str) or not fmt:
+        fmt = 'csv'
+    if fmt not in STORAGES:
+        raise ValueError('Неизвестный формат хранения: ' + fmt)
+    return STORAGES[fmt]()
+
+
+def city_format(cityindex, city):
+    """
+    Возвращает формат, в котором хранятся данные города согласно индексу
+
+    :param cityindex: индекс базы данных
+    :param city: город
+    :return: название формата
+    """
+    if 'format' not in cityindex.columns:
+        return 'csv'
+    fmt = cityindex.at[city, 'format']
+    return fmt if isinstance(fmt, str) and fmt else 'csv'
+
+
+def convert(route, fmt=None):
+    """
+    Переводит существующую базу данных (index.csv и файлы NNN.csv) в другой формат хранения.
+
+    Файлы городов сохраняют свои номера, индекс перезаписывается с новым столбцом format.
+    Данные при этом приводятся к float32 с NaN вместо отметки -200, поэтому вызов без
+    формата переписывает каждый город в его же формате и служит миграцией старых файлов.
+    Файлы прежнего формата удаляются только после записи индекса, поэтому прерванное
+    преобразование оставляет базу в одном из двух согласованных состояний.
+
+    :param route: путь основного файла базы данных
+    :param fmt: новый формат хранения или None, чтобы оставить формат каждого города
+    """
+    direct = '/'.join(route.split('/')[:-1]) + '/'
+    cityindex = pd.read_csv(route, encoding="utf-8", sep=";", index_col=u'city', dtype={'station': str})
+    formats = []
+    replaced = []
+    for city, row in cityindex.iterrows():
+        path = direct + str(row['ID']).zfill(3)
+        source = get_storage(city_format(cityindex, city))
+        target = source if fmt is None else get_storage(fmt)
+        write_atomic(target, path, source.read(path))
+        formats.append(target.name)
+        if target.extension != source.extension:
+            replaced.append((source, path))
+    cityindex['format'] = formats
+    write_index(route, cityindex)
+    for source, path in replaced:
+        remove(source, path)
+
+
+def write_atomic(storage, path, frame):
+    """
+    Записывает данные города через временный файл, который затем переименовывается.
+    Если запись прервется, прежний файл останется нетронутым.
+
+    :param storage: хранилище
+    :param path: путь файла без расширения
+    :param frame: датафрейм с индексом по дате
+    """
+    directory, name = os.path.split(path)
+    temp = os.path.join(directory, '.' + name + '.tmp')
+    storage.write(temp, frame)
+    target = path + storage.extension
+    if os.path.isdir(target):
+        old = os.path.join(directory, '.' + name + '.old')
+        os.replace(target, old)
+        os.replace(temp + storage.extension, target)
+        shutil.rmtree(old)
+    else:
+        os.replace(temp + storage.extension, target)
+
+
+def remove(storage, path):
+    """
+    Удаляет файл (или каталог) с данными города
+
+    :param storage: хранилище
+    :param path: путь файла без расширения
+    """
+    target = path + storage.extension
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+    elif os.path.exists(target):
+        os.remove(target)
+
+
+def next_id(direct):
+    """
+    Возвращает первый свободный номер файла города в каталоге базы данных.
+
+    Номера определяются по именам файлов NNN.* без чтения индексов; номера
+    после 999 записываются четырьмя и более цифрами.
+
+    :param direct: каталог базы данных
+    :return: номер
+    """
+    ids = [int(f.split('.')[0]) for f in os.listdir(direct) if re.match(r'\d+(\.|$)', f)]
+    return max(ids, default=0) + 1
+
+
+def write_index(route, cityindex):
+    """
+    Записывает индекс базы данных через временный файл
+
+    :param route: путь основного файла базы данных
+    :param cityindex: индекс с городами в качестве индекса датафрейма
+    """
+    index = cityindex.reset_index().reindex(columns=INDEX_COLUMNS)
+    index['minDate'] = pd.to_datetime(index['minDate']).dt.strftime('%Y-%m-%d')
+    index['maxDate'] = pd.to_datetime(index['maxDate']).dt.strftime('%Y-%m-%d')
+    index.to_csv(route + '.tmp', sep=";", encoding='utf-8', index=False)
+    os.replace(route + '.tmp', route)
@@ -0,0 +1,75 @@
+import datetime as dt
+import os
+
+import numpy as np
+import pandas as pd
+
+from Library.storage import VALUE_COLUMNS, VALUE_DTYPE, get_storage, write_atomic
+
+
+def synthetic_city(rng, start, end, gaps=0.01):
+    """
+    Создает правдоподобный ряд данных одной станции: сезонный ход температуры и давления
+    со случайным шумом, ветер и осадки
+
+    :param rng: генератор случайных чисел numpy
+    :param start: первая дата
+    :param end: последняя дата (включительно)
+    :param gaps: доля пропусков (NaN) в каждом столбце
+    :return: датафрейм с индексом по дате и столбцами float32
+    """
+    dates = pd.date_range(start, end, name='date')
+    size = len(dates)
+    season = -np.cos(2 * np.pi * (dates.dayofyear.to_numpy() - 15) / 365.25)
+    mean = rng.uniform(-5, 15)
+    amplitude = rng.uniform(8, 20)
+    temp_max = mean + 4 + amplitude * season + rng.normal(0, 4, size)
+    temp_min = temp_max - rng.uniform(3, 12, size)
+    columns = {
+        'tempMax': np.round(temp_max),
+        'tempMin': np.round(temp_min),
+        'press': np.round(1013 - 5 * season + rng.normal(0, 8, size)),
+        'wind': rng.integers(0, 15, size).astype(float),
+        'falls': np.where(rng.random(size) < 0.3, rng.integers(1, 30, size), 0).astype(float),
+    }
+    frame = pd.DataFrame(columns, index=dates, columns=VALUE_COLUMNS).astype(VALUE_DTYPE)
+    if gaps:
+        frame = frame.mask(rng.random(frame.shape) < gaps)
+    return frame
+
+
+def generate(directory, stations=10, years=10, first_year=2000, fmt='csv', gaps=0.01, seed=0):
+    """
+    Записывает синтетическую базу данных: index.csv и по файлу NNN.<формат> на станцию.
+
+    Города называются "Станция-001", "Станция-002" и т. д., у каждой станции
+    ежедневные данные за years лет, начиная с 1 января first_year. Данные
+    воспроизводимы: одинаковые параметры дают одинаковую базу.
+
+    :param directory: каталог базы данных (создается при необходимости)
+    :param stations: количество станций
+    :param years: количество лет
+    :param first_year: первый год данных
+    :param fmt: формат хранения файлов городов (см. Library.storage.get_storage)
+    :param gaps: доля пропусков в каждом столбце
+    :param seed: начальное значение генератора случайных чисел
+    :return: путь основного файла базы данных
+    :raises ValueError: если станций больше 999 (номера файлов трехзначные)
+    """
+    if not 0 < stations < 1000:
+        raise ValueError('Количество станций должно быть от 1 до 999')
+    os.makedirs(directory, exist_ok=True)
+    storage = get_storage(fmt)
+    rng = np.random.default_rng(seed)
+    start = dt.date(first_year, 1, 1)
+    end = dt.date(first_year + years - 1, 12, 31)
+    rows = []
+    for number in range(1, stations + 1):
+        write_atomic(storage, os.path.join(directory, '{0:03}'.format(number)),
+                     synthetic_city(rng, start, end, gaps))
+        rows.append([number, 'Станция-{0:03}'.format(number), start.isoformat(), end.isoformat(), storage.name,
+                     str(27000 + number)])
+    route = os.path.join(directory, 'index.csv')
+    pd.DataFrame(rows, columns=['ID', 'city', 'minDate', 'maxDate', 'format', 'station']) \
+        .to_csv(route, sep=";", encoding='utf-8', index=False)
+    return route
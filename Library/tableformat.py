@@ -0,0 +1,34 @@
+def format_rows(cities, dates, values, positions):
+    """
+    Форматирует строки таблицы для Treeview
+
+    :param cities: массив городов
+    :param dates: индекс дат
+    :param values: список массивов значений столбцов
+    :param positions: позиции форматируемых строк
+    :return: список строк вида (iid, текст, значения)
+    """
+    dates = dates[positions]
+    keys = dates.strftime('%Y-%m-%d')
+    texts = dates.strftime('%d.%m.%Y')
+    cities = cities[positions]
+    values = [format_column(column[positions]) for column in values]
+    return [(keys[i] + ' ' + cities[i], texts[i], [cities[i], texts[i]] + [column[i] for column in values])
+            for i in range(len(positions))]
+
+
+def format_column(column):
+    """
+    Форматирует значения столбца для отображения: пропуски (NaN) показываются пустыми ячейками
+
+    :param column: массив значений
+    :return: список строк
+    """
+    # модуль импортируется вместе с окном программы, а numpy загружается в фоне
+    import numpy as np
+
+    if column.dtype.kind != 'f':
+        return column.tolist()
+    text = np.char.mod('%g', column).astype(object)
+    text[np.isnan(column)] = ''
+    return text.tolist()
@@ -0,0 +1,168 @@
+import cProfile
+import logging
+import logging.handlers
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger('pyweather.timings')
+
+
+class Timings:
+    """
+    Замеры времени этапов работы (получение данных, отчет, таблица, диаграмма, загрузка, сохранение).
+
+    Для каждого этапа хранится последнее значение и скользящее окно последних
+    замеров, по которому считаются среднее и максимум. Если у журнала
+    pyweather.timings включен уровень INFO (см. log_to_file), каждый замер
+    записывается в журнал вместе со скользящей статистикой. Замеры можно
+    делать из любого потока.
+    """
+    def __init__(self, window=100):
+        """
+        Конструктор замеров
+
+        :param window: количество последних замеров этапа, по которым считается статистика
+        """
+        self.window = window
+        self.samples = {}
+        self.last = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        """
+        Замеряет время выполнения блока with
+
+        :param name: название этапа
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        """
+        Добавляет замер этапа
+
+        :param name: название этапа
+        :param seconds: время в секундах
+        """
+        with self.lock:
+            if name not in self.samples:
+                self.samples[name] = deque(maxlen=self.window)
+            self.samples[name].append(seconds)
+            self.last[name] = seconds
+        if logger.isEnabledFor(logging.INFO):
+            stats = self.stats(name)
+            logger.info('%s %.1f мс (среднее %.1f мс, максимум %.1f мс, замеров %d)', name, seconds * 1000,
+                        stats['mean'] * 1000, stats['max'] * 1000, stats['count'])
+
+    def stats(self, name):
+        """
+        Возвращает статистику этапа по скользящему окну
+
+        :param name: название этапа
+        :return: словарь {'last', 'mean', 'max', 'count'} (время в секундах) или None, если замеров не было
+        """
+        with self.lock:
+            samples = list(self.samples.get(name, ()))
+            if not samples:
+                return None
+            return {'last': self.last[name], 'mean': sum(samples) / len(samples), 'max': max(samples),
+                    'count': len(samples)}
+
+    def summary(self, names):
+        """
+        Строит строку с последними замерами этапов для строки состояния
+
+        :param names: список пар (название этапа, подпись)
+        :return: строка вида "подпись: 12 мс | ..."; этапы без замеров пропускаются
+        """
+        with self.lock:
+            return ' | '.join('{0}: {1:.1f} мс'.format(label, self.last[name] * 1000)
+                              for name, label in names if name in self.last)
+
+
+def log_to_file(path, max_bytes=1000000, backups=3):
+    """
+    Включает запись замеров в файл журнала, который сменяется по достижении размера
+
+    :param path: путь файла журнала
+    :param max_bytes: размер файла, после которого начинается новый
+    :param backups: количество хранимых прежних файлов
+    :return: обработчик журнала
+    """
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return handler
+
+
+class Profiler:
+    """
+    Профилирование по запросу: пока профилирование включено, вызовы через call
+    выполняются под cProfile, и статистика всех вызовов (из любых потоков)
+    накапливается до выключения.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.stats = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Включает профилирование и сбрасывает накопленную статистику
+        """
+        with self.lock:
+            self.stats = None
+            self.enabled = True
+
+    def call(self, function, *args):
+        """
+        Вызывает функцию, профилируя ее, если профилирование включено
+
+        :param function: функция
+        :param args: аргументы функции
+        :return: результат функции
+        """
+        if not self.enabled:
+            return function(*args)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # в этом потоке уже работает другой профилировщик
+            return function(*args)
+        try:
+            return function(*args)
+        finally:
+            profile.disable()
+            with self.lock:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profile)
+                else:
+                    self.stats.add(profile)
+
+    def stop(self, path):
+        """
+        Выключает профилирование и записывает накопленную статистику
+
+        :param path: путь файла статистики (.prof, читается pstats и snakeviz); рядом записывается
+                     текстовая сводка path + '.txt'
+        :return: путь файла статистики или None, если профилировать было нечего
+        """
+        with self.lock:
+            self.enabled = False
+            stats, self.stats = self.stats, None
+        if stats is None:
+            return None
+        stats.dump_stats(path)
+        with open(path + '.txt', 'w', encoding='utf-8') as f:
+            stats.stream = f
+            stats.sort_stats('cumulative').print_stats(40)
+        return path
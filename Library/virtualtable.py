@@ -0,0 +1,229 @@
+import tkinter.ttk as ttk
+
+from Library.tableformat import format_rows
+
+
+class VirtualTable:
+    """
+    Виртуальная таблица поверх ttk.Treeview.
+
+    В Treeview всегда находятся только видимые строки. Данные берутся из
+    датафрейма в длинном формате (город, дата) по текущему смещению, а
+    небольшой буфер строк до и после видимого окна форматируется заранее,
+    чтобы прокрутка не требовала повторного форматирования. Сортировка
+    по столбцу выполняется перестановкой позиций, без перестроения таблицы.
+
+    numpy импортируется при первых данных, а не при импорте модуля, чтобы
+    пустую таблицу можно было показать до загрузки тяжелых библиотек.
+    """
+    def __init__(self, master, columns, height=15, buffer=100):
+        """
+        Конструктор таблицы
+
+        :param master: родительский виджет
+        :param columns: список столбцов вида [(имя, заголовок, ширина)]; первые два - город и дата
+        :param height: количество видимых строк
+        :param buffer: количество строк, форматируемых заранее до и после видимого окна
+        """
+        self.height = height
+        self.buffer = buffer
+        self.names = [column[0] for column in columns]
+        self.tree = ttk.Treeview(master, height=height, columns=self.names, show='headings')
+        self.scroll = ttk.Scrollbar(master, orient="vertical", command=self.yview)
+        for name, text, width in columns:
+            self.tree.column(name, width=width)
+            self.tree.heading(name, text=text, command=lambda n=name: self.sort(n))
+
+        self.size = 0
+        self.offset = 0
+        self.order = []
+        self.cities = []
+        self.dates = None
+        self.values = []
+        self.sorted_by = None
+        self.descending = False
+        self.rows = {}
+        self.selected = None
+
+        self.tree.bind('<MouseWheel>', lambda event: self.scroll_by(-1 if event.delta > 0 else 1, 'units', 3))
+        self.tree.bind('<Button-4>', lambda event: self.scroll_by(-1, 'units', 3))
+        self.tree.bind('<Button-5>', lambda event: self.scroll_by(1, 'units', 3))
+        self.tree.bind('<Prior>', lambda event: self.scroll_by(-1, 'pages'))
+        self.tree.bind('<Next>', lambda event: self.scroll_by(1, 'pages'))
+        self.tree.bind('<Up>', self.on_up)
+        self.tree.bind('<Down>', self.on_down)
+        self.tree.bind('<<TreeviewSelect>>', lambda event: self.remember_focus())
+
+    def pack(self):
+        """
+        Размещает таблицу и полосу прокрутки в родительском виджете
+        """
+        self.scroll.pack(side='right', fill='y')
+        self.tree.pack(side='left', fill='y')
+
+    def set_frame(self, table, keep_position=False):
+        """
+        Задает данные таблицы
+
+        :param table: датафрейм в длинном формате с индексом (город, дата)
+        :param keep_position: сохранить текущее смещение и сортировку (например, после редактирования)
+        """
+        import numpy as np
+
+        self.size = len(table)
+        self.cities = np.asarray(table.index.get_level_values(0).astype(str), dtype=object)
+        self.dates = table.index.get_level_values(1)
+        self.values = [table[name].to_numpy() for name in self.names[2:]]
+        self.rows = {}
+        if keep_position and self.sorted_by is not None:
+            self.order = self.sort_order(self.sorted_by)
+        else:
+            self.order = np.arange(self.size)
+            self.sorted_by = None
+            self.descending = False
+        if not keep_position:
+            self.offset = 0
+            self.selected = None
+        self.offset = max(0, min(self.offset, self.size - self.height))
+        self.render()
+
+    def sort_order(self, name):
+        """
+        Вычисляет порядок строк при сортировке по столбцу
+
+        :param name: имя столбца
+        :return: массив позиций строк
+        """
+        import numpy as np
+
+        if not self.size:
+            return np.arange(0)
+        if name == self.names[0]:
+            keys = self.cities
+        elif name == self.names[1]:
+            keys = np.asarray(self.dates)
+        else:
+            keys = self.values[self.names.index(name) - 2]
+        order = np.argsort(keys, kind='stable')
+        return order[::-1] if self.descending else order
+
+    def sort(self, name):
+        """
+        Сортирует таблицу по столбцу; повторный щелчок меняет направление сортировки
+
+        :param name: имя столбца
+        """
+        self.descending = not self.descending if self.sorted_by == name else False
+        self.sorted_by = name
+        self.order = self.sort_order(name)
+        self.rows = {}
+        self.offset = 0
+        self.render()
+
+    def materialize(self):
+        """
+        Форматирует строки видимого окна вместе с буфером прокрутки
+        """
+        start = max(0, self.offset - self.buffer)
+        stop = min(self.size, self.offset + self.height + self.buffer)
+        rows = format_rows(self.cities, self.dates, self.values, self.order[start:stop])
+        self.rows = {start + i: row for i, row in enumerate(rows)}
+
+    def render(self):
+        """
+        Перерисовывает видимые строки
+        """
+        stop = min(self.size, self.offset + self.height)
+        if any(i not in self.rows for i in range(self.offset, stop)):
+            self.materialize()
+        self.tree.delete(*self.tree.get_children())
+        for i in range(self.offset, stop):
+            iid, text, values = self.rows[i]
+            self.tree.insert("", "end", iid=iid, text=text, values=values)
+        if self.selected is not None and self.tree.exists(self.selected):
+            self.tree.focus(self.selected)
+            self.tree.selection_set(self.selected)
+        if self.size:
+            self.scroll.set(self.offset / self.size, stop / self.size)
+        else:
+            self.scroll.set(0, 1)
+
+    def scroll_to(self, offset):
+        """
+        Прокручивает таблицу к указанной строке
+
+        :param offset: номер первой видимой строки
+        """
+        offset = max(0, min(int(offset), self.size - self.height))
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+
+    def scroll_by(self, count, what, step=1):
+        """
+        Прокручивает таблицу на несколько строк или страниц
+
+        :param count: направление и количество
+        :param what: 'units' или 'pages'
+        :param step: количество строк в одной единице прокрутки
+        """
+        self.scroll_to(self.offset + int(count) * (self.height if what == 'pages' else step))
+        return 'break'
+
+    def yview(self, *args):
+        """
+        Обработчик полосы прокрутки
+        """
+        if args[0] == 'moveto':
+            self.scroll_to(float(args[1]) * self.size)
+        elif args[0] == 'scroll':
+            self.scroll_by(args[1], args[2])
+
+    def on_up(self, event):
+        """
+        Обработчик клавиши вверх: на первой видимой строке прокручивает таблицу
+        """
+        children = self.tree.get_children()
+        if children and self.tree.focus() == children[0] and self.offset > 0:
+            self.scroll_to(self.offset - 1)
+            self.move_focus(self.tree.get_children()[0])
+            return 'break'
+
+    def on_down(self, event):
+        """
+        Обработчик клавиши вниз: на последней видимой строке прокручивает таблицу
+        """
+        children = self.tree.get_children()
+        if children and self.tree.focus() == children[-1] and self.offset + self.height < self.size:
+            self.scroll_to(self.offset + 1)
+            self.move_focus(self.tree.get_children()[-1])
+            return 'break'
+
+    def move_focus(self, iid):
+        """
+        Выделяет строку таблицы
+
+        :param iid: идентификатор строки
+        """
+        self.tree.focus(iid)
+        self.tree.selection_set(iid)
+        self.selected = iid
+
+    def remember_focus(self):
+        """
+        Запоминает выбранную строку, чтобы восстановить выделение после прокрутки
+        """
+        if self.tree.focus():
+            self.selected = self.tree.focus()
+
+    def focus(self):
+        """
+        Возвращает идентификатор выбранной строки ('' - если ничего не выбрано)
+        """
+        return self.tree.focus()
+
+    def item(self, iid):
+        """
+        Возвращает описание строки, как ttk.Treeview.item
+        """
+        return self.tree.item(iid)
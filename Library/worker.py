@@ -0,0 +1,105 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Cancelled(Exception):
+    """
+    Исключение, которым задача сообщает, что она была отменена
+    """
+    pass
+
+
+def check(cancel):
+    """
+    Прерывает задачу, если ее отменили
+
+    :param cancel: threading.Event отмены задачи
+    :raises Cancelled: если задача отменена
+    """
+    if cancel.is_set():
+        raise Cancelled()
+
+
+class Worker:
+    """
+    Фоновый исполнитель задач для графического интерфейса.
+
+    Задачи выполняются по очереди в отдельном потоке, поэтому главный цикл Tk
+    не блокируется. Результат передается обратно в поток Tk через root.after.
+    Задачи группируются по ключу: новая задача с тем же ключом отменяет
+    предыдущую, и применяется только результат последней.
+    """
+    def __init__(self, root, on_busy=None, interval=50):
+        """
+        Конструктор исполнителя
+
+        :param root: главное окно Tk
+        :param on_busy: функция, вызываемая с True/False при начале и окончании работы
+        :param interval: интервал опроса завершения задач в миллисекундах
+        """
+        self.root = root
+        self.on_busy = on_busy
+        self.interval = interval
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.generations = {}
+        self.futures = {}
+        self.cancels = {}
+        self.running = 0
+
+    def submit(self, key, job, on_done, on_error=None):
+        """
+        Ставит задачу в очередь
+
+        :param key: ключ задачи (например, 'query' или 'save')
+        :param job: функция, принимающая threading.Event отмены и возвращающая результат
+        :param on_done: функция, которая получит результат в потоке Tk
+        :param on_error: функция, которая получит исключение в потоке Tk
+        """
+        generation = self.generations.get(key, 0) + 1
+        self.generations[key] = generation
+        if key in self.cancels:
+            self.cancels[key].set()
+            self.futures[key].cancel()
+        cancel = threading.Event()
+        future = self.executor.submit(job, cancel)
+        self.cancels[key] = cancel
+        self.futures[key] = future
+        self.set_busy(1)
+        self.root.after(self.interval, self.poll, key, generation, future, on_done, on_error)
+
+    def poll(self, key, generation, future, on_done, on_error):
+        """
+        Проверяет завершение задачи и передает ее результат обработчику
+        """
+        if not future.done():
+            self.root.after(self.interval, self.poll, key, generation, future, on_done, on_error)
+            return
+        self.set_busy(-1)
+        if future.cancelled() or generation != self.generations[key]:
+            return
+        error = future.exception()
+        if isinstance(error, Cancelled):
+            return
+        if error is not None:
+            if on_error is None:
+                raise error
+            on_error(error)
+        else:
+            on_done(future.result())
+
+    def set_busy(self, delta):
+        """
+        Учитывает количество выполняемых задач и сообщает об изменении состояния
+        """
+        was_busy = self.running > 0
+        self.running += delta
+        if self.on_busy is not None and was_busy != (self.running > 0):
+            self.on_busy(self.running > 0)
+
+    def shutdown(self):
+        """
+        Отменяет все задачи и останавливает поток исполнителя
+        """
+        for cancel in self.cancels.values():
+            cancel.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
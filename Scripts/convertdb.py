@@ -0,0 +1,12 @@
+import argparse
+
+from Library.storage import STORAGES, convert
+
+parser = argparse.ArgumentParser(description='Переводит базу данных в другой формат хранения')
+parser.add_argument('route', nargs='?', default='../Data/index.csv', help='путь основного файла базы данных')
+parser.add_argument('--format', dest='fmt', choices=sorted(STORAGES), default='parquet', help='новый формат')
+parser.add_argument('--migrate', action='store_true',
+                    help='не менять формат, только перевести данные к float32 с NaN вместо отметки -200')
+args = parser.parse_args()
+
+convert(args.route, None if args.migrate else args.fmt)
@@ -0,0 +1,53 @@
+import argparse
+import json
+import sys
+import time
+
+from Library.data import Data
+from Library.export import city_specs, export, read_specs
+from Library.storage import VALUE_COLUMNS
+
+
+def main(argv=None):
+    """
+    Точка входа: строит диаграммы и отчеты без графического интерфейса
+
+    :param argv: аргументы командной строки (по умолчанию sys.argv)
+    """
+    parser = argparse.ArgumentParser(description='Строит диаграммы и отчеты по базе данных без графического интерфейса')
+    parser.add_argument('route', nargs='?', default='../Data/index.csv', help='путь основного файла базы данных')
+    parser.add_argument('--specs', help='файл с фильтрами, строки вида "город;день;месяц;год" ("*" - все значения)')
+    parser.add_argument('--year', type=int, help='без --specs: строить диаграммы каждого города за этот год, '
+                                                 'а не за весь период')
+    parser.add_argument('--output', default='../Graphics', help='каталог для результатов')
+    parser.add_argument('--column', choices=VALUE_COLUMNS, default='tempMax', help='столбец для диаграмм')
+    parser.add_argument('--workers', type=int, default=None, help='количество процессов (по умолчанию - по числу '
+                                                                   'процессоров)')
+    parser.add_argument('--dpi', type=int, default=100, help='разрешение изображений')
+    parser.add_argument('--json', action='store_true', help='выводить сведения о результатах строками JSON')
+    args = parser.parse_args(argv)
+
+    if args.specs:
+        specs = read_specs(args.specs)
+    else:
+        specs = city_specs(Data(args.route, lazy=True).getcities(), args.year)
+
+    def report(result):
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+        else:
+            print('{0:03} {1}: {2}'.format(result['number'], ' '.join(result['filters']),
+                                           result.get('error') or result['chart'] or result['report']), flush=True)
+
+    started = time.perf_counter()
+    results = export(args.route, specs, args.output, args.column, args.workers, args.dpi, on_result=report)
+    stats = {'event': 'done', 'outputs': len(results), 'charts': sum(1 for r in results if r['chart']),
+             'seconds': round(time.perf_counter() - started, 3)}
+    if args.json:
+        print(json.dumps(stats, ensure_ascii=False))
+    else:
+        print('Результатов: {outputs}, диаграмм: {charts}, время: {seconds} с'.format(**stats))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
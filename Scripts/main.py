@@ -1,23 +1,30 @@
+import argparse
+import csv
 import datetime as dt
+import importlib
 import os
 import re
+import sys
 import tkinter as tk
 import tkinter.filedialog as fd
 import tkinter.messagebox as msg
 import tkinter.ttk as ttk
 
-import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd
-from dateutil.relativedelta import relativedelta
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-
-from Library.data import Data
 from Library.editdialog import EditDialog
+from Library.timing import Profiler, Timings, log_to_file
+from Library.virtualtable import VirtualTable
+from Library.worker import Worker, check
 
+# numpy, pandas и matplotlib (а с ними Library.data, Library.charts, Library.analytics и Library.storage)
+# импортируются в фоне после появления окна, поэтому окно открывается, не дожидаясь их загрузки
 
 # from Scripts.insertdialog import InsertDialog
 
+# этапы, замеры которых показываются в строке состояния
+STATUS_STAGES = [('query', 'запрос'), ('get_data', 'данные'), ('analytics', 'отчет'), ('chart', 'диаграмма'),
+                 ('table_fill', 'таблица'), ('layout', 'компоновка'), ('draw', 'отрисовка'), ('load', 'загрузка'),
+                 ('save', 'сохранение')]
+
 
 class Gui:
     """
@@ -25,17 +32,35 @@ class Gui:
     отвечающий за отображение информацци о базе данных и графиков
     """
 
-    def __init__(self, data):
+    def __init__(self, route="../Data/index.csv", out_of_core=False, memory_limit=None, load_workers=None):
         """
-        Конструктор калсса Gui. Хз, что тут писать.
-        :param data: База данных - экземпляр класса Data
+        Конструктор калсса Gui. Окно со списком городов из основного файла базы показывается сразу,
+        а сама база (из снимка, если файлы не менялись) и тяжелые библиотеки загружаются в фоне.
+        :param route: путь основного файла базы данных
+        :param out_of_core: обрабатывать базу по частям, не загружая ее в память (см. Data)
+        :param memory_limit: лимит памяти в байтах для данных городов в режиме out_of_core
+        :param load_workers: количество потоков для чтения файлов городов (None - по числу процессоров)
         """
         self.imageId = None
+        self.out_of_core = out_of_core
+        self.memory_limit = memory_limit
+        self.load_workers = load_workers
         self.view = 'groove'
-        self.pointer = data
+        self.pointer = None
+        self.table_note = ''
+        cities, first_year, last_year = index_summary(route)
         self.root = tk.Tk()
         self.root.title("PyWeather")
         self.root.resizable(False, False)
+        self.root.protocol('WM_DELETE_WINDOW', self.close)
+        self.worker = Worker(self.root, on_busy=self.set_busy)
+        self.no_data = object()
+        self.journal_limit = 100
+        self.edits = 0
+        self.timings = Timings()
+        self.profiler = Profiler()
+        os.makedirs('../Output', exist_ok=True)
+        log_to_file('../Output/timings.log')
 
         def daysupdatecounter(dump):
             """
@@ -74,9 +99,9 @@ class Gui:
         citylabel.grid(row=0, column=0)
 
         self.cityfilter = tk.StringVar(value='Все')
-        citychoice = ttk.Combobox(toolbar, textvariable=self.cityfilter, values=['Все'] + self.pointer.getcities(),
-                                  state='readonly', width=30)
-        citychoice.grid(row=0, column=1)
+        self.citychoice = ttk.Combobox(toolbar, textvariable=self.cityfilter, values=['Все'] + cities,
+                                       state='readonly', width=30)
+        self.citychoice.grid(row=0, column=1)
 
         datelabel = ttk.Label(toolbar, text='Дата:', width=10, anchor="e")
         datelabel.grid(row=0, column=2, padx=5)
@@ -93,54 +118,39 @@ class Gui:
                              state='readonly', width=3)
         month.grid(row=0, column=4)
 
-        year = ttk.Combobox(toolbar, textvariable=self.yearfilter, state='readonly', width=5, values=['Все'] + list(
-            range(self.pointer.getdate()[0].year, self.pointer.getdate()[1].year + 1)))
-        year.grid(row=0, column=5)
+        self.yearchoice = ttk.Combobox(toolbar, textvariable=self.yearfilter, state='readonly', width=5,
+                                       values=['Все'] + list(range(first_year, last_year + 1)))
+        self.yearchoice.grid(row=0, column=5)
 
-        refresh = ttk.Button(toolbar, text='Обновить', command=lambda: self.askdata(list(
-            map(lambda x: x.get(), [self.cityfilter, self.dayfilter, self.monthfilter, self.yearfilter]))))
+        refresh = ttk.Button(toolbar, text='Обновить', command=lambda: self.askdata(self.filters()))
         refresh.grid(row=0, column=6, padx=30)
 
+        rangelabel = ttk.Label(toolbar, text='Период с:', width=10, anchor="e")
+        rangelabel.grid(row=1, column=0, pady=4)
+
+        self.startfilter = tk.StringVar()
+        self.endfilter = tk.StringVar()
+        rangeframe = ttk.Frame(toolbar)
+        rangeframe.grid(row=1, column=1, columnspan=5, sticky='w')
+        ttk.Entry(rangeframe, textvariable=self.startfilter, width=11).grid(row=0, column=0)
+        ttk.Label(rangeframe, text='по:').grid(row=0, column=1, padx=5)
+        ttk.Entry(rangeframe, textvariable=self.endfilter, width=11).grid(row=0, column=2)
+        ttk.Label(rangeframe, text='ДД.ММ.ГГГГ, пусто - без ограничения').grid(row=0, column=3, padx=5)
+
         month.bind('<<ComboboxSelected>>', daysupdatecounter)
-        year.bind('<<ComboboxSelected>>', daysupdatecounter)
+        self.yearchoice.bind('<<ComboboxSelected>>', daysupdatecounter)
         # </editor-fold>
 
         # <editor-fold desc="Table">
         tableframe = ttk.Frame(top_left, relief='groove', borderwidth=2)
         tableframe.grid(row=1, column=0, columnspan=3)
 
-        self.table = ttk.Treeview(tableframe, height=15,
-                                  columns=["statName", "date", "tempMax", "tempMin", "press", "wind", "falls"])
-
-        scroll = ttk.Scrollbar(tableframe, orient="vertical", command=self.table.yview)
-        self.table.configure(yscrollcommand=scroll.set)
-        self.table['show'] = "headings"
-        scroll.pack(side='right', fill='y')
-        self.table.pack(side='left', fill='y')
-
-        self.table.column('#0', width=50)
-        self.table.heading('#0', text='ID')
-
-        self.table.column('statName', width=180)
-        self.table.heading('statName', text='Город')
-
-        self.table.column('date', width=70)
-        self.table.heading('date', text='Дата')
-
-        self.table.column('tempMax', width=80)
-        self.table.heading('tempMax', text='Maкс температура')
-
-        self.table.column('tempMin', width=80)
-        self.table.heading('tempMin', text='Mин темпратура')
-
-        self.table.column('press', width=80)
-        self.table.heading('press', text='Атм давление')
-
-        self.table.column('wind', width=50)
-        self.table.heading('wind', text='Скорость ветра')
-
-        self.table.column('falls', width=50)
-        self.table.heading('falls', text='Осадки')
+        self.table = VirtualTable(tableframe, [('statName', 'Город', 180), ('date', 'Дата', 70),
+                                               ('tempMax', 'Maкс температура', 80),
+                                               ('tempMin', 'Mин темпратура', 80),
+                                               ('press', 'Атм давление', 80), ('wind', 'Скорость ветра', 50),
+                                               ('falls', 'Осадки', 50)], height=15)
+        self.table.pack()
         # </editor-fold>
 
         # <editor-fold desc="Right editor panel">
@@ -175,10 +185,16 @@ class Gui:
         self.column_combo = ttk.Combobox(editor, textvariable=self.column, values=list(self.column_dict.keys()),
                                          state='readonly')
         self.column_combo.current(0)
-        self.column_combo.bind('<<ComboboxSelected>>', lambda event: self.askdata(list(
-            map(lambda x: x.get(), [self.cityfilter, self.dayfilter, self.monthfilter,
-                                    self.yearfilter]))))  # the same as in update button. It can be removed
+        self.column_combo.bind('<<ComboboxSelected>>', lambda event: self.askdata(
+            self.filters()))  # the same as in update button. It can be removed
         self.column_combo.grid(row=7, column=0, pady=8)
+
+        self.progress = ttk.Progressbar(editor, mode='indeterminate', length=140)
+
+        self.profiling = tk.BooleanVar(value=False)
+        profile_check = ttk.Checkbutton(editor, text='Профилирование', variable=self.profiling,
+                                        command=self.toggle_profiling)
+        profile_check.grid(row=9, column=0, pady=8)
         # </editor-fold>
 
         # <editor-fold desc="Graphs area">
@@ -186,25 +202,19 @@ class Gui:
         self.graph_area.pack(anchor='s', fill='y')
 
         # </editor-fold>
+        self.status = ttk.Label(self.root, anchor='w', relief='sunken')
+        self.status.pack(side='bottom', fill='x')
         self.analitics = ''
+        self.extremes = {}
         self.inability_msg = 'Невозможно построить график'
-        self.analitics_msg = """                    В данном срезе данных
-        Самый холодный город: {0}, дата: {1}, температура опустилась до {2}
-        Самый теплый город: {3}, дата: {4}, температура поднялась до {5}
-        Город с наибольшим атмосферным давлением: {6}, дата: {7}, Давление: {8}
-        Город с наибольшим количеством осадков: {9}, дата: {10}, Осадки: {11}
-        Город с сильнейшим ветром: {12}, дата: {13}, Скорость ветра: {14}
-                            Данные были соханены в log.txt
-        """
         self.msge = tk.Label(self.graph_area, text=self.inability_msg, justify='left')
         self.msge.grid(row=0, column=0)
-        self.fig = plt.Figure()
-        self.plot = self.fig.add_subplot(111)
-        self.graph = FigureCanvasTkAgg(self.fig, master=self.graph_area)
-        self.graph.get_tk_widget().grid(row=0, column=0)
-        self.graph.get_tk_widget().grid_forget()
-
-        self.askdata(['Все', 'Все', 'Все', 'Все'])
+        self.fig = None
+        self.graph = None
+        self.renderer = None
+        self.status.config(text='Загрузка базы данных...')
+        self.worker.submit('start', lambda cancel: self.profiler.call(self.start, route), self.ready,
+                           on_error=self.failed)
 
         analitics_but = ttk.Button(editor, text="Текстовый отчет", command=self.show_analitics)
         analitics_but.grid(row=5, column=0, pady=8)
@@ -214,45 +224,39 @@ class Gui:
 
     def show_analitics(self):
         """
-        Выводит результаты анализа на экран
+        Выводит результаты анализа на экран и дописывает их в журнал анализа
         """
-        self.graph.get_tk_widget().grid_forget()
+        if self.graph is not None:
+            self.graph.get_tk_widget().grid_forget()
         self.msge.grid(row=0, column=0)
         self.msge.config(text=self.analitics)
-        with open('../Output/log.txt', 'w+') as f:
-            f.write(self.analitics)
+        with open('../Output/log.txt', 'a', encoding='utf-8') as f:
+            f.write(dt.datetime.now().strftime('%d.%m.%Y %H:%M:%S') + '\n' + self.analitics + '\n')
 
     def savefigure(self):
         """
-        Сохраняет текущую диаграмму в файл
+        Сохраняет текущую диаграмму в файл со следующим свободным номером
         """
-        if not self.imageId:
-            files = [f for f in os.listdir('../Graphics') if
-                     os.path.isfile('../Graphics' + f) and not re.match(r'\d\d\d\.png', f)]
-            indx = pd.DataFrame(columns=['ID', 'city', 'minDate', 'maxDate'])
-
-            if files:
-                for file in files:
-                    indx = indx.append(pd.read_csv('../Graphics' + file, encoding="utf-8", sep=";"), sort=False)
-                # print(indx)
-                self.imageId = max(indx['ID'].to_list())
-            else:
-                self.imageId = 0
+        if self.fig is None:
+            return
+        from Library.storage import next_id
+        os.makedirs('../Graphics', exist_ok=True)
+        self.imageId = next_id('../Graphics')
         self.fig.savefig('../Graphics/{0:03}.png'.format(self.imageId))
 
     def load(self):
         """
         Загружает выбранную пользователем базу данных
         """
+        if self.pointer is None:
+            return
         route = fd.askopenfilename()
-        print(route)
         if not re.match(r'.*\d{3}\.csv', route):
             if route:
-                self.pointer.load_data(route)
+                self.worker.submit('load', lambda cancel: self.profiler.call(self.pointer.load_data, route),
+                                   lambda result: self.askdata(self.filters()))
         else:
             msg.showerror('Недопустимое имя', "Имя файла имеет недопустимы формат. Пожалуйста, введите другое имя.")
-        self.askdata(list(
-            map(lambda x: x.get(), [self.cityfilter, self.dayfilter, self.monthfilter, self.yearfilter])))
 
     def insert(self):
         """
@@ -268,14 +272,8 @@ class Gui:
                 self.edit_button.config(state=tk.NORMAL)
             if edialog.exit_code == 1:
                 new_values = edialog.get_values()
-                print(new_values)
-                print(curr_item)
-                # self.table.insert("", index, iid=curr_item, text=curr_item, values=new_values)
-                self.table.insert('', self.table.index(curr_item) + 1,
-                                  iid=[dt.datetime.strptime(new_values[1], '%d.%m.%Y'), new_values[0]], text=curr_item,
-                                  values=new_values)
                 # new_values[1] = dt.datetime.strptime(new_values[1], "%d.%m.%Y")
-                self.pointer.insert_row(curr_item, new_values)
+                self.edit(lambda: self.pointer.insert_row(curr_item, new_values))
 
     def editrow(self):
         """
@@ -291,21 +289,22 @@ class Gui:
                 self.edit_button.config(state=tk.NORMAL)
             if edialog.exit_code == 1:
                 new_values = edialog.get_values()
-                self.table.item(curr_item, text=curr_item, values=new_values)
-                new_values[1] = dt.datetime.strptime(new_values[1], "%d.%m.%Y")
-                self.pointer.update_row(curr_item, new_values)
+                self.edit(lambda: self.pointer.update_row(curr_item, new_values))
 
     def save(self):
         """
         Сохраняет базу данных
         """
+        if self.pointer is None:
+            return
         route = fd.asksaveasfilename(title="Select file to save",
                                      filetypes=(("csv files", ".csv"),
                                                 ("all files", ".*")),
                                      defaultextension='.csv',
                                      initialdir="../Data/")
         if not re.match(r'\d{3}\.csv', route):
-            self.pointer.save(route)
+            self.worker.submit('save', lambda cancel: self.profiler.call(self.pointer.save, route),
+                               lambda result: self.update_status())
         else:
             msg.showerror('Недопустимое имя', "Имя файла имеет недопустимы формат. Пожалуйста, введите другое имя.")
 
@@ -315,239 +314,258 @@ class Gui:
         """
         if self.table.focus() != '':
             curr_item = self.table.focus()
-            self.table.delete(curr_item)
-            self.pointer.delete_row(curr_item)
+            self.edit(lambda: self.pointer.delete_row(curr_item))
 
-    def askdata(self, filt):
+    def edit(self, job):
         """
-        Запрашивает данные из базы на основе фильтров, выводит их в таблицу и рисует график
-        :param filt: Список фильтров
+        Выполняет правку данных в фоновом потоке, после уже поставленных в очередь сохранения или загрузки,
+        чтобы окно не ждало их завершения; затем обновляет таблицу
+        :param job: функция без аргументов, изменяющая данные
         """
-        self.msge.grid_forget()
-        self.msge.config(text=self.inability_msg)
-        self.graph.get_tk_widget().grid(row=0, column=0)
-        df = self.pointer.get_data(filt)
-        # print(df)
-        analisys = [-275, 10000, -275, -275, -275]
-        idx = [[], [], [], [], [], [], []]
-        for city in df.keys():
-            if df[city].size > 0:
-                data = [df[city]['tempMax'].idxmax(), df[city]['tempMin'].idxmin(),
-                        df[city]['press'].idxmax(),
-                        df[city]['falls'].idxmax(), df[city]['wind'].idxmax()]
-                # print(Data[0])
-                # print(analisys[0])
-                (idx[0], analisys[0]) = ([city, data[0]], df[city].loc[data[0]]['tempMax']) if \
-                    df[city].loc[data[0]]['tempMax'] > analisys[0] and \
-                    df[city].loc[data[0]]['tempMax'] != -200 else (idx[0], analisys[0])
-                (idx[1], analisys[1]) = ([city, data[1]], df[city].loc[data[1]]['tempMin']) if \
-                    df[city].loc[data[1]]['tempMin'] < analisys[1] and \
-                    df[city].loc[data[1]]['tempMin'] != -200 else (idx[1], analisys[1])
-                (idx[2], analisys[2]) = ([city, data[2]], df[city].loc[data[2]]['press']) if \
-                    df[city].loc[data[2]]['press'] > analisys[2] and \
-                    df[city].loc[data[2]]['press'] != -200 else (idx[2], analisys[2])
-                (idx[3], analisys[3]) = ([city, data[3]], df[city].loc[data[3]]['falls']) if \
-                    df[city].loc[data[3]]['falls'] > analisys[3] and \
-                    df[city].loc[data[3]]['falls'] != -200 else (idx[3], analisys[3])
-                (idx[4], analisys[4]) = ([city, data[4]], df[city].loc[data[4]]['wind']) if \
-                    df[city].loc[data[4]]['wind'] > analisys[4] and \
-                    df[city].loc[data[4]]['wind'] != -200 else (idx[4], analisys[4])
-                # map(lambda a: [a[0], dt.date(a[1].years, a[1].months, a[1].days)], idx)
-        # print(idx, analisys, sep='\n\n')
-        analisys = list(zip(idx, analisys))
-        datalist = []
-        for x in analisys:
-            # print(len(x[0]), x)
-            datalist += [x[0][0], dt.datetime.strftime(x[0][1], '%d.%m.%Y'), x[1]] if len(x[0]) != 0 else [
-                'Недостаточно данных', 'Недостаточно данных', 'Недостаточно данных']
-            # for x in range(0, len(Data) - 1, 2):
-            #     print(x)
-            #     if analisys[x] < Data[x]:
-            #         analisys[x] = Data[x]
-            #     if analisys[x+1] > Data[x+1]:
-            #         analisys[x+1] = Data[x+1]
-        # print(datalist)
-        self.analitics = self.analitics_msg.format(*datalist)
-
-        self.table.delete(*self.table.get_children())
-        for city in df.keys():
-            # print(city)
-            for row in df[city].to_dict('index').items():
-                row = list(row)
-                row[0] = dt.date(row[0].year, row[0].month, row[0].day)
-                # print(row)
-                self.table.insert("", "end", iid=str(row[0]) + ' ' + city, text=row[0].strftime("%d.%m.%Y"),
-                                  values=[city, row[0].strftime("%d.%m.%Y")] + list(row[1].values()))
+        # у каждой правки свой ключ, чтобы следующая правка не отменяла предыдущую
+        self.edits += 1
+        self.worker.submit(('edit', self.edits), lambda cancel: self.profiler.call(job), lambda result: self.edited(),
+                           self.edit_failed)
 
+    def edited(self):
+        """
+        Обновляет таблицу после правки и при необходимости переносит журнал в основные файлы
+        """
+        self.compact()
+        self.refresh()
 
-        # <editor-fold desc="diagram">
-        column = self.column_dict[self.column.get()]
-        # <editor-fold desc="BAR: All cities in one day">
+    def edit_failed(self, error):
+        """
+        Сообщает об ошибке правки
+        """
+        msg.showerror('Ошибка изменения', 'Не удалось изменить данные: {0}'.format(error))
+        self.refresh()
+
+    def compact(self):
+        """
+        Когда в журнале накопилось достаточно правок, в фоне переносит их в основные файлы базы
+        """
+        if self.pointer.journal.size >= self.journal_limit:
+            self.worker.submit('compact', lambda cancel: self.profiler.call(self.pointer.save_changes),
+                               lambda result: self.update_status())
+
+    def refresh(self):
+        """
+        Заново запрашивает данные по текущим фильтрам, сохраняя позицию прокрутки таблицы
+        """
+        self.askdata(self.filters(), keep_position=True)
+
+    def filters(self):
+        """
+        Собирает фильтры из панели фильтров
+        :return: список [город, день, месяц, год, начало периода, конец периода] или None,
+                 если период введен неверно
+        """
+        from Library.data import date_key
+        filt = [x.get() for x in [self.cityfilter, self.dayfilter, self.monthfilter, self.yearfilter]]
+        bounds = [self.startfilter.get().strip() or 'Все', self.endfilter.get().strip() or 'Все']
         try:
-            # if True:
-            if filt[0] == 'Все' and filt[1] != 'Все' and filt[2] != 'Все' and filt[3] != 'Все':
-                # cities = df.keys()
-                values = [x.loc[filt[3] + "-" + filt[2] + "-" + filt[1]][column] for x in df.values()]
-                values = list(map(lambda t: 0 if t == -200 else t, values))
-
-                x = np.arange(len(df.keys()))
-                if self.plot:
-                    self.fig.clf()
-                bb = self.fig.add_subplot(111)
-                # print(bb)
-                self.plot = bb.bar(x, values)
-                bb.set_xticks(x, False)
-                bb.set_xticklabels(df.keys(), rotation='vertical')
-                bb.set_title(
-                    r'Погода в городах России на {0:02}.{1:02}.{2:04}'.format(int(filt[1]), int(filt[2]), int(filt[3])))
-                self.fig.tight_layout()
-                self.graph.draw()
-        # </editor-fold>
+            start, end = [date_key(x) for x in bounds]
+        except ValueError:
+            msg.showerror('Ошибка ввода данных', 'Неверный формат даты периода. Используйте ДД.ММ.ГГГГ.')
+            return None
+        if start is not None and end is not None and start > end:
+            msg.showerror('Ошибка ввода данных', 'Начало периода позже его конца.')
+            return None
+        return filt + bounds
+
+    def askdata(self, filt, keep_position=False):
+        """
+        Запрашивает данные из базы на основе фильтров, выводит их в таблицу и рисует график.
+        Запрос выполняется в фоновом потоке; если фильтры изменятся раньше, чем он завершится,
+        его результат будет отброшен.
+        :param filt: Список фильтров
+        :param keep_position: сохранить позицию прокрутки таблицы (после редактирования)
+        """
+        if filt is None or self.pointer is None:
+            return
+        column = self.column_dict[self.column.get()]
+        self.worker.submit('query', lambda cancel: self.profiler.call(self.query, filt, column, cancel),
+                           lambda result: self.profiler.call(self.show, result, keep_position))
 
-            # <editor-fold desc="PLOT: One month of year in one city">
-            elif filt[0] != 'Все' and filt[1] == 'Все' and filt[2] != 'Все' and filt[3] != 'Все':
-                dates = []
-                values = []
-
-                for row in df[filt[0]].iterrows():
-                    dates.append(row[0].strftime("%d.%m.%Y"))
-                    values.append(row[1][column])
-
-                # print(dates)
-                # print(values)
-
-                x = np.arange(len(dates))
-                # print(x)
-                values = list(map(lambda t: 0 if t == -200 else t, values))
-
-                if self.plot:
-                    self.fig.clf()
-                bb = self.fig.add_subplot(111)
-                self.plot = bb.plot(x, values, 'o-')
-                bb.set_title('Данные по одному месяцу в г.' + filt[0])
-                bb.set_xticks(x, False)
-                bb.set_xticklabels(dates, rotation='vertical')
-                self.fig.tight_layout()
-                self.graph.draw()
-
-                # One month of year in one city
-            # </editor-fold>
-            # <editor-fold desc="PLOT: annual in one city">
-            elif filt[0] != 'Все' and filt[1] == 'Все' and filt[2] == 'Все' and filt[3] != 'Все':
-                dates = []
-                values = []
-                for month in range(1, 13):
-                    # print(df[filt[0]][df[filt[0]].index.month == month][Data].median())
-                    # print(df[filt[0]].index.strftime("%m.%Y"))
-                    dates.append(df[filt[0]][df[filt[0]].index.month == month].index[0].strftime("%m.%Y"))
-                    values.append(df[filt[0]][df[filt[0]].index.month == month].median()[column])
-
-                # print(dates)
-                # print(values)
-
-                x = np.arange(len(dates))
-                # print(x)
-                values = list(map(lambda t: 0 if t == -200 else t, values))
-
-                if self.plot:
-                    self.fig.clf()
-                bb = self.fig.add_subplot(111)
-                self.plot = bb.plot(x, values, 'o-')
-                # print(filt[0])
-                bb.set_title('Годовое изменение погоды в г. ' + filt[0])
-                bb.set_xticks(x, False)
-                bb.set_xticklabels(dates, rotation='vertical')
-                self.fig.tight_layout()
-                self.graph.draw()
-
-                pass
-            # </editor-fold>
-
-            # <editor-fold desc="PLOT: temp during several years in one city">
-            elif filt[0] != 'Все' and filt[1] == 'Все' and filt[2] == 'Все' and filt[3] == 'Все':
-                city = list(df.keys())[0]
-                # print(city)
-
-                dates = []
-                values = []
-                date = self.pointer.get_date_list()[0][city]
-                print(list(map(lambda tt: tt[city], self.pointer.get_date_list())))
-                while self.pointer.get_date_list()[0][city] <= date <= self.pointer.get_date_list()[1][city]:
-                    # print(df[city][df[city].index.month == month][Data].median())
-                    # print(df[city].index.strftime("%m.%Y"))
-                    print(df[city][(df[city].index.month == date.month) &
-                                   (df[city].index.year == date.year)].index)
-                    # print(df[city][df[city].index.month == date.month].index[0].strftime("%m.%Y"))
-                    dates.append(df[city][(df[city].index.month == date.month) &
-                                          (df[city].index.year == date.year)].index[0].strftime("%m.%Y"))
-                    # print(df[city][(df[city].index.month == date.month) &
-                    #                        (df[city].index.year == date.year)].median()[column])
-                    values.append(df[city][(df[city].index.month == date.month) &
-                                           (df[city].index.year == date.year)].median()[column])
-                    date += relativedelta(months=1)
-
-                # print(dates)
-                # print(values)
-                values = list(map(lambda t: 0 if t == -200 else t, values))
-
-                # print(x)
-
-                if self.plot:
-                    self.fig.clf()
-                bb = self.fig.add_subplot(111)
-                x = np.arange(0, len(dates), 1)
-                self.plot = bb.plot(x, values, 'o-')
-                if len(values) > 3 * 12:
-                    x = np.arange(0, len(dates), 12)
-                    dates = dates[::12]
-                bb.set_xticks(x, False)
-                bb.set_xticklabels(dates, rotation='vertical')
-
-                bb.set_title(city)
-                self.fig.tight_layout()
-                self.graph.draw()
-
-            # <editor-fold desc="BAR: Average monthly temp among cities">
-            elif filt[0] == 'Все' and filt[1] == 'Все' and filt[2] != 'Все' and filt[3] != 'Все':
-                dates = []
-                values = []
-                for city in list(df.keys()):
-                    # print(df[city][df[city].index.month == month][Data].median())
-                    # print(df[city].index.strftime("%m.%Y"))
-                    dates.append(city)
-                    values.append(df[city].mean()[column])
-
-                values = list(map(lambda t: 0 if t == -200 else t, values))
-                x = np.arange(len(df.keys()))
-                if self.plot:
-                    self.fig.clf()
-                bb = self.fig.add_subplot(111)
-                bb.set_xticks(x, False)
-                # print(bb)
-                self.plot = bb.bar(x, values)
-                bb.set_xticklabels(df.keys(), rotation='vertical')
-                self.fig.tight_layout()
-                self.graph.draw()
-            # </editor-fold>
+    def query(self, filt, column, cancel):
+        """
+        Выполняет запрос к базе данных и подготавливает таблицу, отчет и диаграмму.
+        Вызывается в фоновом потоке и не обращается к виджетам Tk.
+        :param filt: Список фильтров
+        :param column: столбец, по которому строится диаграмма
+        :param cancel: threading.Event отмены запроса
+        :return: (экстремумы, таблица в длинном формате, описание диаграммы)
+        """
+        with self.timings.span('query'):
+            df = self.pointer.get_data(filt)
+            check(cancel)
+            extremes = self.pointer.extremes(filt)
+            check(cancel)
+            table = self.pointer.get_table(filt)
+            check(cancel)
+            try:
+                chart = self.pointer.cached(('chart', column), filt, lambda: self.build_chart(df, filt, column))
+            except IndexError:
+                chart = self.no_data
+            return extremes, table, chart
+
+    def build_chart(self, df, filt, column):
+        """
+        Подготавливает диаграмму, замеряя время подготовки
+        """
+        from Library.charts import build_chart
+        with self.timings.span('chart'):
+            return build_chart(self.pointer, df, filt, column)
 
-            else:
-                if self.plot:
-                    self.fig.clf()
-                self.graph.get_tk_widget().grid_forget()
-                self.msge.grid(row=0, column=0)
-        except IndexError:
-            # except ValueError:
-            msg.showerror('Нет данных', "Данных по выбранным фильтрам недостаточно, чтобы построить графики")
-
-            if self.plot:
-                self.fig.clf()
+    def show(self, result, keep_position):
+        """
+        Выводит результат запроса в таблицу, текстовый отчет и на график
+        :param result: результат метода query
+        :param keep_position: сохранить позицию прокрутки таблицы
+        """
+        from Library.analytics import format_report
+        self.extremes, table, chart = result
+        self.analitics = format_report(self.extremes)
+        with self.timings.span('table_fill'):
+            self.table.set_frame(table, keep_position=keep_position)
+        total = table.attrs.get('total_rows')
+        self.table_note = '' if total is None else 'показано {0} из {1} рядов'.format(len(table), total)
+
+        # <editor-fold desc="diagram">
+        if chart is None or chart is self.no_data:
+            if chart is self.no_data:
+                msg.showerror('Нет данных', "Данных по выбранным фильтрам недостаточно, чтобы построить графики")
+            self.renderer.clear()
             self.graph.get_tk_widget().grid_forget()
+            self.msge.config(text=self.inability_msg)
             self.msge.grid(row=0, column=0)
+        else:
+            self.msge.grid_forget()
+            self.graph.get_tk_widget().grid(row=0, column=0)
+            self.renderer.render(chart)
         # </editor-fold>
+        self.update_status()
+
+    def start(self, route):
+        """
+        Загружает базу данных и импортирует библиотеки для диаграмм (выполняется в фоновом потоке)
+        :param route: путь основного файла базы данных
+        :return: экземпляр Data
+        """
+        from Library.data import Data
+        data = Data(route, memory_limit=self.memory_limit, timings=self.timings, snapshot=True,
+                    out_of_core=self.out_of_core, workers=self.load_workers)
+        for module in ('matplotlib.backends.backend_tkagg', 'Library.charts'):
+            importlib.import_module(module)
+        return data
+
+    def ready(self, data):
+        """
+        Завершает запуск в потоке Tk: создает область диаграммы, обновляет фильтры и показывает данные
+        :param data: загруженная база данных - экземпляр класса Data
+        """
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+
+        from Library.charts import ChartRenderer
+
+        self.pointer = data
+        self.fig = Figure()
+        self.graph = FigureCanvasTkAgg(self.fig, master=self.graph_area)
+        self.renderer = ChartRenderer(self.fig, timings=self.timings)
+        self.graph.mpl_connect('draw_event', lambda event: self.update_status())
+        self.citychoice.config(values=['Все'] + data.getcities())
+        self.yearchoice.config(values=['Все'] + list(range(data.getdate()[0].year, data.getdate()[1].year + 1)))
+        self.askdata(['Все', 'Все', 'Все', 'Все'])
+
+    def failed(self, error):
+        """
+        Сообщает об ошибке загрузки базы данных при запуске
+        """
+        self.status.config(text='База данных не загружена')
+        msg.showerror('Ошибка загрузки', 'Не удалось загрузить базу данных: {0}'.format(error))
 
-        # example of element:
-        # print(list(df.iterrows())[0])
+    def update_status(self):
+        """
+        Показывает в строке состояния время последних этапов обновления и, если таблица
+        обрезана, сколько рядов в ней показано
+        """
+        text = self.timings.summary(STATUS_STAGES)
+        if self.table_note:
+            text = self.table_note + ' | ' + text
+        if self.profiling.get():
+            text = 'Профилирование | ' + text
+        self.status.config(text=text)
+
+    def toggle_profiling(self):
+        """
+        Включает или выключает профилирование; при выключении профиль записывается в каталог Output
+        """
+        if self.profiling.get():
+            self.profiler.start()
+            self.update_status()
+            return
+        path = self.profiler.stop(dt.datetime.now().strftime('../Output/profile_%Y%m%d_%H%M%S.prof'))
+        self.update_status()
+        if path is not None:
+            self.status.config(text='Профиль записан: ' + os.path.abspath(path))
+
+    def set_busy(self, busy):
+        """
+        Показывает или скрывает индикатор выполнения фоновых задач
+        :param busy: True, если выполняется хотя бы одна задача
+        """
+        if busy:
+            self.progress.grid(row=8, column=0, pady=8)
+            self.progress.start(10)
+        else:
+            self.progress.stop()
+            self.progress.grid_forget()
+
+    def close(self):
+        """
+        Обработчик закрытия окна: отменяет фоновые задачи и закрывает окно
+        """
+        self.worker.shutdown()
+        self.root.destroy()
+
+
+def index_summary(route):
+    """
+    Читает из основного файла базы список городов и годы начала и конца данных без pandas,
+    чтобы заполнить фильтры до загрузки базы
+    :param route: путь основного файла базы данных
+    :return: (список городов, первый год, последний год)
+    """
+    cities = []
+    years = []
+    try:
+        with open(route, encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f, delimiter=';'):
+                cities.append(row['city'])
+                years += [int(row['minDate'][:4]), int(row['maxDate'][:4])]
+    except (OSError, KeyError, ValueError):
+        pass
+    return cities, min(years, default=dt.date.today().year), max(years, default=dt.date.today().year)
+
+
+def main(argv=None):
+    """
+    Точка входа: открывает главное окно программы
+    :param argv: аргументы командной строки (по умолчанию sys.argv)
+    """
+    parser = argparse.ArgumentParser(description='PyWeather: просмотр и редактирование базы данных погоды')
+    parser.add_argument('route', nargs='?', default='../Data/index.csv', help='путь основного файла базы данных')
+    parser.add_argument('--out-of-core', action='store_true', help='не загружать базу в память, а обрабатывать '
+                                                                   'данные по частям (для баз больше памяти)')
+    parser.add_argument('--memory-limit', type=int, default=None, help='лимит памяти в байтах для данных городов '
+                                                                       'в режиме --out-of-core')
+    parser.add_argument('--load-workers', type=int, default=None, help='количество потоков для чтения файлов '
+                                                                       'городов (по умолчанию - по числу процессоров)')
+    args = parser.parse_args(argv)
+    Gui(args.route, args.out_of_core, args.memory_limit, args.load_workers)
 
 
 if __name__ == "__main__":
-    Gui(Data())
+    sys.exit(main())
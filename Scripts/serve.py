@@ -0,0 +1,35 @@
+import argparse
+import sys
+
+from Library.data import Data
+from Library.service import QueryService
+
+
+def main(argv=None):
+    """
+    Точка входа: запускает HTTP-сервис запросов к базе данных
+
+    :param argv: аргументы командной строки (по умолчанию sys.argv)
+    """
+    parser = argparse.ArgumentParser(description='HTTP-сервис запросов к базе данных погоды (JSON/NDJSON)')
+    parser.add_argument('route', nargs='?', default='../Data/index.csv', help='путь основного файла базы данных')
+    parser.add_argument('--host', default='127.0.0.1', help='адрес, на котором принимаются соединения')
+    parser.add_argument('--port', type=int, default=8080, help='порт')
+    parser.add_argument('--workers', type=int, default=4, help='количество потоков для выполнения запросов')
+    parser.add_argument('--lazy', action='store_true', help='загружать данные городов при первом обращении')
+    parser.add_argument('--memory-limit', type=int, default=None, help='лимит памяти в байтах для ленивого режима')
+    parser.add_argument('--out-of-core', action='store_true', help='не загружать базу в память, а обрабатывать '
+                                                                   'данные по частям (для баз больше памяти)')
+    parser.add_argument('--load-workers', type=int, default=None, help='количество потоков для чтения файлов '
+                                                                       'городов (по умолчанию - по числу процессоров)')
+    args = parser.parse_args(argv)
+
+    data = Data(args.route, lazy=args.lazy, memory_limit=args.memory_limit, out_of_core=args.out_of_core,
+                workers=args.load_workers)
+    service = QueryService(data, workers=args.workers)
+    print('http://{0}:{1}/cities'.format(args.host, args.port), flush=True)
+    service.serve(args.host, args.port)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,35 @@
+import io
+import math
+import unittest
+
+from Library.archiveparser import parse_stream
+
+PAGE = ('<html><body><table><tbody align="center">'
+        '<tr><td title="a>b">01.02.2003</td><td>1</td><td>-2</td><td>0</td><td>1000</td><td>3</td><td>0</td></tr>'
+        '<tr><td>02.02.2003</td><td class=\'x>y\'><span title="<td>">7</span></td><td>2,5</td><td>0</td>'
+        '<td>1001</td><td></td><td>4</td></tr>'
+        '<!-- <tr><td>03.02.2003</td><td>9</td></tr> -->'
+        '<tr><td>04.02.2003<td>5<td>-5<td>0<td>999<td>1<td>&nbsp;</tr>'
+        '</tbody></table></body></html>').encode('utf-8')
+
+
+class ArchiveParserTest(unittest.TestCase):
+    def check(self, frame):
+        self.assertEqual(list(frame['date'].dt.strftime('%d.%m.%Y')), ['01.02.2003', '02.02.2003', '04.02.2003'])
+        self.assertEqual(list(frame['tempMax']), [1, 7, 5])
+        self.assertEqual(list(frame['tempMin']), [-2, 2.5, -5])
+        self.assertEqual(list(frame['press']), [1000, 1001, 999])
+        self.assertTrue(math.isnan(frame['wind'][1]))
+        self.assertTrue(math.isnan(frame['falls'][2]))
+
+    def test_quoted_attributes(self):
+        self.check(parse_stream(io.BytesIO(PAGE)))
+
+    def test_chunk_boundaries(self):
+        for chunk_size in (1, 2, 3, 5, 7, 13, 64):
+            with self.subTest(chunk_size=chunk_size):
+                self.check(parse_stream(io.BytesIO(PAGE), chunk_size=chunk_size))
+
+
+if __name__ == '__main__':
+    unittest.main()
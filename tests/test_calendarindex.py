@@ -0,0 +1,51 @@
+import itertools
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from Library.calendarindex import CalendarIndex
+
+
+def expected(index, day, month, year, start, end):
+    """
+    Позиции строк, отобранные простым просмотром индекса, в хронологическом порядке
+    """
+    keys = index.year * 10000 + index.month * 100 + index.day
+    mask = np.ones(len(index), dtype=bool)
+    for value, part in ((day, index.day), (month, index.month), (year, index.year)):
+        if value is not None:
+            mask &= part == value
+    if start is not None:
+        mask &= keys >= start
+    if end is not None:
+        mask &= keys <= end
+    positions = np.flatnonzero(mask)
+    return positions[np.argsort(keys[positions], kind='stable')]
+
+
+class CalendarIndexTest(unittest.TestCase):
+    def check(self, index):
+        calendar = CalendarIndex(index)
+        positions = np.arange(len(index))
+        for day, month, year, (start, end) in itertools.product(
+                (None, 1, 29, 31), (None, 2, 12), (None, 2000, 2003, 1999),
+                ((None, None), (20000215, None), (None, 20011231), (20000301, 20020228), (20020101, 20010101))):
+            with self.subTest(day=day, month=month, year=year, start=start, end=end):
+                taken = positions[calendar.take(day, month, year, start, end)]
+                self.assertEqual(taken.tolist(), expected(index, day, month, year, start, end).tolist())
+
+    def test_sorted_index(self):
+        self.check(pd.date_range('2000-01-01', '2003-12-31', name='date'))
+
+    def test_index_with_gaps(self):
+        dates = pd.date_range('2000-01-01', '2003-12-31', name='date')
+        self.check(dates[np.random.default_rng(0).random(len(dates)) > 0.3])
+
+    def test_unsorted_index(self):
+        dates = pd.date_range('2000-01-01', '2003-12-31', name='date')
+        self.check(dates[np.random.default_rng(1).permutation(len(dates))])
+
+
+if __name__ == '__main__':
+    unittest.main()
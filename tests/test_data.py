@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from Library.data import Data
+from Library.synthetic import generate
+
+
+class DataTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.route = generate(self.directory, stations=3, years=2, gaps=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def row(self, data, city, date):
+        return [float(x) for x in data.dictdf[city].loc[date].tolist()]
+
+
+class JournalTest(DataTest):
+    def test_unsaved_edits_are_replayed(self):
+        data = Data(self.route)
+        data.insert_row('', ['Станция-001', '01.01.2005', 1, 2, 3, 4, 5])
+        data.insert_row('', ['Новый город', '02.01.2005', 6, 7, 8, 9, 10])
+        data.update_row('2000-01-05 Станция-002', ['Станция-002', '', 11, 12, 13, 14, 15])
+        data.delete_row('2000-01-06 Станция-003')
+        self.assertEqual(data.journal.size, 4)
+
+        # база открывается заново без сохранения, как после аварийного завершения
+        reopened = Data(self.route)
+        self.assertEqual(self.row(reopened, 'Станция-001', '2005-01-01'), [1, 2, 3, 4, 5])
+        self.assertEqual(self.row(reopened, 'Новый город', '2005-01-02'), [6, 7, 8, 9, 10])
+        self.assertEqual(self.row(reopened, 'Станция-002', '2000-01-05'), [11, 12, 13, 14, 15])
+        self.assertNotIn('2000-01-06', reopened.dictdf['Станция-003'].index.strftime('%Y-%m-%d'))
+        self.assertEqual(reopened.dirty, {'Станция-001', 'Новый город', 'Станция-002', 'Станция-003'})
+        # проигрывание журнала не дописывает правки в него же
+        self.assertEqual(reopened.journal.size, 4)
+
+    def test_invalid_edits_are_not_journaled(self):
+        data = Data(self.route)
+        for edit in (lambda: data.insert_row('', ['Станция-001', '31.02.2005', 1, 2, 3, 4, 5]),
+                     lambda: data.insert_row('', ['Станция-001', '01.01.2005', 'много', 2, 3, 4, 5]),
+                     lambda: data.update_row('1990-01-01 Станция-001', ['Станция-001', '', 1, 2, 3, 4, 5]),
+                     lambda: data.delete_row('1990-01-01 Станция-001')):
+            with self.assertRaises((KeyError, ValueError)):
+                edit()
+        self.assertEqual(data.journal.size, 0)
+        self.assertFalse(os.path.exists(data.journal.path))
+
+    def test_save_clears_journal(self):
+        data = Data(self.route)
+        data.insert_row('', ['Станция-001', '01.01.2005', 1, 2, 3, 4, 5])
+        data.save_changes()
+        self.assertFalse(os.path.exists(data.journal.path))
+        reopened = Data(self.route)
+        self.assertEqual(self.row(reopened, 'Станция-001', '2005-01-01'), [1, 2, 3, 4, 5])
+        self.assertEqual(reopened.dirty, set())
+
+    def test_save_as_clears_previous_journal(self):
+        data = Data(self.route)
+        data.insert_row('', ['Станция-001', '01.01.2005', 1, 2, 3, 4, 5])
+        old = data.journal.path
+        os.makedirs(os.path.join(self.directory, 'copy'))
+        data.save_as(os.path.join(self.directory, 'copy', 'index.csv'))
+        self.assertFalse(os.path.exists(old))
+        self.assertNotIn('2005-01-01', Data(self.route).dictdf['Станция-001'].index.strftime('%Y-%m-%d'))
+
+
+
+class SaveChangesTest(DataTest):
+    def mtimes(self):
+        return {name: os.stat(os.path.join(self.directory, name)).st_mtime_ns for name in os.listdir(self.directory)}
+
+    def test_only_dirty_cities_are_written(self):
+        before = self.mtimes()
+        data = Data(self.route)
+        data.update_row('2000-01-05 Станция-002', ['Станция-002', '', 11, 12, 13, 14, 15])
+        data.save_changes()
+        after = self.mtimes()
+        self.assertEqual(after['001.csv'], before['001.csv'])
+        self.assertEqual(after['003.csv'], before['003.csv'])
+        self.assertNotEqual(after['002.csv'], before['002.csv'])
+        self.assertEqual(self.row(Data(self.route), 'Станция-002', '2000-01-05'), [11, 12, 13, 14, 15])
+
+    def test_added_and_removed_cities(self):
+        data = Data(self.route)
+        for date in data.dictdf['Станция-003'].index.strftime('%Y-%m-%d'):
+            data.delete_row(date + ' Станция-003')
+        data.insert_row('', ['Новый город', '02.01.2005', 6, 7, 8, 9, 10])
+        data.insert_row('', ['Станция-001', '01.01.2005', 1, 2, 3, 4, 5])
+        data.save_changes()
+        self.assertNotIn('003.csv', os.listdir(self.directory))
+        reopened = Data(self.route)
+        self.assertEqual(sorted(reopened.getcities()), ['Новый город', 'Станция-001', 'Станция-002'])
+        self.assertEqual(reopened.cityindex.at['Новый город', 'ID'], 4)
+        self.assertEqual(str(reopened.cityindex.at['Станция-001', 'maxDate'].date()), '2005-01-01')
+        self.assertEqual(self.row(reopened, 'Новый город', '2005-01-02'), [6, 7, 8, 9, 10])
+
+
+if __name__ == '__main__':
+    unittest.main()
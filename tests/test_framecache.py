@@ -0,0 +1,68 @@
+import threading
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from Library.framecache import FrameCache
+
+
+def city_frame(city):
+    """
+    Датафрейм города из 100 рядов, по которому можно узнать город
+    """
+    dates = pd.date_range('2000-01-01', periods=100, name='date')
+    return pd.DataFrame({'tempMax': np.full(100, len(city), dtype=np.float32)}, index=dates)
+
+
+class FrameCacheTest(unittest.TestCase):
+    def test_eviction_keeps_limit(self):
+        cities = ['Город{0}'.format(i) for i in range(10)]
+        size = int(city_frame(cities[0]).memory_usage(index=True, deep=True).sum())
+        cache = FrameCache(city_frame, cities, memory_limit=3 * size)
+        for city in cities:
+            cache[city]
+        self.assertEqual(cache.loaded(), cities[-3:])
+        self.assertLessEqual(cache.memory_usage(), 3 * size)
+
+    def test_on_evict_reports_evicted_cities(self):
+        cities = ['Город{0}'.format(i) for i in range(5)]
+        size = int(city_frame(cities[0]).memory_usage(index=True, deep=True).sum())
+        evicted = []
+        cache = FrameCache(city_frame, cities, memory_limit=2 * size, on_evict=evicted.append)
+        for city in cities:
+            cache[city]
+        self.assertEqual(evicted, cities[:3])
+        self.assertTrue(cache.resident(cities[-1], cache[cities[-1]]))
+        self.assertFalse(cache.resident(cities[0], city_frame(cities[0])))
+
+    def test_concurrent_reads(self):
+        cities = ['Город{0}'.format(i) for i in range(20)]
+        size = int(city_frame(cities[0]).memory_usage(index=True, deep=True).sum())
+        cache = FrameCache(city_frame, cities, memory_limit=4 * size)
+        errors = []
+
+        def read(seed):
+            rng = np.random.default_rng(seed)
+            for _ in range(500):
+                city = cities[rng.integers(len(cities))]
+                try:
+                    frame = cache[city]
+                except KeyError as error:
+                    errors.append(error)
+                    continue
+                if frame['tempMax'].iloc[0] != len(city):
+                    errors.append(city)
+
+        threads = [threading.Thread(target=read, args=(seed,)) for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(cache.memory_usage(), 4 * size)
+        self.assertEqual(len(cache.loaded()), len(set(cache.loaded())))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import datetime as dt
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.client import HTTPException
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pandas as pd
+
+from Library.ingest import Downloader, sync
+from Library.storage import CsvStorage
+from Library.synthetic import generate
+
+# сколько дней сервер-заглушка отдает за один запрос (как настоящий архив, обрезающий длинные интервалы)
+PAGE_DAYS = 20
+
+
+def page(station, begin, end):
+    """
+    Страница архива за интервал дат: tempMax - день месяца, tempMin - последние цифры кода станции
+    """
+    rows = []
+    date = begin
+    while date <= end and len(rows) < PAGE_DAYS:
+        rows.append('<tr><td>{0:%d.%m.%Y}</td><td>{1}</td><td>{2}</td><td>0</td><td>1000</td><td>3</td>'
+                    '<td>0</td></tr>'.format(date, date.day, int(station) % 100))
+        date += dt.timedelta(days=1)
+    return ('<html><body><table><tbody align="center">' + ''.join(rows) +
+            '</tbody></table></body></html>').encode('utf-8')
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """
+    Сервер-заглушка архива погоды; первый запрос каждой станции завершается ошибкой 503
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        station = form['station'][0]
+        with self.server.lock:
+            self.server.requests.append(station)
+            failed = station in self.server.failed
+            self.server.failed.add(station)
+        if not failed:
+            body = b'busy'
+            self.send_response(503)
+        else:
+            begin, end = [dt.datetime.strptime(form[name][0], '%d.%m.%Y').date()
+                          for name in ('datepicker_beg', 'datepicker_end')]
+            with self.server.lock:
+                self.server.pages.append((station, begin))
+            body = page(station, begin, end)
+            self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ArchiveServerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ArchiveHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.failed = set()
+        self.server.pages = []
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def downloader(self, **kwargs):
+        return Downloader('127.0.0.1', self.server.server_address[1], backoff=0, timeout=5, **kwargs)
+
+
+class DownloaderTest(ArchiveServerTest):
+    def test_download_windows_and_retries(self):
+        downloader = self.downloader(workers=3, window=30)
+        begin, end = dt.date(2000, 1, 1), dt.date(2000, 3, 31)
+        done = []
+        result = downloader.download(['111101', '222202'], begin, end, on_station=lambda code, df: done.append(code))
+        self.assertEqual(sorted(done), ['111101', '222202'])
+        for station in ('111101', '222202'):
+            frame = result[station]
+            self.assertEqual(list(frame['date'].dt.date), [begin + dt.timedelta(days=i) for i in range(91)])
+            self.assertEqual(list(frame['tempMax']), list(frame['date'].dt.day))
+            self.assertTrue((frame['tempMin'] == int(station) % 100).all())
+        self.assertEqual(downloader.retried, 2)
+        self.assertEqual(downloader.requests, len(self.server.requests))
+
+    def test_gives_up_after_retries(self):
+        downloader = self.downloader(workers=1, retries=0)
+        with self.assertRaises(HTTPException):
+            downloader.download(['333303'], dt.date(2000, 1, 1), dt.date(2000, 1, 10))
+        self.assertEqual(self.server.requests, ['333303'])
+
+
+
+class SyncTest(ArchiveServerTest):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.route = generate(self.directory, stations=1, years=1, gaps=0)
+        self.path = os.path.join(self.directory, '001')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super().tearDown()
+
+    def sync(self):
+        return sync(self.route, [['27001', 'Станция-001']], self.downloader(workers=1), dt.date(2001, 1, 20))
+
+    def check(self):
+        frame = CsvStorage().read(self.path)
+        self.assertEqual(len(frame), 366 + 20)
+        self.assertTrue(frame.index.is_monotonic_increasing and frame.index.is_unique)
+        self.assertEqual(frame.loc['2001-01-20', 'tempMax'], 20)
+        index = pd.read_csv(self.route, sep=';', index_col='city')
+        self.assertEqual(index.at['Станция-001', 'maxDate'], '2001-01-20')
+
+    def test_sync_downloads_only_new_dates(self):
+        self.sync()
+        self.check()
+        self.assertEqual(self.server.pages[0], ('27001', dt.date(2001, 1, 1)))
+        self.server.pages.clear()
+        self.sync()
+        self.assertEqual(self.server.pages, [])
+        self.check()
+
+    def test_sync_resumes_after_interrupted_write(self):
+        # файл дописан до 5 января, индекс обновить не успели, последняя строка оборвана
+        with open(self.path + '.csv', 'a', encoding='utf-8') as f:
+            for day in range(1, 6):
+                f.write('2001-01-{0:02};{0};1;1000;3;0\n'.format(day))
+            f.write('2001-01-06;6;')
+        self.sync()
+        self.check()
+        self.assertEqual(self.server.pages[0], ('27001', dt.date(2001, 1, 6)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from Library.querycache import QueryCache, result_size
+
+
+def frame(rows):
+    dates = pd.date_range('2000-01-01', periods=rows, name='date')
+    return pd.DataFrame({'tempMax': np.zeros(rows, dtype=np.float32),
+                         'tempMin': np.zeros(rows, dtype=np.float32)}, index=dates)
+
+
+class QueryCacheTest(unittest.TestCase):
+    def test_slice_is_charged_for_the_whole_frame(self):
+        whole = frame(1000)
+        self.assertGreaterEqual(result_size({'Город': whole.iloc[:10]}), 2 * 4 * 1000)
+
+    def test_bytes_limit(self):
+        size = result_size(frame(100))
+        cache = QueryCache(maxsize=32, maxbytes=3 * size)
+        for key in range(10):
+            cache.get(key, lambda: frame(100))
+        self.assertEqual(list(cache.entries), [7, 8, 9])
+        self.assertLessEqual(cache.nbytes(), 3 * size)
+        cache.get('big', lambda: frame(1000))
+        self.assertNotIn('big', cache.entries)
+
+
+if __name__ == '__main__':
+    unittest.main()
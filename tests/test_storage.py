@@ -0,0 +1,83 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from Library.storage import STORAGES, VALUE_COLUMNS, VALUE_DTYPE, ChunkedStorage, NpyStorage, convert, get_storage
+
+
+def city_frame(days=800):
+    """
+    Датафрейм города за days дней начиная с 2000 года
+    """
+    dates = pd.date_range('2000-01-01', periods=days, name='date')
+    return pd.DataFrame({column: np.arange(days, dtype=np.float32) + i for i, column in enumerate(VALUE_COLUMNS)},
+                        index=dates)
+
+
+def mapped_file(column):
+    """
+    Возвращает файл, отображением которого является столбец, или None, если столбец скопирован в память
+    """
+    array = column.to_numpy()
+    while isinstance(array.base, np.ndarray) and not isinstance(array, np.memmap):
+        array = array.base
+    return array.filename if isinstance(array, np.memmap) and np.shares_memory(array, column.to_numpy()) else None
+
+
+class StorageTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, '001')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        frame = city_frame()
+        frame.iloc[3, 1] = np.nan
+        for name in STORAGES:
+            with self.subTest(format=name):
+                if name in ('parquet', 'feather') and importlib.util.find_spec('pyarrow') is None:
+                    self.skipTest('pyarrow не установлен')
+                storage = get_storage(name)
+                storage.write(self.path, frame)
+                result = storage.read(self.path)
+                # разрешение дат в индексе зависит от формата (секунды, микросекунды), сами даты совпадают
+                pd.testing.assert_frame_equal(result, frame, check_freq=False, check_index_type=False)
+                self.assertTrue((result.dtypes == VALUE_DTYPE).all())
+
+    def test_convert_migrates_legacy_csv(self):
+        with open(self.path + '.csv', 'w', encoding='utf-8') as f:
+            f.write('date;tempMax;tempMin;press;wind;falls\n2000-01-01;1;-200;1000;;0\n2000-01-02;2;-1;x;3;0\n')
+        route = os.path.join(self.directory, 'index.csv')
+        with open(route, 'w', encoding='utf-8') as f:
+            f.write('ID;city;minDate;maxDate\n1;Город;2000-01-01;2000-01-02\n')
+        convert(route, 'npy')
+        self.assertEqual(sorted(os.listdir(self.directory)), ['001', 'index.csv'])
+        frame = NpyStorage().read(self.path)
+        self.assertEqual(frame['tempMax'].tolist(), [1, 2])
+        self.assertTrue(np.isnan(frame['tempMin'].iloc[0]))
+        self.assertTrue(np.isnan(frame['press'].iloc[1]))
+        self.assertTrue(np.isnan(frame['wind'].iloc[0]))
+        self.assertIn('npy', open(route, encoding='utf-8').read())
+
+    def test_npy_columns_stay_mapped(self):
+        NpyStorage().write(self.path, city_frame())
+        frame = NpyStorage().read(self.path)
+        for column in VALUE_COLUMNS:
+            self.assertEqual(mapped_file(frame[column]), os.path.join(self.path, column + '.npy'))
+
+    def test_chunk_year_stays_mapped(self):
+        ChunkedStorage().write(self.path, city_frame())
+        frame = ChunkedStorage().read_year(self.path, 2001)
+        for column in VALUE_COLUMNS:
+            self.assertEqual(mapped_file(frame[column]), os.path.join(self.path + '.chunks', '2001.npy'))
+
+
+if __name__ == '__main__':
+    unittest.main()